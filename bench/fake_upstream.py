@@ -0,0 +1,147 @@
+import asyncio
+import json
+import random
+import time
+
+import tornado.web
+
+# 离线压测用的假上游：按插件真实接口的返回格式构造数据，延迟可调；/v1/chat/completions 模拟硅基流的 SSE 流式输出
+STATS = {
+    "music": 0,
+    "weather": 0,
+    "news": 0,
+    "bilibili": 0,
+    "chat": 0,
+}
+
+
+class _Delayed(tornado.web.RequestHandler):
+    def initialize(self, delay: float, jitter: float = 0.0):
+        self.delay = delay
+        self.jitter = jitter
+
+    async def pause(self):
+        delay = self.delay + random.uniform(0, self.jitter) if self.jitter else self.delay
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def reply(self, data: dict):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(data, ensure_ascii=False))
+
+
+class MusicHandler(_Delayed):
+    async def get(self):
+        STATS["music"] += 1
+        await self.pause()
+        n = random.randint(1, 10000)
+        self.reply({"code": 200, "data": {
+            "name": f"测试歌曲{n}",
+            "singer": "压测歌手",
+            "url": f"https://example.invalid/music/{n}.mp3",
+            "image": f"https://example.invalid/music/{n}.jpg",
+        }})
+
+
+class WeatherHandler(_Delayed):
+    async def get(self):
+        STATS["weather"] += 1
+        await self.pause()
+        city = self.get_argument("city", "")
+        today = time.strftime("%Y-%m-%d")
+        self.reply({"code": 200, "msg": "数据请求成功", "data": {"city": city, "data": [{
+            "date": today,
+            "day": "星期一",
+            "weather_from": "晴",
+            "low_temp": 12,
+            "high_temp": 24,
+            "wind_from": "东北风",
+            "wind_level_from": "3级",
+            "real_time_weather": [{"temperature": 20, "description": "晴", "humidity": "40%"}],
+        }]}})
+
+
+class NewsHandler(_Delayed):
+    async def get(self):
+        STATS["news"] += 1
+        await self.pause()
+        self.reply({"code": 200, "data": [
+            {"title": f"压测新闻 {i}", "url": f"https://example.invalid/news/{i}"} for i in range(10)
+        ]})
+
+
+class BilibiliHandler(_Delayed):
+    async def get(self):
+        STATS["bilibili"] += 1
+        await self.pause()
+        url = self.get_argument("url", "")
+        self.reply({
+            "code": 1,
+            "title": "压测视频",
+            "desc": url,
+            "imgurl": "https://example.invalid/cover.jpg",
+            "data": [{"video_url": "https://example.invalid/video.mp4"}],
+        })
+
+
+class ChatCompletionsHandler(_Delayed):
+    def initialize(self, delay: float, jitter: float = 0.0, tokens: int = 50, token_delay: float = 0.01):
+        super().initialize(delay, jitter)
+        self.tokens = tokens
+        self.token_delay = token_delay
+
+    async def post(self):
+        STATS["chat"] += 1
+        await self.pause()
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        for i in range(self.tokens):
+            chunk = {"choices": [{"index": 0, "delta": {"content": f"字{i} "}}]}
+            self.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            await self.flush()
+            if self.token_delay > 0:
+                await asyncio.sleep(self.token_delay)
+        self.write("data: [DONE]\n\n")
+        self.finish()
+
+
+def make_app(delay: float = 0.05, jitter: float = 0.0, tokens: int = 50, token_delay: float = 0.01):
+    opts = {"delay": delay, "jitter": jitter}
+    return tornado.web.Application([
+        (r"/music", MusicHandler, opts),
+        (r"/weather", WeatherHandler, opts),
+        (r"/news", NewsHandler, opts),
+        (r"/bilibili", BilibiliHandler, opts),
+        (r"/v1/chat/completions", ChatCompletionsHandler, dict(opts, tokens=tokens, token_delay=token_delay)),
+    ])
+
+
+def plugin_config(base: str) -> dict:
+    # 写入压测用 config.json：插件与 AI 都指向假上游
+    return {
+        "siliconflow_api_key": "bench",
+        "siliconflow_base_url": f"{base}/v1/",
+        "plugins": {
+            "music": {"url": f"{base}/music"},
+            "weather": {"url": f"{base}/weather", "api_key": "bench"},
+            "news": {"url": f"{base}/news"},
+            "bilibili": {"url": f"{base}/bilibili"},
+        },
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import tornado.ioloop
+
+    parser = argparse.ArgumentParser(description="ZZ聊天室 压测用假上游")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--delay-ms", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay-ms", type=float, default=10)
+    args = parser.parse_args()
+    make_app(args.delay_ms / 1000, tokens=args.tokens, token_delay=args.token_delay_ms / 1000).listen(args.port)
+    print(f"假上游已启动: http://127.0.0.1:{args.port}/  config.json 片段:")
+    print(json.dumps(plugin_config(f"http://127.0.0.1:{args.port}"), ensure_ascii=False, indent=2))
+    tornado.ioloop.IOLoop.current().start()
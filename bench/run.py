@@ -0,0 +1,467 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import tornado.httpclient
+import tornado.httpserver
+import tornado.netutil
+import tornado.websocket
+
+import fake_upstream
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.normpath(os.path.join(HERE, "..", "server"))
+
+# 对比两次结果时关注的指标：(路径, 越小越好)
+COMPARE_KEYS = [
+    (("chat", "latency_ms", "p50"), True),
+    (("chat", "latency_ms", "p99"), True),
+    (("chat", "deliveries_per_sec"), False),
+    (("chat", "loss"), True),
+    (("db", "rows_per_sec"), False),
+    (("rss_mb", "peak"), True),
+    (("loop_lag_ms", "p99"), True),
+    (("plugin", "latency_ms", "p50"), True),
+    (("plugin", "latency_ms", "p99"), True),
+    (("ai", "ttfb_ms", "p50"), True),
+    (("ai", "ttfb_ms", "p99"), True),
+    (("ai", "total_ms", "p50"), True),
+]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(p / 100 * (len(values) - 1) + 0.5))], 3)
+
+    return {"count": len(values), "p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(values[-1], 3)}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # 非 Linux 只能取到峰值
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def raise_nofile(needed: int):
+    # 每个模拟客户端在本进程里占两个文件描述符（客户端一端 + 服务端一端）
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = needed if hard == resource.RLIM_INFINITY else min(hard, needed)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def lookup(data: dict, path: tuple):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def compare(old: dict, new: dict):
+    print(f"\n对比 {old.get('commit') or '?'} -> {new.get('commit') or '?'}")
+    for path, lower_better in COMPARE_KEYS:
+        a, b = lookup(old, path), lookup(new, path)
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+            continue
+        change = (b - a) / a * 100 if a else 0.0
+        better = (change < 0) == lower_better if change else None
+        mark = "" if better is None else (" 更好" if better else " 更差")
+        print(f"  {'.'.join(path):<28} {a:>12.3f} -> {b:>12.3f}  ({change:+.1f}%){mark}")
+
+
+class Client:
+    __slots__ = ("bench", "conn", "room", "nick")
+
+    def __init__(self, bench, room: str, nick: str):
+        self.bench = bench
+        self.conn = None
+        self.room = room
+        self.nick = nick
+
+    def on_message(self, msg):
+        self.bench.on_frame(self, msg)
+
+
+class Bench:
+    def __init__(self, args, app_module, port: int):
+        self.args = args
+        self.app = app_module
+        self.port = port
+        self.clients = []
+        self.room_sizes = {}
+        self.sent = {}
+        self.latencies = []
+        self.expected = 0
+        self.delivered = 0
+        self.closed = 0
+        self.plugin_pending = {}
+        self.plugin_latencies = []
+        self.rss = []
+        self.lag = []
+        self._sampling = True
+
+    def on_frame(self, client: Client, msg):
+        if msg is None:
+            self.closed += 1
+            return
+        if isinstance(msg, bytes):
+            msg = msg.decode("utf-8")
+        # 先做字符串判断，只解析压测关心的帧，减少客户端一侧占用的 CPU
+        if '"bench:' in msg:
+            now = time.perf_counter()
+            frame = json.loads(msg)
+            content = frame.get("content")
+            if frame.get("type") == "message" and isinstance(content, str) and content.startswith("bench:"):
+                sent_at = self.sent.get(int(content[6:]))
+                if sent_at is not None:
+                    self.latencies.append((now - sent_at) * 1000)
+                    self.delivered += 1
+        elif '"weather_card"' in msg and self.plugin_pending:
+            now = time.perf_counter()
+            frame = json.loads(msg)
+            city = (frame.get("content") or {}).get("city")
+            sent_at = self.plugin_pending.pop(city, None)
+            if sent_at is not None:
+                self.plugin_latencies.append((now - sent_at) * 1000)
+
+    async def sample(self):
+        # 同时记录 RSS 和事件循环延迟（客户端与服务端共用同一个事件循环）
+        loop = asyncio.get_running_loop()
+        while self._sampling:
+            self.rss.append(rss_mb())
+            start = loop.time()
+            await asyncio.sleep(0.1)
+            self.lag.append(max(0.0, loop.time() - start - 0.1) * 1000)
+
+    async def connect_all(self) -> dict:
+        args = self.args
+        sem = asyncio.Semaphore(args.connect_concurrency)
+        times = []
+        errors = 0
+
+        async def connect(i: int):
+            nonlocal errors
+            room = f"bench-{i % args.rooms}"
+            client = Client(self, room, f"u{i}")
+            url = f"ws://127.0.0.1:{self.port}/ws?" + urlencode({"room": room, "nick": client.nick})
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    client.conn = await tornado.websocket.websocket_connect(
+                        url, on_message_callback=client.on_message, max_message_size=64 * 1024 * 1024)
+                except Exception as e:
+                    errors += 1
+                    if errors <= 3:
+                        print(f"连接失败: {e}")
+                    return
+                times.append((time.perf_counter() - start) * 1000)
+            self.clients.append(client)
+            self.room_sizes[room] = self.room_sizes.get(room, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connect(i) for i in range(args.clients)))
+        elapsed = time.perf_counter() - start
+        # 等在线名单的合并帧发完，避免计入聊天阶段
+        await asyncio.sleep(self.app.PRESENCE.interval + 0.5)
+        return {
+            "connected": len(self.clients),
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "per_sec": round(len(self.clients) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": percentiles(times),
+        }
+
+    def senders(self) -> list[Client]:
+        # 发送者按房间轮流挑选，保证每个房间都有人发言
+        by_room = {}
+        for client in self.clients:
+            by_room.setdefault(client.room, []).append(client)
+        rooms = list(by_room.values())
+        result = []
+        i = 0
+        while len(result) < min(self.args.senders, len(self.clients)):
+            members = rooms[i % len(rooms)]
+            index = i // len(rooms)
+            if index < len(members):
+                result.append(members[index])
+            i += 1
+        return result
+
+    async def pace(self, count: int, rate: float, send):
+        loop = asyncio.get_running_loop()
+        interval = 1 / rate if rate > 0 else 0
+        next_at = loop.time()
+        for k in range(count):
+            send(k)
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+    async def wait_for(self, done, timeout: float):
+        deadline = time.perf_counter() + timeout
+        while not done() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def run_chat(self) -> tuple[dict, dict]:
+        args = self.args
+        senders = self.senders()
+        writer = self.app.WRITER
+        written_before = writer.stats["written"]
+        batches_before = writer.stats["batches"]
+        flush_ms_before = writer.stats["total_flush_ms"]
+        total = int(args.rate * args.duration)
+
+        def send(k: int):
+            client = senders[k % len(senders)]
+            self.sent[k] = time.perf_counter()
+            self.expected += self.room_sizes[client.room]
+            client.conn.write_message(json.dumps({"content": f"bench:{k}"}))
+
+        start = time.perf_counter()
+        await self.pace(total, args.rate, send)
+        send_elapsed = time.perf_counter() - start
+        await self.wait_for(lambda: self.delivered >= self.expected, args.drain)
+        elapsed = time.perf_counter() - start
+        # 写线程攒批落盘，等队列清空后再统计写入速率
+        await self.wait_for(lambda: writer.queue_depth == 0 and writer.stats["written"] - written_before >= total, args.drain)
+        db_elapsed = time.perf_counter() - start
+        written = writer.stats["written"] - written_before
+        batches = writer.stats["batches"] - batches_before
+        chat = {
+            "senders": len(senders),
+            "sent": total,
+            "send_rate": round(total / send_elapsed, 1) if send_elapsed else 0.0,
+            "expected": self.expected,
+            "delivered": self.delivered,
+            "loss": self.expected - self.delivered,
+            "deliveries_per_sec": round(self.delivered / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": percentiles(self.latencies),
+        }
+        db_stats = {
+            "rows": written,
+            "rows_per_sec": round(written / db_elapsed, 1) if db_elapsed else 0.0,
+            "batches": batches,
+            "avg_batch": round(written / batches, 1) if batches else 0.0,
+            "avg_flush_ms": round((writer.stats["total_flush_ms"] - flush_ms_before) / batches, 3) if batches else 0.0,
+            "errors": writer.stats["errors"],
+        }
+        return chat, db_stats
+
+    async def run_plugin(self) -> dict:
+        args = self.args
+        senders = self.senders()
+        scheduler = self.app.SCHEDULER
+        before = dict(scheduler.stats)
+
+        def send(k: int):
+            # 每次换一个城市，绕过插件缓存，每个请求都会访问假上游
+            city = f"压测城市{k}"
+            self.plugin_pending[city] = time.perf_counter()
+            senders[k % len(senders)].conn.write_message(json.dumps({"content": f"⛅天气 {city}"}))
+
+        await self.pace(args.plugin_requests, args.plugin_rate, send)
+        await self.wait_for(lambda: not self.plugin_pending, args.drain + 10)
+        after = scheduler.stats
+        return {
+            "requests": args.plugin_requests,
+            "answered": len(self.plugin_latencies),
+            "latency_ms": percentiles(self.plugin_latencies),
+            "tasks": {key: after[key] - before.get(key, 0) for key, value in after.items()
+                      if key != "running" and isinstance(value, (int, float))},
+        }
+
+    async def run_ai(self) -> dict:
+        args = self.args
+        client = tornado.httpclient.AsyncHTTPClient(force_instance=True, max_clients=args.ai_concurrency)
+        sem = asyncio.Semaphore(args.ai_concurrency)
+        ttfb = []
+        totals = []
+        errors = 0
+
+        async def one(i: int):
+            nonlocal errors
+            first = None
+            start = time.perf_counter()
+
+            def on_chunk(chunk: bytes):
+                nonlocal first
+                if first is None and b"data:" in chunk:
+                    first = time.perf_counter()
+
+            url = f"http://127.0.0.1:{self.port}/ai?" + urlencode({"prompt": f"压测问题 {i}"})
+            async with sem:
+                try:
+                    await client.fetch(url, streaming_callback=on_chunk, request_timeout=120)
+                except Exception as e:
+                    errors += 1
+                    if errors <= 3:
+                        print(f"/ai 请求失败: {e}")
+                    return
+            if first is not None:
+                ttfb.append((first - start) * 1000)
+            totals.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(one(i) for i in range(args.ai_requests)))
+        client.close()
+        return {
+            "requests": args.ai_requests,
+            "errors": errors,
+            "ttfb_ms": percentiles(ttfb),
+            "total_ms": percentiles(totals),
+        }
+
+    async def close_all(self):
+        for client in self.clients:
+            if client.conn is not None:
+                client.conn.close()
+        await self.wait_for(lambda: not any(obj["clients"] for obj in self.app.ROOMS.values()), 10)
+
+
+def print_report(result: dict):
+    def fmt(p):
+        if not p.get("count"):
+            return "无数据"
+        return f"p50 {p['p50']:.2f}  p90 {p['p90']:.2f}  p99 {p['p99']:.2f}  max {p['max']:.2f}  (n={p['count']})"
+
+    params = result["params"]
+    print(f"\n== ZZ聊天室 压测结果 ({result['commit'] or '未知提交'}) ==")
+    print(f"客户端 {params['clients']}  房间 {params['rooms']}  发送者 {params['senders']}  目标速率 {params['rate']}/s  时长 {params['duration']}s")
+    c = result["connect"]
+    print(f"连接: {c['connected']} 个, 失败 {c['errors']}, 用时 {c['seconds']}s ({c['per_sec']}/s); 握手延迟(ms) {fmt(c['latency_ms'])}")
+    chat = result["chat"]
+    print(f"广播: 发送 {chat['sent']} 条 ({chat['send_rate']}/s), 应投递 {chat['expected']}, 实投递 {chat['delivered']}, 丢失 {chat['loss']}")
+    print(f"  投递吞吐 {chat['deliveries_per_sec']}/s; 端到端延迟(ms) {fmt(chat['latency_ms'])}")
+    d = result["db"]
+    print(f"SQLite: 写入 {d['rows']} 行, {d['rows_per_sec']} 行/s, {d['batches']} 批 (平均 {d['avg_batch']} 行/批, {d['avg_flush_ms']} ms/批), 错误 {d['errors']}")
+    r = result["rss_mb"]
+    print(f"RSS(MB): 启动 {r['start']:.1f}  峰值 {r['peak']:.1f}  结束 {r['end']:.1f}")
+    print(f"事件循环延迟(ms): {fmt(result['loop_lag_ms'])}")
+    if "plugin" in result:
+        p = result["plugin"]
+        print(f"插件(天气): {p['requests']} 次, 收到 {p['answered']} 张卡片; 延迟(ms) {fmt(p['latency_ms'])}; 任务 {p['tasks']}")
+    if "ai" in result:
+        a = result["ai"]
+        print(f"/ai: {a['requests']} 次, 失败 {a['errors']}; 首字节(ms) {fmt(a['ttfb_ms'])}")
+        print(f"  完整响应(ms) {fmt(a['total_ms'])}")
+
+
+async def main(args, app_module, upstream_sockets: list) -> dict:
+    upstream = tornado.httpserver.HTTPServer(fake_upstream.make_app(
+        args.upstream_delay_ms / 1000, tokens=args.ai_tokens, token_delay=args.ai_token_delay_ms / 1000))
+    upstream.add_sockets(upstream_sockets)
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1", backlog=args.connect_concurrency * 4)
+    port = sockets[0].getsockname()[1]
+    server = tornado.httpserver.HTTPServer(app_module.make_app(debug=False))
+    server.add_sockets(sockets)
+
+    bench = Bench(args, app_module, port)
+    sampler = asyncio.ensure_future(bench.sample())
+    result = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "params": vars(args),
+    }
+    start_rss = rss_mb()
+    result["connect"] = await bench.connect_all()
+    result["chat"], result["db"] = await bench.run_chat()
+    if args.plugin_requests > 0:
+        result["plugin"] = await bench.run_plugin()
+    if args.ai_requests > 0:
+        result["ai"] = await bench.run_ai()
+    result["server"] = {
+        "fanout": dict(app_module.fanout_module.STATS),
+        "upstream": {name: pool.snapshot() for name, pool in app_module.POOLS.items()},
+        "fake_upstream": dict(fake_upstream.STATS),
+    }
+    await bench.close_all()
+    bench._sampling = False
+    await sampler
+    result["rss_mb"] = {"start": round(start_rss, 1), "peak": round(max(bench.rss, default=start_rss), 1), "end": round(rss_mb(), 1)}
+    result["loop_lag_ms"] = percentiles(bench.lag)
+    server.stop()
+    upstream.stop()
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ZZ聊天室 WebSocket 压测：进程内启动服务与假上游，使用临时数据库")
+    parser.add_argument("--clients", type=int, default=2000, help="模拟 WebSocket 客户端数")
+    parser.add_argument("--rooms", type=int, default=10, help="房间数，客户端平均分配")
+    parser.add_argument("--senders", type=int, default=100, help="发言的客户端数")
+    parser.add_argument("--rate", type=float, default=100, help="所有发送者合计每秒消息数")
+    parser.add_argument("--duration", type=float, default=10, help="聊天阶段时长（秒）")
+    parser.add_argument("--drain", type=float, default=10, help="发送结束后等待投递完成的最长时间（秒）")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="同时进行的握手数")
+    parser.add_argument("--plugin-requests", type=int, default=50, help="天气插件请求数，0 跳过")
+    parser.add_argument("--plugin-rate", type=float, default=20, help="天气插件每秒请求数")
+    parser.add_argument("--ai-requests", type=int, default=20, help="/ai 请求数，0 跳过")
+    parser.add_argument("--ai-concurrency", type=int, default=10, help="/ai 并发数")
+    parser.add_argument("--ai-tokens", type=int, default=50, help="假上游每次流式输出的 token 数")
+    parser.add_argument("--ai-token-delay-ms", type=float, default=10, help="假上游 token 间隔（毫秒）")
+    parser.add_argument("--upstream-delay-ms", type=float, default=50, help="假上游响应延迟（毫秒）")
+    parser.add_argument("--rate-limits", action="store_true", help="保留发送限速（默认关闭，以免限速掩盖吞吐）")
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    raise_nofile(args.clients * 2 + 512)
+    workdir = tempfile.mkdtemp(prefix="zzchat-bench-")
+    upstream_sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+    upstream_base = f"http://127.0.0.1:{upstream_sockets[0].getsockname()[1]}"
+    # 服务端模块在导入时加载配置，必须先写好指向假上游的 config.json 再导入
+    config = fake_upstream.plugin_config(upstream_base)
+    if not args.rate_limits:
+        config["ratelimit"] = {"connection": "0", "nick": "0", "plugin": "0"}
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+    os.environ["ZZCHAT_CONFIG"] = config_path
+    for name in ("SILICONFLOW_API_KEY", "SILICONFLOW_BASE_URL"):
+        os.environ.pop(name, None)
+    sys.path.insert(0, SERVER_DIR)
+    import app as app_module
+    import db
+
+    db.init_db(os.path.join(workdir, "bench.db"))
+    result = asyncio.run(main(args, app_module, upstream_sockets))
+    app_module.WRITER.close()
+    result["db"]["file_mb"] = round(os.path.getsize(os.path.join(workdir, "bench.db")) / (1024 * 1024), 2)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), result)
+    print(f"临时目录: {workdir}")
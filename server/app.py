@@ -1,32 +1,288 @@
+import asyncio
 import json
 import os
+import signal
 import sys
 import time
-from urllib.parse import urlencode
+import uuid
+import zlib
+from urllib.parse import quote, urlencode
 
+import tornado.httpserver
 import tornado.ioloop
+import tornado.iostream
+import tornado.netutil
+import tornado.process
+import tornado.template
 import tornado.web
 import tornado.websocket
 import tornado.httpclient
 import tornado.escape
-from db import init_db, create_user, verify_user, save_message, fetch_history, clear_history
-from plugins.music import handle_music as plugin_handle_music
-from plugins.weather import handle_weather as plugin_handle_weather
-from plugins.movie import handle_movie as plugin_handle_movie
-from plugins.bilibili import handle_bilibili as plugin_handle_bilibili
-from plugins.news import handle_news as plugin_handle_news
-from plugins.ai import build_system_prompt
+from db import init_db
+import storage
+import auth
+import backup
+import wire
+from writer import MessageWriter
+from fanout import fanout
+from pubsub import create_pubsub
+from tasks import PluginScheduler
+from upstream import AI_HTTP, POOLS
+from settings import CONFIG
+from retention import Archive, RetentionManager
+from presence import Presence
+from ratelimit import KeyedLimiter, TokenBucket, parse_rate
+from assets import AssetHandler, precompress
+from rooms import RoomLimitError, RoomManager
+import assets
+from metrics import AI_TTFB_SECONDS, MESSAGES, CallbackMetric, LoopLagMonitor
+import metrics
+import fanout as fanout_module
+from plugins.cache import PLUGIN_CACHE
+import plugins
+from plugins.ai import build_system_prompt, SSEDeltaParser
 
 
-ROOMS = {}
+# 默认生产模式：编译后的模板常驻内存、静态资源长期缓存；开发时设 ZZCHAT_DEBUG=1 打开 autoreload
+DEBUG = os.environ.get("ZZCHAT_DEBUG", "0") in ("1", "true", "yes")
+RECENT_SIZE = int(os.environ.get("ZZCHAT_RECENT_SIZE", "200"))
+BACKLOG_SIZE = min(int(os.environ.get("ZZCHAT_BACKLOG_SIZE", "50")), RECENT_SIZE)
+REPLAY_MAX = int(os.environ.get("ZZCHAT_REPLAY_MAX", "500"))
+ROOMS = RoomManager(
+    RECENT_SIZE,
+    max_rooms=int(os.environ.get("ZZCHAT_MAX_ROOMS", "10000")),
+    max_clients=int(os.environ.get("ZZCHAT_ROOM_MAX_CLIENTS", "10000")),
+    idle_grace=float(os.environ.get("ZZCHAT_ROOM_IDLE_SECONDS", "60")),
+    pending_rooms=lambda: WRITER.pending_rooms(),
+)
+WS_MAX_PENDING = int(os.environ.get("ZZCHAT_WS_MAX_PENDING", str(1024 * 1024)))
+# 服务端定期 ping，超时未收到 pong 的连接（半开的移动端连接等）会被关闭；0 表示不 ping
+WS_PING_INTERVAL = float(os.environ.get("ZZCHAT_WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = min(float(os.environ.get("ZZCHAT_WS_PING_TIMEOUT", "10")), WS_PING_INTERVAL)
+WS_MAX_MESSAGE_SIZE = int(os.environ.get("ZZCHAT_WS_MAX_MESSAGE_KB", "64")) * 1024
+WS_STATS = {
+    "opened": 0,
+    "closed": 0,
+    "reaped_ping": 0,
+    "warm_failed": 0,
+}
+EXPORT_BATCH = int(os.environ.get("ZZCHAT_EXPORT_BATCH", "2000"))
+IMPORT_BATCH = int(os.environ.get("ZZCHAT_IMPORT_BATCH", "5000"))
+# 导入接口没有鉴权，默认关闭，只在需要恢复备份时临时开启
+IMPORT_ENABLED = os.environ.get("ZZCHAT_IMPORT_ENABLED", "0") in ("1", "true", "yes")
+IMPORT_MAX_BYTES = int(os.environ.get("ZZCHAT_IMPORT_MAX_MB", "64")) * 1024 * 1024
+WS_MSGPACK = os.environ.get("ZZCHAT_WS_MSGPACK", "1") not in ("0", "false", "no")
+WS_DEFLATE_ROOMS = set(filter(None, os.environ.get("ZZCHAT_WS_DEFLATE_ROOMS", "").split(",")))
+PUBSUB = create_pubsub(os.environ.get("ZZCHAT_PUBSUB", ""))
+SCHEDULER = PluginScheduler()
 
 
-def get_room(room_id: str):
-    if room_id not in ROOMS:
-        ROOMS[room_id] = {
-            "clients": set(),
-        }
-    return ROOMS[room_id]
+def apply_plugin_settings(config):
+    # config.json 的 plugins.<name> 可覆盖注册表里的超时、并发和缓存时长，配置重载后立即生效
+    for plugin in plugins.all_plugins():
+        overrides = config.plugin_settings(plugin.name)
+        for key in ("timeout", "concurrency", "cache_ttl", "stale_ttl"):
+            if key in overrides:
+                setattr(plugin, key, overrides[key])
+        SCHEDULER.configure(plugin.name, timeout=plugin.timeout, concurrency=plugin.concurrency)
+
+
+RATE = {}
+RATE_STATS = {
+    "allowed": 0,
+    "delayed": 0,
+    "dropped_connection": 0,
+    "dropped_nick": 0,
+    "dropped_plugin": 0,
+}
+
+
+def apply_rate_settings(config):
+    # 令牌桶限速：每个连接、每个昵称（跨标签页）、每个昵称对每个插件；config.json 的 ratelimit 段优先于环境变量
+    section = config.section("ratelimit")
+    RATE["connection"] = parse_rate(section.get("connection"), os.environ.get("ZZCHAT_RATE_CONN", "5/10"))
+    RATE["nick"] = KeyedLimiter(*parse_rate(section.get("nick"), os.environ.get("ZZCHAT_RATE_NICK", "8/16")))
+    default_plugin = section.get("plugin") or os.environ.get("ZZCHAT_RATE_PLUGIN", "0.2/3")
+    overrides = section.get("plugins") if isinstance(section.get("plugins"), dict) else {}
+    RATE["plugins"] = {
+        plugin.name: KeyedLimiter(*parse_rate(overrides.get(plugin.name), default_plugin))
+        for plugin in plugins.all_plugins()
+    }
+    RATE["max_delay"] = float(section.get("max_delay_ms", os.environ.get("ZZCHAT_RATE_MAX_DELAY_MS", "500"))) / 1000
+
+
+CONFIG.add_listener(apply_plugin_settings)
+CONFIG.add_listener(apply_rate_settings)
+CONFIG.reload(force=True)
+AI_FLUSH_INTERVAL = float(os.environ.get("ZZCHAT_AI_FLUSH_MS", "30")) / 1000
+AI_FLUSH_CHARS = int(os.environ.get("ZZCHAT_AI_FLUSH_CHARS", "256"))
+AI_STATS = {
+    "requests": 0,
+    "completed": 0,
+    "aborted": 0,
+    "errors": 0,
+    "tokens": 0,
+    "last_ttft_ms": 0.0,
+    "total_ttft_ms": 0.0,
+    "last_tokens_per_sec": 0.0,
+}
+PLUGIN_ERRORS = {
+    "timeout": "{} 请求超时，请稍后再试",
+    "busy": "{} 请求过多，请稍后再试",
+    "error": "{} 服务暂时不可用",
+    "cancelled": "{} 请求已取消",
+}
+PRESENCE = Presence(
+    interval=float(os.environ.get("ZZCHAT_PRESENCE_INTERVAL_MS", "500")) / 1000,
+    heartbeat=float(os.environ.get("ZZCHAT_PRESENCE_HEARTBEAT", "30")),
+)
+RETENTION = RetentionManager(
+    interval=float(os.environ.get("ZZCHAT_RETENTION_INTERVAL", "600")),
+    chunk=int(os.environ.get("ZZCHAT_RETENTION_CHUNK", "500")),
+    pause=float(os.environ.get("ZZCHAT_RETENTION_PAUSE_MS", "20")) / 1000,
+)
+LOOP_LAG = LoopLagMonitor(float(os.environ.get("ZZCHAT_LOOP_LAG_MS", "500")) / 1000)
+WRITER = MessageWriter(
+    batch_size=int(os.environ.get("ZZCHAT_WRITE_BATCH", "200")),
+    flush_interval=float(os.environ.get("ZZCHAT_WRITE_INTERVAL_MS", "50")) / 1000,
+)
+
+
+async def _load_room(room_id: str):
+    items, _ = await storage.fetch_history_page(room_id, RECENT_SIZE)
+    return items, await storage.max_seq(room_id)
+
+
+async def warm_room(room_id: str, room_obj: dict) -> bool:
+    # 在读线程池里加载最近消息；同一房间并发的预热只查询一次。返回房间是否已预热（序号已从数据库接上）
+    if room_obj["warm"]:
+        return True
+    if room_obj["warming"] is None:
+        room_obj["warming"] = asyncio.ensure_future(_load_room(room_id))
+    warming = room_obj["warming"]
+    try:
+        items, max_seq = await asyncio.shield(warming)
+    except Exception:
+        if room_obj["warming"] is warming:
+            room_obj["warming"] = None
+        return room_obj["warm"]
+    if room_obj["warm"]:
+        return True
+    # 预热期间新广播的消息已在缓冲里，可能也已写入数据库，按内容去重后放到它们前面
+    recent = room_obj["recent"]
+    seen = {(item["ts"], item["sender"], item["content"]) for item in recent}
+    older = [item for item in items if (item["ts"], item["sender"], item["content"]) not in seen]
+    recent.extendleft(older[:recent.maxlen - len(recent)])
+    room_obj["seq"] = max(room_obj["seq"], max_seq)
+    room_obj["warm"] = True
+    room_obj["warming"] = None
+    return True
+
+
+def _to_item(room_id: str, payload: dict) -> dict:
+    content = payload.get("content", "")
+    if isinstance(content, (dict, list)):
+        content_text = json.dumps(content, ensure_ascii=False)
+    else:
+        content_text = str(content)
+    return {
+        "id": None,
+        "room": room_id,
+        "sender": str(payload.get("sender", "")),
+        "type": str(payload.get("type", "message")),
+        "content": content_text,
+        "ts": int(payload.get("ts", int(time.time() * 1000))),
+        "seq": payload.get("seq"),
+    }
+
+
+def publish_room(room_id: str, payload: dict, persist: bool = True):
+    # 房间只在有连接加入时创建；连接断开后才完成的插件/AI 回复可能遇到已回收的房间，照常持久化但不分配序号
+    room_obj = ROOMS.get(room_id)
+    # 房间内单调递增的序号随消息下发，客户端重连时据此只补发缺失的部分；
+    # 多进程/多节点时各进程无法分配全局一致的序号，不分配，断线续传随之关闭
+    if persist and room_obj is not None and not PUBSUB.remote:
+        room_obj["seq"] += 1
+        payload["seq"] = room_obj["seq"]
+    msg = json.dumps(payload, ensure_ascii=False)
+    if room_obj is not None:
+        fanout(room_obj["clients"], msg, WS_MAX_PENDING, payload)
+    MESSAGES.inc(1, "persisted" if persist else "transient")
+    if not persist:
+        PUBSUB.publish(room_id, msg)
+        return
+    try:
+        item = _to_item(room_id, payload)
+        if room_obj is not None:
+            room_obj["recent"].append(item)
+        WRITER.put(room_id, item["sender"], item["type"], item["content"], item["ts"], seq=item["seq"], item=item)
+    except Exception:
+        pass
+    PUBSUB.publish(room_id, msg)
+
+
+def send_presence(room_id: str, text: str):
+    room_obj = ROOMS.get(room_id)
+    if room_obj is not None:
+        fanout(room_obj["clients"], text, WS_MAX_PENDING)
+
+
+def deliver_remote(room_id: str, msg: str):
+    # 其它进程/节点发布的消息：只做本地投递和缓冲，持久化由发布方负责
+    payload = json.loads(msg)
+    if payload.get("type") == "presence_sync":
+        # 本进程还没有打开的房间也要记下远端名单，之后加入的连接和 /online 接口才能立即看到
+        PRESENCE.apply_remote(room_id, payload)
+        return
+    room_obj = ROOMS.get(room_id)
+    if room_obj is None:
+        return
+    fanout(room_obj["clients"], msg, WS_MAX_PENDING, payload)
+    MESSAGES.inc(1, "remote")
+    if room_obj["warm"] and payload.get("type") != "pending":
+        room_obj["recent"].append(_to_item(room_id, payload))
+
+
+async def replay_since(room_id: str, room_obj: dict, since: int) -> tuple[list[dict], bool]:
+    # 缺口在最近消息缓冲范围内时直接取缓冲，否则从数据库补，再接上缓冲中尚未落库的部分
+    recent = room_obj["recent"]
+    seqs = [item["seq"] for item in recent if item.get("seq") is not None]
+    if room_obj["warm"] and (len(recent) < recent.maxlen or (seqs and seqs[0] <= since + 1)):
+        return [dict(item) for item in recent if (item.get("seq") or 0) > since], False
+    items, truncated = await storage.fetch_since(room_id, since, REPLAY_MAX)
+    top = items[-1]["seq"] if items else since
+    items += [dict(item) for item in recent if (item.get("seq") or 0) > top]
+    return items, truncated
+
+
+def recent_page(room_obj: dict, limit: int, before_ts: int | None = None, before_id: int | None = None):
+    # 最近消息缓冲：能完整回答这一页时返回 (items, next_cursor)，否则返回 None 交给数据库
+    recent = room_obj["recent"]
+    if not room_obj["warm"]:
+        return None
+    complete = len(recent) < recent.maxlen
+    items = []
+    for item in reversed(recent):
+        if before_ts is not None:
+            # 还没有 id 的条目（本进程尚未落库，或其它进程投递来的）按最新处理；与游标同一毫秒时先后无法判断，交给数据库
+            if item["id"] is None and item["ts"] == before_ts:
+                return None
+            key = (item["ts"], item["id"] if item["id"] is not None else float("inf"))
+            if key >= (before_ts, before_id or 0):
+                continue
+        items.append(dict(item))
+        if len(items) == limit:
+            break
+    if len(items) < limit and not complete:
+        return None
+    next_cursor = None
+    if len(items) == limit:
+        last = items[-1]
+        if last["id"] is None:
+            # 游标必须是真实的 (ts, id)，否则交给数据库分页
+            return None
+        next_cursor = {"before_ts": last["ts"], "before_id": last["id"]}
+    return items, next_cursor
 
 
 class IndexHandler(tornado.web.RequestHandler):
@@ -40,9 +296,15 @@ class LoginPageHandler(tornado.web.RequestHandler):
 
 
 class ChatPageHandler(tornado.web.RequestHandler):
-    def get(self):
-        nick_cookie = self.get_secure_cookie("nick")
-        nick = self.get_argument("nick", None) or (nick_cookie.decode("utf-8") if nick_cookie else None)
+    async def get(self):
+        nick = self.get_argument("nick", None)
+        if not nick:
+            # 只凭 cookie 进入时确认账号仍然存在；用户记录有内存缓存，通常不访问数据库
+            nick_cookie = self.get_secure_cookie("nick")
+            nick = nick_cookie.decode("utf-8") if nick_cookie else None
+            if nick and await auth.get_user(nick) is None:
+                self.clear_cookie("nick")
+                nick = None
         server = self.get_argument("server", None)
         room = self.get_argument("room", "general")
         if not nick or not server:
@@ -53,82 +315,94 @@ class ChatPageHandler(tornado.web.RequestHandler):
 
 class ConfigHandler(tornado.web.RequestHandler):
     def get(self):
-        base_dir = get_base_dir()
-        exe_dir = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
-        candidates = [
-            os.path.join(exe_dir, "config", "config.json"),
-            os.path.join(exe_dir, "config.json"),
-            os.path.join(base_dir, "config", "config.json"),
-            os.path.join(os.path.dirname(__file__), "..", "config", "config.json"),
-        ]
-        config_path = None
-        for p in candidates:
-            if os.path.exists(p):
-                config_path = p
-                break
-        try:
-            if config_path:
-                with open(config_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            else:
-                raise FileNotFoundError()
-        except Exception:
-            data = {
-                "servers": [
-                    {
-                        "name": "当前访问域",
-                        "ws_url": f"{'wss' if self.request.protocol == 'https' else 'ws'}://{self.request.host}/ws",
-                    }
-                ]
-            }
-        else:
-            try:
-                dyn_url = f"{'wss' if self.request.protocol == 'https' else 'ws'}://{self.request.host}/ws"
-                servers = data.get("servers") or []
-                if not any(isinstance(s, dict) and s.get("ws_url") == dyn_url for s in servers):
-                    servers.insert(0, {"name": "当前访问域", "ws_url": dyn_url})
-                    data["servers"] = servers
-            except Exception:
-                pass
+        body, etag = CONFIG.config_response(self.request.protocol, self.request.host)
         self.set_header("Content-Type", "application/json; charset=utf-8")
-        self.finish(json.dumps(data, ensure_ascii=False))
+        self.set_header("Etag", etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
+        self.finish(body)
+
+
+def _int_arg(handler, name):
+    # 空值和前端序列化出的 null/undefined 都视为没有传
+    value = handler.get_argument(name, None)
+    return int(value) if value not in (None, "", "null", "undefined") else None
 
 
 class HistoryHandler(tornado.web.RequestHandler):
-    def get(self):
+    async def get(self):
         room = self.get_argument("room", "general")
-        limit = int(self.get_argument("limit", "50"))
-        before = self.get_argument("before_ts", None)
-        before_ts = int(before) if before else None
+        try:
+            limit = max(1, min(int(self.get_argument("limit", "50")), 200))
+            before_ts = _int_arg(self, "before_ts")
+            before_id = _int_arg(self, "before_id")
+            after_ts = _int_arg(self, "after_ts")
+            after_id = _int_arg(self, "after_id")
+        except ValueError:
+            raise tornado.web.HTTPError(400)
         order = self.get_argument("order", "desc").lower()
-        items = fetch_history(room, limit, before_ts)
-        if order == "desc":
-            items = sorted(items, key=lambda x: x.get("ts", 0), reverse=True)
+        page = None
+        room_obj = ROOMS.get(room)
+        if after_ts is None and room_obj is not None:
+            page = recent_page(room_obj, limit, before_ts, before_id)
+        if page is None:
+            page = await storage.fetch_history_page(room, limit, before_ts, before_id, after_ts, after_id)
+        items, next_cursor = page
+        if after_ts is None and len(items) < limit and RETENTION.archive is not None:
+            # 热表翻到底后，继续从归档分段里读更早的消息
+            cursor_ts, cursor_id = (items[-1]["ts"], items[-1]["id"]) if items else (before_ts, before_id)
+            items = items + await storage.run_read(RETENTION.archive.read_before, room, limit - len(items), cursor_ts, cursor_id)
+            next_cursor = {"before_ts": items[-1]["ts"], "before_id": items[-1]["id"]} if len(items) == limit else None
+        newest_first = after_ts is None
+        if (order == "desc") != newest_first:
+            items.reverse()
         self.set_header("Content-Type", "application/json; charset=utf-8")
-        self.finish(json.dumps({"items": items}, ensure_ascii=False))
+        self.finish(json.dumps({"items": items, "next_cursor": next_cursor}, ensure_ascii=False))
+
+class SearchHandler(tornado.web.RequestHandler):
+    async def get(self):
+        room = self.get_argument("room", "general")
+        q = self.get_argument("q", "").strip()
+        try:
+            limit = max(1, min(int(self.get_argument("limit", "20")), 100))
+            after_rank = self.get_argument("after_rank", None)
+            after_rank = float(after_rank) if after_rank not in (None, "") else None
+            after_id = _int_arg(self, "after_id")
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        if len(q) < 2:
+            self.set_status(400)
+            self.finish(json.dumps({"items": [], "next_cursor": None, "message": "关键词至少 2 个字"}, ensure_ascii=False))
+            return
+        items, next_cursor = await storage.search_messages(room, q, limit, after_rank, after_id)
+        self.finish(json.dumps({"items": items, "next_cursor": next_cursor}, ensure_ascii=False))
+
 
 class RegisterApiHandler(tornado.web.RequestHandler):
-    def post(self):
+    async def post(self):
         try:
             data = tornado.escape.json_decode(self.request.body or b"{}")
         except Exception:
             data = {}
         nick = str(data.get("nick", "")).strip()
         password = str(data.get("password", "")).strip()
-        ok, msg = create_user(nick, password)
+        ok, msg = await auth.register(nick, password)
         code = 0 if ok else 1
         self.set_header("Content-Type", "application/json; charset=utf-8")
         self.finish(json.dumps({"code": code, "message": msg}, ensure_ascii=False))
 
 class LoginApiHandler(tornado.web.RequestHandler):
-    def post(self):
+    async def post(self):
         try:
             data = tornado.escape.json_decode(self.request.body or b"{}")
         except Exception:
             data = {}
         nick = str(data.get("nick", "")).strip()
         password = str(data.get("password", "")).strip()
-        ok, msg = verify_user(nick, password)
+        ok, msg = await auth.login(nick, password)
         if ok:
             self.set_secure_cookie("nick", nick)
         code = 0 if ok else 1
@@ -136,14 +410,26 @@ class LoginApiHandler(tornado.web.RequestHandler):
         self.finish(json.dumps({"code": code, "message": msg}, ensure_ascii=False))
 
 class ClearHistoryHandler(tornado.web.RequestHandler):
-    def post(self):
+    async def post(self):
         try:
             data = tornado.escape.json_decode(self.request.body or b"{}")
         except Exception:
             data = {}
         room = str(data.get("room", "general")).strip() or "general"
         try:
-            clear_history(room)
+            WRITER.discard_room(room)
+            room_obj = ROOMS.get(room)
+            if room_obj is not None:
+                room_obj["recent"].clear()
+                if not room_obj["warm"]:
+                    # 清空前发起的预热结果已过期，直接视为已预热；序号不随清空回退，仍要从数据库接上
+                    room_obj["seq"] = max(room_obj["seq"], await storage.max_seq(room))
+                    room_obj["recent"].clear()
+                    room_obj["warm"] = True
+                    room_obj["warming"] = None
+            await storage.clear_history(room)
+            if RETENTION.archive is not None:
+                await storage.run_write(RETENTION.archive.remove_room, room)
             code, msg = 0, "已清空"
         except Exception as e:
             code, msg = 1, str(e)
@@ -151,33 +437,211 @@ class ClearHistoryHandler(tornado.web.RequestHandler):
         self.finish(json.dumps({"code": code, "message": msg}, ensure_ascii=False))
 
 
-class AIStreamHandler(tornado.web.RequestHandler):
-    async def get(self):
-        api_key = os.environ.get("SILICONFLOW_API_KEY")
-        
-        # 尝试从配置文件读取 API Key
-        if not api_key:
+def _reload_room(room: str, seq: int = 0):
+    # 导入的历史可能比缓冲里的消息更新，丢掉缓冲，下一个加入的连接从数据库重新预热；
+    # 保留了原序号时立即推进房间序号，重新预热前的广播也不会与导入的序号重复
+    room_obj = ROOMS.get(room)
+    if room_obj is not None:
+        room_obj["recent"].clear()
+        room_obj["warm"] = False
+        room_obj["warming"] = None
+        room_obj["seq"] = max(room_obj["seq"], seq)
+
+
+class ExportHandler(tornado.web.RequestHandler):
+    async def get(self, room):
+        # 先导出归档分段再导出数据库，整体按时间从旧到新；每批写出后等待发送完成，内存占用与房间大小无关
+        compress = self.get_argument("gzip", "0") in ("1", "true", "yes")
+        with_archive = self.get_argument("archive", "1") not in ("0", "false", "no")
+        filename = quote(room, safe="") + (".ndjson.gz" if compress else ".ndjson")
+        self.set_header("Content-Type", "application/gzip" if compress else "application/x-ndjson; charset=utf-8")
+        self.set_header("Content-Disposition", f"attachment; filename*=UTF-8''{filename}")
+        self.set_header("Cache-Control", "no-cache")
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        backup.STATS["exports"] += 1
+        archive = RETENTION.archive if with_archive else None
+        try:
+            if archive is not None:
+                for path in await storage.run_read(archive.segments, room):
+                    batches = archive.iter_segment(path, EXPORT_BATCH)
+                    try:
+                        while True:
+                            items = await storage.run_read(next, batches, None)
+                            if items is None:
+                                break
+                            await self.send_rows(items)
+                    finally:
+                        batches.close()
+            after = None
+            while True:
+                items = await storage.fetch_export(room, EXPORT_BATCH, after)
+                if not items:
+                    break
+                await self.send_rows(items)
+                after = (items[-1]["ts"], items[-1]["id"])
+            if self.compressor is not None:
+                self.write(self.compressor.flush())
+            await self.flush()
+        except tornado.iostream.StreamClosedError:
+            backup.STATS["exports_aborted"] += 1
+            return
+        self.finish()
+
+    async def send_rows(self, items: list[dict]):
+        data = b"".join(backup.encode_line(item) for item in items)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        backup.STATS["exported_rows"] += len(items)
+        if data:
+            self.write(data)
+            await self.flush()
+
+
+@tornado.web.stream_request_body
+class ImportHandler(tornado.web.RequestHandler):
+    # 请求体边收边解析，每攒够 IMPORT_BATCH 行写一个事务；写入期间暂停读取请求体
+    def prepare(self):
+        self.error = None
+        if not IMPORT_ENABLED:
+            self.error = "导入接口未开启（ZZCHAT_IMPORT_ENABLED=1）"
+            self.set_status(403)
+            self.set_header("Content-Type", "application/json; charset=utf-8")
+            self.finish(json.dumps({"code": 1, "message": self.error}, ensure_ascii=False))
+            return
+        self.request.connection.set_max_body_size(IMPORT_MAX_BYTES)
+        compressed = (self.request.headers.get("Content-Encoding", "").lower() == "gzip"
+                      or self.get_argument("gzip", "0") in ("1", "true", "yes"))
+        keep_seq = self.get_argument("keep_seq", "0") in ("1", "true", "yes")
+        self.decoder = backup.LineDecoder(compressed)
+        self.importer = backup.Importer(self.path_args[0], keep_seq, IMPORT_BATCH)
+        backup.STATS["imports"] += 1
+
+    async def data_received(self, chunk):
+        if self.error is not None:
+            return
+        try:
+            self.importer.add(self.decoder.feed(chunk))
+            await self.save()
+        except Exception as e:
+            self.error = str(e)
+
+    async def save(self, final: bool = False):
+        while (batch := self.importer.take(final)) is not None:
+            await storage.save_messages(batch)
+            self.importer.imported += len(batch)
+            backup.STATS["imported_rows"] += len(batch)
+
+    async def post(self, room):
+        if self.error is None:
             try:
-                base_dir = get_base_dir()
-                exe_dir = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
-                candidates = [
-                    os.path.join(exe_dir, "config", "config.json"),
-                    os.path.join(exe_dir, "config.json"),
-                    os.path.join(base_dir, "config", "config.json"),
-                    os.path.join(os.path.dirname(__file__), "..", "config", "config.json"),
-                ]
-                for p in candidates:
-                    if os.path.exists(p):
-                        with open(p, "r", encoding="utf-8") as f:
-                            data = json.load(f)
-                            api_key = data.get("siliconflow_api_key")
-                        if api_key:
-                            break
-            except Exception:
-                pass
+                self.importer.add(self.decoder.finish())
+                await self.save(final=True)
+            except Exception as e:
+                self.error = str(e)
+        backup.STATS["skipped_rows"] += self.importer.skipped
+        if self.importer.imported:
+            _reload_room(room, self.importer.top_seq.get(room, 0))
+        code, msg = (1, self.error) if self.error is not None else (0, "导入完成")
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps({"code": code, "message": msg, "imported": self.importer.imported,
+                                "skipped": self.importer.skipped}, ensure_ascii=False))
+
+
+class OnlineHandler(tornado.web.RequestHandler):
+    def get(self, room):
+        online = sorted(PRESENCE.online(room))
+        data = {"room": room, "count": len(online), "online": online, "connections": PRESENCE.connections(room)}
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.finish(json.dumps(data, ensure_ascii=False))
+
+
+def collect_stats() -> dict:
+    return {
+        "writer": dict(WRITER.stats, queue_depth=WRITER.queue_depth),
+        "fanout": dict(fanout_module.STATS),
+        "connections": dict(WS_STATS, open=sum(len(obj["clients"]) for obj in ROOMS.values())),
+        "pubsub": dict(PUBSUB.stats, backend=getattr(PUBSUB.backend, "stats", {})),
+        "plugin_cache": PLUGIN_CACHE.snapshot(),
+        "plugin_tasks": dict(SCHEDULER.stats),
+        "upstream": {name: pool.snapshot() for name, pool in POOLS.items()},
+        "ai": dict(AI_STATS),
+        "assets": dict(assets.STATS),
+        "auth": auth.snapshot(),
+        "backup": dict(backup.STATS),
+        "config": {"path": CONFIG.path, "version": CONFIG.version},
+        "retention": dict(RETENTION.stats),
+        "presence": PRESENCE.snapshot(),
+        "ratelimit": dict(RATE_STATS, nick_buckets=len(RATE["nick"])),
+        "rooms": ROOMS.snapshot(),
+    }
+
+
+def _flatten(data: dict, prefix: str = "") -> dict:
+    out = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            out.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            out[prefix + key] = value
+    return out
+
 
-        model = os.environ.get("SILICONFLOW_MODEL", "Qwen/Qwen2.5-7B-Instruct")
-        base_url = os.environ.get("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1/")
+# /api/stats 里已有的各模块计数器原样暴露为 zzchat_stats{section,key}，不在热路径上重复计数
+CallbackMetric("zzchat_room_sockets", "Connected WebSocket clients per room in this process",
+               lambda: {(room,): len(obj["clients"]) for room, obj in ROOMS.items()}, ("room",))
+CallbackMetric("zzchat_stats", "Module counters and gauges also shown in /api/stats",
+               lambda: {(section, key): value
+                        for section, values in collect_stats().items()
+                        for key, value in _flatten(values).items()},
+               ("section", "key"))
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def get(self):
+        data = collect_stats()
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.finish(json.dumps(data, ensure_ascii=False))
+
+
+class RoomsHandler(tornado.web.RequestHandler):
+    def get(self):
+        # 按连接数从多到少列出本进程的房间；memory_bytes 是最近消息缓冲等房间自身数据的估算值
+        try:
+            limit = int(self.get_argument("limit", "100"))
+        except ValueError:
+            limit = 100
+        rooms = sorted(ROOMS.listing(), key=lambda r: (-r["clients"], r["room"]))
+        items = rooms[:max(limit, 0)]
+        for item in items:
+            item["online"] = len(PRESENCE.online(item["room"]))
+        data = dict(ROOMS.snapshot(), memory_bytes=sum(r["memory_bytes"] for r in rooms), items=items)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.finish(json.dumps(data, ensure_ascii=False))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.finish(metrics.render())
+
+
+class AIStreamHandler(tornado.web.RequestHandler):
+    def initialize(self):
+        self._client_closed = False
+        self._pending = []
+        self._pending_chars = 0
+        self._flush_timer = None
+        self._flushing = False
+        self._upstream_request = None
+
+    async def get(self):
+        api_key = CONFIG.siliconflow_api_key()
+        model = CONFIG.siliconflow_model()
+        base_url = CONFIG.siliconflow_base_url()
         prompt = self.get_argument("prompt", "")
         if not api_key:
             self.set_header("Content-Type", "text/event-stream")
@@ -202,14 +666,24 @@ class AIStreamHandler(tornado.web.RequestHandler):
         }, ensure_ascii=False).encode("utf-8")
 
         url = base_url.rstrip("/") + "/chat/completions"
-        client = tornado.httpclient.AsyncHTTPClient()
+        parser = SSEDeltaParser()
+        started = time.perf_counter()
+        first_at = None
+        tokens = 0
+        AI_STATS["requests"] += 1
 
         def streamer(chunk: bytes):
-            try:
-                self.write(chunk.decode("utf-8", errors="ignore"))
-                tornado.ioloop.IOLoop.current().spawn_callback(self.flush)
-            except Exception:
-                pass
+            nonlocal first_at, tokens
+            if self._client_closed:
+                # 客户端已断开：关闭上游连接，不再为它继续生成
+                AI_HTTP.abort(req)
+                return
+            for delta in parser.feed(chunk):
+                if first_at is None:
+                    first_at = time.perf_counter()
+                    AI_TTFB_SECONDS.observe(first_at - started)
+                tokens += 1
+                self._queue_delta(delta)
 
         req = tornado.httpclient.HTTPRequest(
             url=url,
@@ -219,18 +693,95 @@ class AIStreamHandler(tornado.web.RequestHandler):
                 "Content-Type": "application/json",
             },
             body=body,
-            request_timeout=300,
             streaming_callback=streamer,
         )
+        self._upstream_request = req
         try:
-            await client.fetch(req)
+            await AI_HTTP.fetch(req)
+            for delta in parser.close():
+                tokens += 1
+                self._queue_delta(delta)
         except Exception as e:
+            if self._client_closed:
+                AI_STATS["aborted"] += 1
+                return
+            AI_STATS["errors"] += 1
+            self._write_pending()
             msg = str(e).replace("\n", " ")
+            # 失败的请求只计入 errors，不产生 stats 事件，也不影响完成数与速度统计
             self.write(f"event: error\ndata: {msg}\n\n")
-            await self.flush()
-        finally:
             self.write("data: [DONE]\n\n")
+            try:
+                await self.flush()
+            except tornado.iostream.StreamClosedError:
+                pass
+            return
+        finally:
+            if self._flush_timer is not None:
+                tornado.ioloop.IOLoop.current().remove_timeout(self._flush_timer)
+                self._flush_timer = None
+        if self._client_closed:
+            AI_STATS["aborted"] += 1
+            return
+        self._write_pending()
+        elapsed = time.perf_counter() - started
+        ttft_ms = (first_at - started) * 1000 if first_at is not None else None
+        rate = tokens / (elapsed - (first_at - started)) if first_at is not None and elapsed > first_at - started else 0.0
+        AI_STATS["completed"] += 1
+        AI_STATS["tokens"] += tokens
+        if ttft_ms is not None:
+            AI_STATS["last_ttft_ms"] = ttft_ms
+            AI_STATS["total_ttft_ms"] += ttft_ms
+        AI_STATS["last_tokens_per_sec"] = rate
+        stats = {"ttft_ms": ttft_ms, "tokens": tokens, "tokens_per_sec": round(rate, 2)}
+        self.write(f"event: stats\ndata: {json.dumps(stats)}\n\n")
+        self.write("data: [DONE]\n\n")
+        try:
             await self.flush()
+        except tornado.iostream.StreamClosedError:
+            pass
+
+    def on_connection_close(self):
+        self._client_closed = True
+        if self._upstream_request is not None:
+            AI_HTTP.abort(self._upstream_request)
+
+    def _queue_delta(self, text: str):
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= AI_FLUSH_CHARS:
+            self._kick_flush()
+        elif self._flush_timer is None and not self._flushing:
+            self._flush_timer = tornado.ioloop.IOLoop.current().call_later(AI_FLUSH_INTERVAL, self._kick_flush)
+
+    def _kick_flush(self):
+        if self._flush_timer is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        if not self._flushing:
+            self._flushing = True
+            tornado.ioloop.IOLoop.current().spawn_callback(self._drain)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
+        # 保持上游的 choices[].delta.content 结构，前端无需区分
+        event = {"choices": [{"delta": {"content": text}}]}
+        self.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+
+    async def _drain(self):
+        # 同一时刻只有一个 flush 在进行；flush 期间到达的增量合并到下一次写出
+        try:
+            while self._pending and not self._client_closed:
+                self._write_pending()
+                await self.flush()
+        except tornado.iostream.StreamClosedError:
+            self._client_closed = True
+        finally:
+            self._flushing = False
 
 
 def make_system_message(content: str):
@@ -268,92 +819,245 @@ def make_bot_reply(trigger: str):
     }
 
 
+class PluginReply:
+    # 交给后台插件任务的广播目标：第一条回复替换掉占位卡片
+    def __init__(self, ws, pending_id: str):
+        self.room_id = ws.room_id
+        self.nick = ws.nick
+        self.pending_id = pending_id
+
+    def broadcast(self, payload: dict, persist: bool = True):
+        if self.pending_id:
+            payload = dict(payload, replaces=self.pending_id)
+            self.pending_id = None
+        publish_room(self.room_id, payload, persist=persist)
+
+
 class ChatWebSocket(tornado.websocket.WebSocketHandler):
+    wire_format = "json"
+
     def check_origin(self, origin):
         return True
 
-    def open(self):
+    def get_compression_options(self):
+        room = self.get_argument("room", "general")
+        if "*" in WS_DEFLATE_ROOMS or room in WS_DEFLATE_ROOMS:
+            return {"compression_level": 6, "mem_level": 8}
+        return None
+
+    def get_websocket_protocol(self):
+        protocol = super().get_websocket_protocol()
+        if protocol is not None:
+            fanout_module.force_no_context_takeover(protocol)
+        return protocol
+
+    def select_subprotocol(self, subprotocols):
+        # 声明了二进制子协议的客户端改用 MessagePack，其它客户端保持 JSON 文本
+        if WS_MSGPACK and wire.SUBPROTOCOL in subprotocols:
+            return wire.SUBPROTOCOL
+        return None
+
+    def send_frame(self, payload: dict):
+        if self.wire_format == "msgpack":
+            self.write_message(wire.pack(payload), binary=True)
+        else:
+            self.write_message(json.dumps(payload, ensure_ascii=False))
+
+    async def open(self):
         room = self.get_argument("room", "general")
         nick = self.get_argument("nick", "匿名用户")
         self.room_id = room
         self.nick = nick
-        room_obj = get_room(room)
-        room_obj["clients"].add(self)
-
-        join_msg = make_system_message(f"{nick} 加入了房间 {room}")
-        self.broadcast(join_msg)
+        self.joined = False
+        if self.selected_subprotocol == wire.SUBPROTOCOL:
+            self.wire_format = "msgpack"
+        rate, burst = RATE["connection"]
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.notified_at = 0.0
+        self.delayed_last = False
+        self.alive_at = time.monotonic()
+        self.ping_timed_out = False
+        self.pong_check = None
+        self.keepalive = None
+        if WS_PING_INTERVAL > 0:
+            self.keepalive = tornado.ioloop.PeriodicCallback(self.send_ping, WS_PING_INTERVAL * 1000)
+            self.keepalive.start()
+        WS_STATS["opened"] += 1
+        try:
+            since = _int_arg(self, "since_id")
+            if since is None:
+                since = _int_arg(self, "last_id")
+        except ValueError:
+            since = None
+        try:
+            room_obj = ROOMS.acquire(room)
+        except RoomLimitError as e:
+            self.close(1013, str(e))
+            return
+        try:
+            if not await warm_room(room, room_obj):
+                # 没能从数据库接上房间序号，继续加入会分配与已有消息重复的序号
+                WS_STATS["warm_failed"] += 1
+                ROOMS.release(room_obj)
+                self.close(1011, "房间加载失败，请稍后重连")
+                return
+            # since 比房间当前序号还大说明服务端数据已重置，按新连接处理；多进程时不做续传
+            if since is not None and (since > room_obj["seq"] or PUBSUB.remote):
+                since = None
+            frame = {"type": "backlog", "seq": room_obj["seq"]}
+            if since is not None:
+                frame["content"], frame["truncated"] = await replay_since(room, room_obj, since)
+                frame["since"] = since
+        except BaseException:
+            ROOMS.release(room_obj)
+            raise
+        if self.ws_connection is None or self.ws_connection.is_closing():
+            ROOMS.release(room_obj)
+            return
+        # 从这里到加入房间之间没有 await：补发内容与之后的实时广播首尾相接，不重不漏
+        if since is None:
+            frame["content"] = list(room_obj["recent"])[-BACKLOG_SIZE:] if BACKLOG_SIZE > 0 else []
+        if not room_obj["clients"]:
+            PUBSUB.subscribe(room)
+        ROOMS.join(room_obj, self)
+        self.joined = True
+        if frame["content"] or since is not None:
+            self.send_frame(frame)
+        # 上线只更新在线名单，不再向全房间广播并持久化“加入了房间”消息
+        PRESENCE.join(room, nick)
+        self.send_frame(PRESENCE.roster_frame(room))
 
     async def on_message(self, message):
-        try:
-            data = json.loads(message)
-        except Exception:
-            data = {"content": message}
+        self.alive_at = time.monotonic()
+        if isinstance(message, bytes):
+            try:
+                data = wire.unpack(message)
+            except Exception:
+                return
+            if not isinstance(data, dict):
+                return
+        else:
+            try:
+                data = json.loads(message)
+            except Exception:
+                data = {"content": message}
 
         content = str(data.get("content", "")).strip()
         if not content:
             return
+        if not await self.admit():
+            return
 
         msg = make_user_message(self.nick, content)
         self.broadcast(msg)
 
-        if "🎵音乐" in content:
-            await plugin_handle_music(self)
-        elif "⛅天气" in content:
-            await plugin_handle_weather(self, content)
-        elif "🎬电影" in content:
-            await plugin_handle_movie(self, content)
-        elif "📰新闻" in content:
-            await plugin_handle_news(self)
-        elif "📺b站视频" in content:
-            await plugin_handle_bilibili(self, content)
+        matched = plugins.match(content)
+        if matched is None:
+            return
+        plugin, trigger = matched
+        limiter = RATE["plugins"].get(plugin.name)
+        if limiter is not None and limiter.enabled and limiter.bucket(self.nick).reserve() is None:
+            RATE_STATS["dropped_plugin"] += 1
+            self.notify(f"{trigger} 调用过于频繁，请稍后再试")
+            return
+        if plugin.background:
+            self.run_plugin(plugin, trigger, content)
         else:
-            triggers = ["🎵音乐", "🎬电影", "⛅天气", "📰新闻", "📺b站视频"]
-            for t in triggers:
-                if t in content:
-                    self.broadcast(make_bot_reply(t))
-                    break
+            await plugin.run(self, content)
 
-    async def handle_bilibili(self, content):
-        await plugin_handle_bilibili(self, content)
+    async def admit(self) -> bool:
+        # 连接与昵称两个桶都要有令牌；偶尔超速时等待一会儿再发，连续超速（上一条已经等待过）或等待过长则丢弃
+        buckets = [self.bucket] if self.bucket is not None else []
+        if RATE["nick"].enabled:
+            buckets.append(RATE["nick"].bucket(self.nick))
+        max_wait = 0.0 if self.delayed_last else RATE["max_delay"]
+        wait = 0.0
+        for i, bucket in enumerate(buckets):
+            w = bucket.reserve(max_wait)
+            if w is None:
+                for taken in buckets[:i]:
+                    taken.refund()
+                RATE_STATS["dropped_connection" if bucket is self.bucket else "dropped_nick"] += 1
+                self.notify("发送过快，消息未发送，请稍后再试")
+                return False
+            wait = max(wait, w)
+        self.delayed_last = wait > 0
+        if wait > 0:
+            RATE_STATS["delayed"] += 1
+            await asyncio.sleep(wait)
+            if self.ws_connection is None:
+                return False
+        RATE_STATS["allowed"] += 1
+        return True
 
-    async def handle_movie(self, content):
-        await plugin_handle_movie(self, content)
+    def notify(self, text: str):
+        # 只发给本连接、不入库；每秒最多提示一次，避免刷屏时提示本身也刷屏
+        now = time.monotonic()
+        if now - self.notified_at < 1:
+            return
+        self.notified_at = now
+        try:
+            self.send_frame(make_system_message(text))
+        except tornado.websocket.WebSocketClosedError:
+            pass
 
-    async def handle_weather(self, content):
-        await plugin_handle_weather(self, content)
+    def run_plugin(self, plugin, trigger: str, content: str):
+        # 先广播占位卡片，插件结果到达后按 id 原地替换；不阻塞本连接后续消息
+        pending = make_bot_reply(trigger)
+        pending["type"] = "pending"
+        pending["id"] = uuid.uuid4().hex[:12]
+        self.broadcast(pending, persist=False)
+        reply = PluginReply(self, pending["id"])
 
-    async def handle_music(self):
-        await plugin_handle_music(self)
+        def on_error(kind):
+            # 请求方断开导致的取消只替换掉占位卡片，不写入房间的聊天记录
+            reply.broadcast(make_system_message(PLUGIN_ERRORS[kind].format(trigger)), persist=kind != "cancelled")
 
-    async def handle_news(self):
-        await plugin_handle_news(self)
+        SCHEDULER.submit(self, plugin.name, lambda: plugin.run(reply, content), on_error)
 
-    def on_close(self):
-        room_obj = get_room(self.room_id)
-        room_obj["clients"].discard(self)
-        leave_msg = make_system_message(f"{self.nick} 离开了房间 {self.room_id}")
-        self.broadcast(leave_msg)
-
-    def broadcast(self, payload: dict):
-        room_obj = get_room(self.room_id)
-        msg = json.dumps(payload, ensure_ascii=False)
-        for client in list(room_obj["clients"]):
-            try:
-                client.write_message(msg)
-            except Exception:
-                pass
+    def send_ping(self):
+        # 心跳由我们自己调度：发出 ping 后等 WS_PING_TIMEOUT 秒，期间没有收到 pong 或消息就判定为半开连接
+        if self.ws_connection is None or self.ws_connection.is_closing() or self.pong_check is not None:
+            return
+        sent_at = time.monotonic()
         try:
-            mtype = str(payload.get("type", "message"))
-            sender = str(payload.get("sender", ""))
-            ts = int(payload.get("ts", int(time.time() * 1000)))
-            content = payload.get("content", "")
-            if isinstance(content, (dict, list)):
-                content_text = json.dumps(content, ensure_ascii=False)
-            else:
-                content_text = str(content)
-            save_message(self.room_id, sender, mtype, content_text, ts)
-        except Exception:
-            pass
+            self.ping()
+        except tornado.websocket.WebSocketClosedError:
+            return
+        self.pong_check = tornado.ioloop.IOLoop.current().call_later(WS_PING_TIMEOUT, self.check_pong, sent_at)
+
+    def check_pong(self, sent_at: float):
+        self.pong_check = None
+        if self.alive_at >= sent_at or self.ws_connection is None:
+            return
+        self.ping_timed_out = True
+        conn = self.ws_connection
+        self.close(1001, "ping timed out")
+        # 对端已不响应，不再等它回 close 帧，直接断开让 on_close 立即清理
+        conn.stream.close()
+
+    def on_pong(self, data):
+        self.alive_at = time.monotonic()
+
+    def on_close(self):
+        SCHEDULER.cancel_owner(self)
+        if getattr(self, "keepalive", None) is not None:
+            self.keepalive.stop()
+        if getattr(self, "pong_check", None) is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.pong_check)
+            self.pong_check = None
+        if hasattr(self, "alive_at"):
+            WS_STATS["closed"] += 1
+            if getattr(self, "ping_timed_out", False):
+                WS_STATS["reaped_ping"] += 1
+        if not getattr(self, "joined", False):
+            return
+        if ROOMS.leave(self.room_id, self):
+            PUBSUB.unsubscribe(self.room_id)
+        PRESENCE.leave(self.room_id, self.nick)
+
+    def broadcast(self, payload: dict, persist: bool = True):
+        publish_room(self.room_id, payload, persist=persist)
 
 
 def get_base_dir():
@@ -361,7 +1065,9 @@ def get_base_dir():
     return getattr(sys, "_MEIPASS", os.path.dirname(__file__))
 
 
-def make_app():
+def make_app(debug: bool | None = None):
+    if debug is None:
+        debug = DEBUG
     base_dir = get_base_dir()
     templates_dir_candidates = [
         os.path.join(base_dir, "server", "templates"),
@@ -387,6 +1093,26 @@ def make_app():
     static_dir = pick_path(static_dir_candidates)
     icon_dir = pick_path(favicon_dir_candidates)
 
+    settings = {}
+    precompress(static_dir)
+    if not debug:
+        # 启动时编译全部模板、算好静态资源哈希，首批请求不再付出这部分开销
+        loader = tornado.template.Loader(templates_dir)
+        for name in os.listdir(templates_dir):
+            if name.endswith(".html"):
+                loader.load(name)
+        settings["template_loader"] = loader
+        for root, _, names in os.walk(static_dir):
+            for name in names:
+                rel = os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/")
+                AssetHandler.get_version({"static_path": static_dir}, rel)
+
+    PUBSUB.start(deliver_remote)
+    PRESENCE.send = send_presence
+    PRESENCE.publish = lambda room_id, text: PUBSUB.publish(room_id, text)
+    PRESENCE.start()
+    ROOMS.start()
+    LOOP_LAG.start()
     return tornado.web.Application(
         [
             (r"/", IndexHandler),
@@ -398,14 +1124,24 @@ def make_app():
             (r"/favicon.ico", tornado.web.StaticFileHandler, {"path": icon_dir, "default_filename": "favicon.ico"}),
             (r"/config", ConfigHandler),
             (r"/history", HistoryHandler),
+            (r"/search", SearchHandler),
             (r"/api/clear_history", ClearHistoryHandler),
+            (r"/api/stats", StatsHandler),
+            (r"/metrics", MetricsHandler),
+            (r"/api/rooms", RoomsHandler),
+            (r"/api/rooms/([^/]+)/online", OnlineHandler),
+            (r"/api/rooms/([^/]+)/export", ExportHandler),
+            (r"/api/rooms/([^/]+)/import", ImportHandler),
             (r"/ai", AIStreamHandler),
             (r"/ws", ChatWebSocket),
         ],
         template_path=templates_dir,
         static_path=static_dir,
-        debug=True,
+        static_handler_class=AssetHandler,
+        debug=debug,
+        websocket_max_message_size=WS_MAX_MESSAGE_SIZE,
         cookie_secret=os.environ.get("COOKIE_SECRET", "ZZCHAT_SECRET"),
+        **settings,
     )
 
 
@@ -427,9 +1163,47 @@ if __name__ == "__main__":
         return cands[-1]
     data_dir = pick_dir(data_dir_candidates)
     db_path = os.path.join(data_dir, "zzchat.db")
-    init_db(db_path)
-    app = make_app()
     port = int(os.environ.get("PORT", "8891"))
-    app.listen(port)
-    print(f"ZZ聊天室 服务已启动: http://127.0.0.1:{port}/")
-    tornado.ioloop.IOLoop.current().start()
+    processes = int(os.environ.get("ZZCHAT_PROCESSES", "1"))
+    sockets = tornado.netutil.bind_sockets(port)
+    if processes != 1:
+        # 多进程：先绑定端口再 fork，数据库连接与后台线程都在子进程里创建
+        tornado.process.fork_processes(processes)
+        spec = os.environ.get("ZZCHAT_PUBSUB", "") or "local"
+        PUBSUB = create_pubsub(spec, local_dir=os.path.join(data_dir, f"pubsub-{port}"))
+    init_db(db_path)
+    # autoreload 与多进程不兼容
+    app = make_app(debug=DEBUG and processes == 1)
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    task_id = tornado.process.task_id()
+    RETENTION.archive = Archive(os.path.join(data_dir, "archive"))
+    # 多进程时只由第一个进程执行清理
+    if not task_id:
+        RETENTION.start()
+    print(f"ZZ聊天室 服务已启动: http://127.0.0.1:{port}/" + (f" (进程 {task_id})" if task_id is not None else ""))
+    loop = tornado.ioloop.IOLoop.current()
+
+    def on_signal(signum, callback):
+        running = asyncio.get_running_loop()
+        try:
+            running.add_signal_handler(signum, callback)
+        except NotImplementedError:
+            # Windows 的事件循环不支持 add_signal_handler，退回 signal.signal 再转交给事件循环线程
+            signal.signal(signum, lambda num, frame: running.call_soon_threadsafe(callback))
+
+    def install_signal_handlers():
+        on_signal(signal.SIGINT, loop.stop)
+        on_signal(signal.SIGTERM, loop.stop)
+        if hasattr(signal, "SIGHUP"):
+            on_signal(signal.SIGHUP, lambda: CONFIG.reload(True))
+
+    # add_signal_handler 需要在事件循环运行后注册
+    loop.add_callback(install_signal_handlers)
+    try:
+        loop.start()
+    finally:
+        WRITER.close()
+        storage.close()
+        PUBSUB.close()
+        print(f"ZZ聊天室 服务已停止，已写入消息 {WRITER.stats['written']} 条")
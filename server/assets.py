@@ -0,0 +1,105 @@
+import gzip
+import os
+
+import tornado.web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 启动时把静态文本资源预压缩到内存里，请求时按 Accept-Encoding 直接返回，不再逐次压缩
+COMPRESSIBLE = (".css", ".js", ".json", ".svg", ".html", ".txt", ".map")
+MIN_SIZE = 512
+
+_compressed = {}
+
+STATS = {
+    "files": 0,
+    "raw_bytes": 0,
+    "gzip_bytes": 0,
+    "br_bytes": 0,
+    "served_gzip": 0,
+    "served_br": 0,
+    "served_identity": 0,
+}
+
+
+def precompress(static_dir: str):
+    # make_app 每次都会调用：内容未变（mtime 相同）的文件不再重新压缩，统计按当前结果重算而不是累加
+    for root, _, names in os.walk(static_dir):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.abspath(os.path.join(root, name))
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                entry = _compressed.get(path)
+                if entry is not None and entry[0] == mtime:
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                print(f"Precompress Error ({path}): {e}")
+                continue
+            if len(data) < MIN_SIZE:
+                continue
+            variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+            # 压缩后反而更大的格式不保留
+            variants = {k: v for k, v in variants.items() if len(v) < len(data)}
+            _compressed[path] = (mtime, variants, len(data))
+    STATS["files"] = len(_compressed)
+    STATS["raw_bytes"] = sum(entry[2] for entry in _compressed.values())
+    for key in ("gzip", "br"):
+        STATS[f"{key}_bytes"] = sum(len(entry[1].get(key, b"")) for entry in _compressed.values())
+
+
+class AssetHandler(tornado.web.StaticFileHandler):
+    # 带 ?v=<内容哈希>（static_url 生成）的请求内容永不变化，可标记 immutable；预压缩版本各自使用不同的 ETag
+    IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+    def initialize(self, path: str, default_filename: str | None = None):
+        super().initialize(path, default_filename)
+        self.encoding = None
+        self.encoded = None
+
+    def _pick_encoding(self):
+        entry = _compressed.get(self.absolute_path)
+        if entry is None or entry[0] != os.stat(self.absolute_path).st_mtime_ns:
+            return None, None
+        accepted = {part.split(";")[0].strip() for part in self.request.headers.get("Accept-Encoding", "").split(",")}
+        for name in ("br", "gzip"):
+            if name in accepted and name in entry[1]:
+                return name, entry[1][name]
+        return None, None
+
+    def set_headers(self):
+        if self.absolute_path in _compressed:
+            self.encoding, self.encoded = self._pick_encoding()
+            self.set_header("Vary", "Accept-Encoding")
+            if self.encoding is not None:
+                self.set_header("Content-Encoding", self.encoding)
+                # get() 通过 self.get_content 取正文，实例属性会遮住类方法，从而返回压缩后的字节
+                self.get_content = self._get_encoded
+        STATS["served_" + (self.encoding or "identity")] += 1
+        super().set_headers()
+
+    def compute_etag(self):
+        etag = super().compute_etag()
+        if etag and self.encoding:
+            etag = f'{etag[:-1]}-{self.encoding}"'
+        return etag
+
+    def get_content_size(self) -> int:
+        if self.encoded is not None:
+            return len(self.encoded)
+        return super().get_content_size()
+
+    def _get_encoded(self, abspath: str, start: int | None = None, end: int | None = None) -> bytes:
+        return self.encoded[start:end]
+
+    def set_extra_headers(self, path: str):
+        if self.get_argument("v", None):
+            self.set_header("Cache-Control", f"public, max-age={self.IMMUTABLE_MAX_AGE}, immutable")
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import hmac
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+# 密码哈希带版本前缀存进 password_hash：scrypt$n$r$p$盐$哈希，或 pbkdf2_sha256$迭代次数$盐$哈希；
+# 没有前缀的是旧版 sha256(salt + password)，登录成功时按当前参数透明地重新哈希
+SCRYPT_N = int(os.environ.get("ZZCHAT_SCRYPT_N", "16384"))
+SCRYPT_R = int(os.environ.get("ZZCHAT_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("ZZCHAT_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("ZZCHAT_PBKDF2_ITERATIONS", "600000"))
+HAS_SCRYPT = hasattr(hashlib, "scrypt")
+# scrypt 与 pbkdf2 计算时释放 GIL，线程池即可并行；排队超过上限直接拒绝，避免登录高峰把内存和 CPU 占满
+HASH_WORKERS = int(os.environ.get("ZZCHAT_HASH_WORKERS", "2"))
+HASH_QUEUE = int(os.environ.get("ZZCHAT_HASH_QUEUE", "32"))
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="zzchat-hash")
+_inflight = 0
+
+STATS = {
+    "hashed": 0,
+    "verified": 0,
+    "rejected_busy": 0,
+    "rehashed": 0,
+    "cache_hits": 0,
+    "cache_misses": 0,
+}
+
+
+class HashBusyError(Exception):
+    pass
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def hash_password(password: str) -> tuple[str, str]:
+    # 返回 (password_hash, salt)；salt 列保留盐值，兼容旧表结构
+    salt = os.urandom(16)
+    if HAS_SCRYPT:
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}", salt.hex()
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}", salt.hex()
+
+
+def check_password(password: str, stored: str, legacy_salt: str) -> tuple[bool, bool]:
+    # 返回 (是否匹配, 是否需要按当前参数重新哈希)
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            digest = _scrypt(password, bytes.fromhex(parts[4]), n, r, p)
+            ok = hmac.compare_digest(digest.hex(), parts[5])
+            return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            iterations = int(parts[1])
+            digest = _pbkdf2(password, bytes.fromhex(parts[2]), iterations)
+            ok = hmac.compare_digest(digest.hex(), parts[3])
+            return ok, ok and (HAS_SCRYPT or iterations != PBKDF2_ITERATIONS)
+    except ValueError:
+        return False, False
+    digest = hashlib.sha256((legacy_salt + password).encode("utf-8")).hexdigest()
+    ok = hmac.compare_digest(digest, stored)
+    return ok, ok
+
+
+async def _run(func, *args):
+    global _inflight
+    if _inflight >= HASH_WORKERS + HASH_QUEUE:
+        STATS["rejected_busy"] += 1
+        raise HashBusyError()
+    _inflight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+    finally:
+        _inflight -= 1
+
+
+class UserCache:
+    # 昵称 -> 用户记录（含密码哈希）的 LRU；只缓存存在的用户，其它进程新注册的用户查不到时会再去数据库
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+
+    def get(self, nick: str) -> dict | None:
+        user = self._items.get(nick)
+        if user is not None:
+            self._items.move_to_end(nick)
+        return user
+
+    def put(self, nick: str, user: dict):
+        self._items[nick] = user
+        self._items.move_to_end(nick)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+USERS = UserCache(int(os.environ.get("ZZCHAT_USER_CACHE", "10000")))
+
+
+async def get_user(nick: str) -> dict | None:
+    user = USERS.get(nick)
+    if user is not None:
+        STATS["cache_hits"] += 1
+        return user
+    STATS["cache_misses"] += 1
+    user = await storage.get_user(nick)
+    if user is not None:
+        USERS.put(nick, user)
+    return user
+
+
+async def register(nick: str, password: str) -> tuple[bool, str]:
+    if not nick or not password:
+        return False, "参数错误"
+    if USERS.get(nick) is not None:
+        return False, "昵称已存在"
+    try:
+        password_hash, salt = await _run(hash_password, password)
+    except HashBusyError:
+        return False, "服务繁忙，请稍后再试"
+    STATS["hashed"] += 1
+    ok, msg = await storage.insert_user(nick, password_hash, salt)
+    if ok:
+        USERS.put(nick, {"nick": nick, "password_hash": password_hash, "salt": salt})
+    return ok, msg
+
+
+async def login(nick: str, password: str) -> tuple[bool, str]:
+    user = await get_user(nick)
+    if user is None:
+        return False, "用户不存在"
+    try:
+        ok, rehash = await _run(check_password, password, user["password_hash"], user["salt"])
+    except HashBusyError:
+        return False, "服务繁忙，请稍后再试"
+    STATS["verified"] += 1
+    if not ok:
+        return False, "密码错误"
+    if rehash:
+        try:
+            password_hash, salt = await _run(hash_password, password)
+            await storage.update_password_hash(nick, password_hash, salt)
+            USERS.put(nick, dict(user, password_hash=password_hash, salt=salt))
+            STATS["rehashed"] += 1
+        except Exception as e:
+            # 升级失败不影响本次登录，下次登录再试
+            print(f"Password Rehash Error ({nick}): {e}")
+    return True, "登录成功"
+
+
+def snapshot() -> dict:
+    return dict(STATS, cached_users=len(USERS), inflight=_inflight)
@@ -0,0 +1,190 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+
+import db
+
+# 聊天记录的 NDJSON 导出/导入：每行一条消息 {"id", "room", "sender", "type", "content", "ts", "seq"}，
+# 与归档分段（data/archive/<房间>/*.ndjson.gz）的行格式相同；服务端接口与命令行共用这里的解析
+MAX_LINE = 1024 * 1024
+
+STATS = {
+    "exports": 0,
+    "exports_aborted": 0,
+    "exported_rows": 0,
+    "imports": 0,
+    "imported_rows": 0,
+    "skipped_rows": 0,
+}
+
+
+def encode_line(item: dict) -> bytes:
+    return (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def to_row(data, room: str | None = None, keep_seq: bool = False) -> tuple | None:
+    # 一行 JSON -> save_messages 的 (room, sender, type, content, ts, seq)；缺少时间戳等无效行返回 None
+    if not isinstance(data, dict):
+        return None
+    ts = data.get("ts")
+    if not isinstance(ts, int) or isinstance(ts, bool):
+        return None
+    content = data.get("content", "")
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content, ensure_ascii=False)
+    elif not isinstance(content, str):
+        return None
+    room = room or str(data.get("room") or "")
+    if not room:
+        return None
+    # 默认丢弃原序号：导入到已有消息的房间时，旧序号会和现有序号冲突，断线续传会漏补或重补
+    seq = data.get("seq") if keep_seq and isinstance(data.get("seq"), int) else None
+    return room, str(data.get("sender", "")), str(data.get("type") or "message"), content, ts, seq
+
+
+class LineDecoder:
+    # 请求体分块到达：需要时先做流式 gzip 解压，再按行切分，不完整的最后一行留到下一块
+    def __init__(self, compressed: bool = False, max_line: int = MAX_LINE):
+        self.max_line = max_line
+        # wbits=47：自动识别 gzip 或 zlib 头
+        self._inflate = zlib.decompressobj(47) if compressed else None
+        self._buf = b""
+
+    def _decompress(self, chunk: bytes) -> bytes:
+        out = []
+        while chunk:
+            out.append(self._inflate.decompress(chunk))
+            if not self._inflate.eof:
+                break
+            # 多成员 gzip（如归档分段）：一个成员结束后换新的解压器继续
+            chunk = self._inflate.unused_data
+            self._inflate = zlib.decompressobj(47)
+        return b"".join(out)
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        if self._inflate is not None:
+            try:
+                chunk = self._decompress(chunk)
+            except zlib.error as e:
+                raise ValueError(f"gzip 数据无效: {e}")
+        lines = (self._buf + chunk).split(b"\n")
+        self._buf = lines.pop()
+        if len(self._buf) > self.max_line:
+            raise ValueError("单行超过长度上限")
+        return lines
+
+    def finish(self) -> list[bytes]:
+        line, self._buf = self._buf, b""
+        return [line] if line.strip() else []
+
+
+class Importer:
+    # 解析后的行攒到 batch_size 条再交给 save_messages，一批一个事务
+    def __init__(self, room: str | None = None, keep_seq: bool = False, batch_size: int = 5000):
+        self.room = room
+        self.keep_seq = keep_seq
+        self.batch_size = batch_size
+        self.rows = []
+        self.imported = 0
+        self.skipped = 0
+        # 保留原序号时记录每个房间导入的最大序号，服务端据此推进房间序号，之后的广播不会与导入的序号重复
+        self.top_seq = {}
+
+    def add(self, lines: list[bytes]):
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = to_row(json.loads(line), self.room, self.keep_seq)
+            except ValueError:
+                row = None
+            if row is None:
+                self.skipped += 1
+                continue
+            self.rows.append(row)
+            if row[5] is not None and row[5] > self.top_seq.get(row[0], 0):
+                self.top_seq[row[0]] = row[5]
+
+    def take(self, final: bool = False) -> list[tuple] | None:
+        if not self.rows or (len(self.rows) < self.batch_size and not final):
+            return None
+        batch, self.rows = self.rows[:self.batch_size], self.rows[self.batch_size:]
+        return batch
+
+
+def _open_input(path: str):
+    if path == "-":
+        return sys.stdin.buffer
+    return open(path, "rb")
+
+
+def import_file(path: str, room: str | None, keep_seq: bool, batch_size: int) -> Importer:
+    importer = Importer(room, keep_seq, batch_size)
+    decoder = LineDecoder(compressed=path.endswith(".gz"))
+    with _open_input(path) as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            importer.add(decoder.feed(chunk))
+            while (batch := importer.take()) is not None:
+                db.save_messages(batch)
+                importer.imported += len(batch)
+        importer.add(decoder.finish())
+        while (batch := importer.take(final=True)) is not None:
+            db.save_messages(batch)
+            importer.imported += len(batch)
+    return importer
+
+
+def export_file(path: str, room: str, batch_size: int) -> int:
+    count = 0
+    out = sys.stdout.buffer if path == "-" else gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+    after = None
+    try:
+        while True:
+            items = db.fetch_export(room, batch_size, after)
+            if not items:
+                break
+            out.write(b"".join(encode_line(item) for item in items))
+            count += len(items)
+            after = (items[-1]["ts"], items[-1]["id"])
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ZZ聊天室 聊天记录 NDJSON 导出/导入（.gz 结尾的文件自动压缩/解压，- 表示标准输入/输出）")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "zzchat.db"), help="数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="按时间顺序导出一个房间的全部消息（不含归档分段）")
+    p.add_argument("room")
+    p.add_argument("file")
+    p.add_argument("--batch", type=int, default=5000, help="每页读取的行数")
+    p = sub.add_parser("import", help="导入 NDJSON，每批一个事务")
+    p.add_argument("file")
+    p.add_argument("--room", help="写入指定房间；不指定时使用每行的 room 字段")
+    p.add_argument("--keep-seq", action="store_true", help="保留原序号（导入到空库恢复备份时使用，须在服务停止时进行）")
+    p.add_argument("--batch", type=int, default=20000, help="每个事务的行数")
+    args = parser.parse_args(argv)
+
+    db.init_db(os.path.abspath(args.db))
+    start = time.perf_counter()
+    if args.command == "export":
+        count = export_file(args.file, args.room, args.batch)
+        print(f"导出 {count} 条，用时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    else:
+        importer = import_file(args.file, args.room, args.keep_seq, args.batch)
+        elapsed = time.perf_counter() - start
+        print(f"导入 {importer.imported} 条，跳过 {importer.skipped} 条，用时 {elapsed:.1f}s"
+              f"（{importer.imported / max(elapsed, 1e-6):.0f} 行/s）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,125 @@
+import hashlib
+import html
 import os
+import pathlib
+import re
 import sqlite3
 import time
-import hashlib
 import threading
 
 _lock = threading.RLock()
 _conn = None
 _db_path = None
+_local = threading.local()
+
+CACHE_KB = int(os.environ.get("ZZCHAT_DB_CACHE_KB", "16384"))
+MMAP_MB = int(os.environ.get("ZZCHAT_DB_MMAP_MB", "64"))
+SYNCHRONOUS = os.environ.get("ZZCHAT_DB_SYNCHRONOUS", "NORMAL").upper()
+
+_MAX_ID = 2 ** 63 - 1
+
+# 中文没有空格分词：连续的中日韩字符切成相邻二字组（单字保留原样），其它按单词切分，再交给 FTS5 的 unicode61 分词器
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RUN_RE = re.compile(f"[{_CJK}]+")
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_]+")
+
+def _fts_tokens(text: str) -> list[str]:
+    tokens = []
+    for m in _TOKEN_RE.finditer(text.lower()):
+        t = m.group(0)
+        if _CJK_RUN_RE.fullmatch(t) and len(t) > 1:
+            tokens.extend(t[i:i + 2] for i in range(len(t) - 1))
+        else:
+            tokens.append(t)
+    return tokens
+
+def _fts_text(text: str) -> str:
+    return " ".join(_fts_tokens(text))
 
+# 房间名可以是任意文本，索引里存它的摘要作为单个词元，搜索时在 FTS 查询内按房间过滤
+def _room_token(room: str) -> str:
+    return "r" + hashlib.sha1(room.encode("utf-8")).hexdigest()[:16]
+
+# 只索引用户发送的文字消息，卡片（JSON 内容）与系统提示不进入全文索引
+def _fts_rows(rows: list[tuple], ids: list[int]) -> list[tuple]:
+    return [(msg_id, _fts_text(row[3]), _room_token(row[0])) for row, msg_id in zip(rows, ids) if row[2] == "message"]
+
+def _backfill_fts(conn):
+    last_id = 0
+    while True:
+        batch = conn.execute(
+            "SELECT id, room, content FROM messages WHERE id > ? AND type='message' ORDER BY id LIMIT 5000", (last_id,)
+        ).fetchall()
+        if not batch:
+            break
+        conn.executemany(
+            "INSERT INTO messages_fts(rowid, body, room_key) VALUES(?,?,?)",
+            [(r["id"], _fts_text(r["content"]), _room_token(r["room"])) for r in batch]
+        )
+        last_id = batch[-1]["id"]
+
+# 按顺序执行的结构迁移，PRAGMA user_version 记录已执行到第几项；每项是 SQL 列表或接收连接的函数
+_MIGRATIONS = [
+    [
+        "CREATE INDEX IF NOT EXISTS idx_messages_room_ts_id ON messages(room, ts, id)",
+    ],
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(body, tokenize='unicode61 remove_diacritics 2')",
+        # 任何删除消息的路径（清空、过期清理）都会同步删除索引行
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+        "DELETE FROM messages_fts WHERE rowid = old.id; END",
+    ],
+    [
+        # 房间内单调递增的序号，广播时分配；room_seq 记录每个房间用到的最大序号，清空、清理后也不回退
+        "ALTER TABLE messages ADD COLUMN seq INTEGER",
+        "UPDATE messages SET seq = id",
+        "CREATE INDEX IF NOT EXISTS idx_messages_room_seq ON messages(room, seq)",
+        "CREATE TABLE IF NOT EXISTS room_seq (room TEXT PRIMARY KEY, seq INTEGER NOT NULL)",
+        "INSERT OR REPLACE INTO room_seq(room, seq) SELECT room, MAX(seq) FROM messages GROUP BY room",
+    ],
+    [
+        # 索引增加房间词元列，房间过滤在 FTS 查询内完成，不必先取出所有房间的命中再连表筛选
+        "DROP TABLE IF EXISTS messages_fts",
+        "CREATE VIRTUAL TABLE messages_fts USING fts5(body, room_key, tokenize='unicode61 remove_diacritics 2')",
+        _backfill_fts,
+    ],
+]
+
+def _tune(conn):
+    conn.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_MB * 1024 * 1024}")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+# 写连接：全进程一个，由 _lock 串行化（异步调用方统一走 storage 的写线程）
 def _get_conn():
     global _conn
     if _conn is None:
         _conn = sqlite3.connect(_db_path, check_same_thread=False)
         _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA busy_timeout=5000")
+        # WAL 模式下读不阻塞写、写不阻塞读；NORMAL 同步级别在 WAL 下不会损坏数据库
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        _tune(_conn)
     return _conn
 
+def _open_read_conn():
+    uri = pathlib.Path(os.path.abspath(_db_path)).as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    _tune(conn)
+    conn.execute("PRAGMA query_only=1")
+    return conn
+
+# 读连接：每个线程一个只读连接，不经过 _lock，可与写入并发
+def _read_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != _db_path:
+        conn = _open_read_conn()
+        _local.conn, _local.path = conn, _db_path
+    return conn
+
 def init_db(db_path: str):
     global _db_path
     _db_path = db_path
@@ -46,71 +151,277 @@ def init_db(db_path: str):
             """
         )
         conn.commit()
+        _migrate(conn)
 
-def _hash_password(password: str, salt: str) -> str:
-    return hashlib.sha256((salt + password).encode("utf-8")).hexdigest()
+def _migrate(conn):
+    # 每项迁移在 BEGIN IMMEDIATE 事务内重新读取版本号后执行：多个工作进程同时启动时只有一个会真正执行，DDL 也随事务原子提交
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(_MIGRATIONS):
+                conn.rollback()
+                return
+            for step in _MIGRATIONS[version]:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version={version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
-def create_user(nick: str, password: str) -> tuple[bool, str]:
-    if not nick or not password:
-        return False, "参数错误"
+def get_user(nick: str) -> dict | None:
+    cur = _read_conn().cursor()
+    cur.execute("SELECT nick, password_hash, salt FROM users WHERE nick=?", (nick,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+# 只负责落库，密码哈希由 auth 在独立线程池里算好再传进来，写锁内不做耗时计算
+def insert_user(nick: str, password_hash: str, salt: str) -> tuple[bool, str]:
     with _lock:
         conn = _get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM users WHERE nick=?", (nick,))
-        if cur.fetchone():
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO users(nick, password_hash, salt, created_at) VALUES(?,?,?,?)",
+                    (nick, password_hash, salt, int(time.time()))
+                )
+        except sqlite3.IntegrityError:
             return False, "昵称已存在"
-        salt = os.urandom(16).hex()
-        ph = _hash_password(password, salt)
-        cur.execute(
-            "INSERT INTO users(nick, password_hash, salt, created_at) VALUES(?,?,?,?)",
-            (nick, ph, salt, int(time.time()))
-        )
-        conn.commit()
         return True, "注册成功"
 
-def verify_user(nick: str, password: str) -> tuple[bool, str]:
+def update_password_hash(nick: str, password_hash: str, salt: str):
     with _lock:
         conn = _get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT password_hash, salt FROM users WHERE nick=?", (nick,))
-        row = cur.fetchone()
-        if not row:
-            return False, "用户不存在"
-        ph = _hash_password(password, row["salt"])
-        if ph != row["password_hash"]:
-            return False, "密码错误"
-        return True, "登录成功"
-
-def save_message(room: str, sender: str, mtype: str, content: str, ts: int):
+        with conn:
+            conn.execute("UPDATE users SET password_hash=?, salt=? WHERE nick=?", (password_hash, salt, nick))
+
+def save_message(room: str, sender: str, mtype: str, content: str, ts: int, seq: int | None = None):
+    save_messages([(room, sender, mtype, content, ts, seq)])
+
+def _bump_room_seq(conn, rows: list[tuple]):
+    top = {}
+    for row in rows:
+        if row[5] is not None and row[5] > top.get(row[0], 0):
+            top[row[0]] = row[5]
+    conn.executemany(
+        "INSERT INTO room_seq(room, seq) VALUES(?,?) ON CONFLICT(room) DO UPDATE SET seq=max(seq, excluded.seq)",
+        list(top.items())
+    )
+
+# rows 为 (room, sender, type, content, ts, seq)，也接受不带 seq 的五元组；seq 为 None 的行不参与断线续传
+def save_messages(rows: list[tuple]) -> list[int]:
+    if not rows:
+        return []
+    rows = [row if len(row) == 6 else (*row, None) for row in rows]
     with _lock:
         conn = _get_conn()
-        cur = conn.cursor()
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages(room, sender, type, content, ts, seq) VALUES(?,?,?,?,?,?)",
+                rows
+            )
+            # 同一连接、同一事务内连续插入，自增 id 是连续的；必须在写 room_seq 之前读取，否则会被它的插入覆盖
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            ids = list(range(last_id - len(rows) + 1, last_id + 1))
+            _bump_room_seq(conn, rows)
+            conn.executemany("INSERT INTO messages_fts(rowid, body, room_key) VALUES(?,?,?)", _fts_rows(rows, ids))
+    return ids
+
+def _row_to_item(r) -> dict:
+    return {"id": r["id"], "room": r["room"], "sender": r["sender"], "type": r["type"], "content": r["content"], "ts": r["ts"], "seq": r["seq"]}
+
+# 按 (ts, id) 键集分页：默认及 before_* 游标向更早翻页（新→旧），after_* 游标向更新翻页（旧→新）
+def fetch_history_page(room: str, limit: int = 50,
+                       before_ts: int | None = None, before_id: int | None = None,
+                       after_ts: int | None = None, after_id: int | None = None) -> tuple[list[dict], dict | None]:
+    cur = _read_conn().cursor()
+    if after_ts is not None:
         cur.execute(
-            "INSERT INTO messages(room, sender, type, content, ts) VALUES(?,?,?,?,?)",
-            (room, sender, mtype, content, ts)
+            "SELECT id, room, sender, type, content, ts, seq FROM messages "
+            "WHERE room=? AND (ts, id) > (?, ?) ORDER BY ts ASC, id ASC LIMIT ?",
+            (room, after_ts, _MAX_ID if after_id is None else after_id, limit)
         )
-        conn.commit()
+    elif before_ts is not None:
+        cur.execute(
+            "SELECT id, room, sender, type, content, ts, seq FROM messages "
+            "WHERE room=? AND (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?",
+            (room, before_ts, 0 if before_id is None else before_id, limit)
+        )
+    else:
+        cur.execute(
+            "SELECT id, room, sender, type, content, ts, seq FROM messages "
+            "WHERE room=? ORDER BY ts DESC, id DESC LIMIT ?",
+            (room, limit)
+        )
+    items = [_row_to_item(r) for r in cur.fetchall()]
+    next_cursor = None
+    if len(items) == limit and items:
+        last = items[-1]
+        if after_ts is not None:
+            next_cursor = {"after_ts": last["ts"], "after_id": last["id"]}
+        else:
+            next_cursor = {"before_ts": last["ts"], "before_id": last["id"]}
+    return items, next_cursor
 
 def fetch_history(room: str, limit: int = 50, before_ts: int | None = None) -> list[dict]:
+    items, _ = fetch_history_page(room, limit, before_ts=before_ts)
+    return items
+
+# 导出：按 (ts, id) 键集分页，从旧到新；每页是一条独立的短查询，长时间的导出不会一直持有读快照而挡住 WAL checkpoint
+def fetch_export(room: str, size: int, after: tuple[int, int] | None = None) -> list[dict]:
+    cur = _read_conn().cursor()
+    if after is None:
+        cur.execute(
+            "SELECT id, room, sender, type, content, ts, seq FROM messages WHERE room=? ORDER BY ts ASC, id ASC LIMIT ?",
+            (room, size)
+        )
+    else:
+        cur.execute(
+            "SELECT id, room, sender, type, content, ts, seq FROM messages "
+            "WHERE room=? AND (ts, id) > (?, ?) ORDER BY ts ASC, id ASC LIMIT ?",
+            (room, after[0], after[1], size)
+        )
+    return [_row_to_item(r) for r in cur.fetchall()]
+
+def max_seq(room: str) -> int:
+    row = _read_conn().execute("SELECT seq FROM room_seq WHERE room=?", (room,)).fetchone()
+    return row["seq"] if row else 0
+
+# 断线续传：返回 seq 大于 since_seq 的消息（旧→新）；缺口超过 limit 条时只返回最新的 limit 条，truncated 为 True
+def fetch_since(room: str, since_seq: int, limit: int = 500) -> tuple[list[dict], bool]:
+    cur = _read_conn().cursor()
+    cur.execute(
+        "SELECT id, room, sender, type, content, ts, seq FROM messages "
+        "WHERE room=? AND seq > ? ORDER BY seq DESC LIMIT ?",
+        (room, since_seq, limit + 1)
+    )
+    items = [_row_to_item(r) for r in cur.fetchall()]
+    truncated = len(items) > limit
+    items = items[:limit]
+    items.reverse()
+    return items, truncated
+
+def _match_query(q: str) -> tuple[str, list[str]]:
+    # 每个空格分隔的词作为一个短语（二字组须相邻），词之间为 AND；非中文词的最后一段按前缀匹配
+    phrases = []
+    terms = []
+    for word in q.split():
+        tokens = _fts_tokens(word)
+        if not tokens:
+            continue
+        terms.append(word.lower())
+        phrase = '"' + " ".join(tokens) + '"'
+        if not _CJK_RUN_RE.fullmatch(tokens[-1]):
+            phrase += "*"
+        phrases.append(phrase)
+    return " AND ".join(phrases), terms
+
+def _snippet(content: str, terms: list[str], width: int = 64) -> str:
+    lower = content.lower()
+    hits = [(lower.find(t), t) for t in terms if t and lower.find(t) >= 0]
+    start = max(0, min(pos for pos, _ in hits) - width // 4) if hits else 0
+    end = min(len(content), start + width)
+    window = content[start:end]
+    # 在窗口内给所有命中的词加 <mark>，其余文本做 HTML 转义
+    marks = []
+    lw = window.lower()
+    for t in terms:
+        pos = lw.find(t)
+        while t and pos >= 0:
+            marks.append((pos, pos + len(t)))
+            pos = lw.find(t, pos + len(t))
+    marks.sort()
+    out = []
+    cursor = 0
+    for a, b in marks:
+        if a < cursor:
+            continue
+        out.append(html.escape(window[cursor:a]))
+        out.append("<mark>" + html.escape(window[a:b]) + "</mark>")
+        cursor = b
+    out.append(html.escape(window[cursor:]))
+    return ("…" if start > 0 else "") + "".join(out) + ("…" if end < len(content) else "")
+
+# 全文搜索：按 bm25 相关度（越小越相关）再按 id 排序，游标为上一页最后一条的 (rank, id)
+def search_messages(room: str, q: str, limit: int = 20,
+                    after_rank: float | None = None, after_id: int | None = None) -> tuple[list[dict], dict | None]:
+    match, terms = _match_query(q)
+    if not match:
+        return [], None
+    # 房间词元列权重为 0，不影响相关度
+    match = f"room_key:{_room_token(room)} AND body:({match})"
+    cur = _read_conn().cursor()
+    cur.execute(
+        "SELECT m.id, m.room, m.sender, m.type, m.content, m.ts, m.seq, f.rank FROM "
+        "(SELECT rowid AS id, bm25(messages_fts, 1.0, 0.0) AS rank FROM messages_fts WHERE messages_fts MATCH ?) f "
+        "JOIN messages m ON m.id = f.id "
+        "WHERE (f.rank, f.id) > (?, ?) ORDER BY f.rank, f.id LIMIT ?",
+        (match, float("-inf") if after_rank is None else after_rank, 0 if after_id is None else after_id, limit)
+    )
+    items = []
+    for r in cur.fetchall():
+        item = _row_to_item(r)
+        item["rank"] = r["rank"]
+        item["snippet"] = _snippet(r["content"], terms)
+        items.append(item)
+    next_cursor = None
+    if len(items) == limit and items:
+        next_cursor = {"after_rank": items[-1]["rank"], "after_id": items[-1]["id"]}
+    return items, next_cursor
+
+def list_rooms() -> list[str]:
+    cur = _read_conn().cursor()
+    cur.execute("SELECT DISTINCT room FROM messages")
+    return [r["room"] for r in cur.fetchall()]
+
+# 只保留最新 max_rows 条时，返回第 max_rows+1 新的那条的 (ts, id)；它和更早的行都应清理
+def retention_bound(room: str, max_rows: int) -> tuple[int, int] | None:
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT ts, id FROM messages WHERE room=? ORDER BY ts DESC, id DESC LIMIT 1 OFFSET ?",
+            (room, max_rows)
+        ).fetchone()
+    return (row["ts"], row["id"]) if row else None
+
+def oldest_messages(room: str, before_ts: int, before_id: int, limit: int) -> list[dict]:
+    with _lock:
+        rows = _get_conn().execute(
+            "SELECT id, room, sender, type, content, ts, seq FROM messages "
+            "WHERE room=? AND (ts, id) < (?, ?) ORDER BY ts ASC, id ASC LIMIT ?",
+            (room, before_ts, before_id, limit)
+        ).fetchall()
+    return [_row_to_item(r) for r in rows]
+
+def delete_messages(ids: list[int]) -> int:
+    if not ids:
+        return 0
     with _lock:
         conn = _get_conn()
-        cur = conn.cursor()
-        if before_ts is None:
-            cur.execute(
-                "SELECT room, sender, type, content, ts FROM messages WHERE room=? ORDER BY ts ASC LIMIT ?",
-                (room, limit)
-            )
-        else:
-            cur.execute(
-                "SELECT room, sender, type, content, ts FROM messages WHERE room=? AND ts<? ORDER BY ts ASC LIMIT ?",
-                (room, before_ts, limit)
-            )
-        rows = cur.fetchall()
-        return [{"room": r["room"], "sender": r["sender"], "type": r["type"], "content": r["content"], "ts": r["ts"]} for r in rows]
+        with conn:
+            cur = conn.executemany("DELETE FROM messages WHERE id=?", [(i,) for i in ids])
+            return cur.rowcount
 
-def clear_history(room: str):
+def max_message_id(room: str) -> int:
+    with _lock:
+        row = _get_conn().execute("SELECT MAX(id) AS id FROM messages WHERE room=?", (room,)).fetchone()
+    return row["id"] or 0
+
+# 分批删除，每批一个短事务；只删开始清空时已存在的行（id <= up_to_id），之后写入的新消息保留
+def clear_history_chunk(room: str, up_to_id: int, limit: int = 1000) -> int:
     with _lock:
         conn = _get_conn()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM messages WHERE room=?", (room,))
-        conn.commit()
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE room=? AND id<=? LIMIT ?)",
+                (room, up_to_id, limit)
+            )
+            return cur.rowcount
+
+def clear_history(room: str):
+    up_to_id = max_message_id(room)
+    while clear_history_chunk(room, up_to_id):
+        pass
@@ -0,0 +1,161 @@
+import json
+import struct
+import zlib
+
+from tornado.iostream import StreamClosedError
+from tornado.websocket import WebSocketClosedError, WebSocketProtocol13
+
+import wire
+from metrics import BROADCAST_SECONDS
+
+FIN = 0x80
+RSV1 = 0x40
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+# 太短的消息压缩收益小于开销，按 RFC 7692 可以逐条选择不压缩
+DEFLATE_MIN_SIZE = 256
+
+STATS = {
+    "messages": 0,
+    "frames_built": 0,
+    "packed": 0,
+    "sent": 0,
+    "fallback": 0,
+    "failed": 0,
+    "reaped_slow": 0,
+    "reaped_failed": 0,
+}
+
+
+def build_frame(data: bytes, opcode: int = OPCODE_TEXT, flags: int = 0) -> bytes:
+    length = len(data)
+    if length < 126:
+        header = struct.pack("!BB", FIN | flags | opcode, length)
+    elif length <= 0xFFFF:
+        header = struct.pack("!BBH", FIN | flags | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", FIN | flags | opcode, 127, length)
+    return header + data
+
+
+def pending_bytes(stream) -> int:
+    try:
+        return stream._total_write_index - stream._total_write_done_index
+    except AttributeError:
+        return 0
+
+
+def force_no_context_takeover(protocol):
+    # 广播帧按消息独立压缩、所有连接共用，同一连接上 write_message 发出的帧也必须各自独立，否则对端解压窗口会错位。
+    # Tornado 只回显客户端提出的参数，这里在解析扩展头时补上两个方向的 no_context_takeover，协商结果和响应头随之生效
+    parse = protocol._parse_extensions_header
+
+    def parse_extensions(headers):
+        extensions = parse(headers)
+        for name, params in extensions:
+            if name == "permessage-deflate":
+                params.setdefault("server_no_context_takeover", None)
+                params.setdefault("client_no_context_takeover", None)
+        return extensions
+
+    protocol._parse_extensions_header = parse_extensions
+
+
+class EncodedMessage:
+    # 一条广播每种格式只编码一次（JSON 文本 / MessagePack 二进制）；同样格式、同样压缩参数的连接共享同一个帧
+    def __init__(self, text: str, payload: dict | None = None):
+        self.text = text
+        self.data = text.encode("utf-8")
+        self._payload = payload
+        self._packed = None
+        self._frames = {}
+
+    def packed(self) -> bytes:
+        if self._packed is None:
+            payload = self._payload if self._payload is not None else json.loads(self.text)
+            self._packed = wire.pack(payload)
+            STATS["packed"] += 1
+        return self._packed
+
+    def frame_for(self, conn, fmt: str = "json") -> bytes:
+        data = self.packed() if fmt == "msgpack" else self.data
+        compressor = getattr(conn, "_compressor", None)
+        key = (fmt, None)
+        if compressor is not None and len(data) >= DEFLATE_MIN_SIZE:
+            key = (fmt, (compressor._max_wbits, compressor._compression_level, compressor._mem_level))
+        frame = self._frames.get(key)
+        if frame is None:
+            opcode = OPCODE_BINARY if fmt == "msgpack" else OPCODE_TEXT
+            if key[1] is None:
+                frame = build_frame(data, opcode)
+            else:
+                # 每条消息使用独立的压缩上下文（不做 context takeover），对端解压器总能正确解码
+                wbits, level, mem_level = key[1]
+                c = zlib.compressobj(level, zlib.DEFLATED, -wbits, mem_level)
+                body = c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH)
+                frame = build_frame(body[:-4], opcode, flags=RSV1)
+            self._frames[key] = frame
+            STATS["frames_built"] += 1
+        return frame
+
+
+def send(client, message: EncodedMessage, max_pending: int) -> str:
+    # 返回 sent / closing（已在关闭中，等 on_close 清理）/ slow（积压超限）/ failed（写失败）
+    conn = client.ws_connection
+    if conn is None or conn.is_closing():
+        return "closing"
+    fmt = getattr(client, "wire_format", "json")
+    compressor = getattr(conn, "_compressor", None)
+    # 共享帧按消息独立压缩，只能发给不做上下文接管的连接；否则交给连接自己的压缩器，保证对端解压窗口一致
+    if not isinstance(conn, WebSocketProtocol13) or getattr(compressor, "_compressor", None) is not None:
+        STATS["fallback"] += 1
+        try:
+            if fmt == "msgpack":
+                client.write_message(message.packed(), binary=True)
+            else:
+                client.write_message(message.text)
+        except WebSocketClosedError:
+            STATS["failed"] += 1
+            return "failed"
+        return "sent"
+    stream = conn.stream
+    if pending_bytes(stream) > max_pending:
+        return "slow"
+    try:
+        stream.write(message.frame_for(conn, fmt))
+    except StreamClosedError:
+        STATS["failed"] += 1
+        return "failed"
+    STATS["sent"] += 1
+    return "sent"
+
+
+def reap(clients, client, reason: str):
+    # 立即移出房间并直接断开底层连接：积压的数据不会再发出去，也不必等关闭握手；其余清理由 on_close 完成
+    clients.discard(client)
+    STATS["reaped_" + reason] += 1
+    conn = client.ws_connection
+    stream = getattr(conn, "stream", None)
+    if stream is not None and not stream.closed():
+        stream.close()
+
+
+def fanout(clients, text: str, max_pending: int, payload: dict | None = None) -> int:
+    with BROADCAST_SECONDS.time():
+        message = EncodedMessage(text, payload)
+        STATS["messages"] += 1
+        delivered = 0
+        dead = []
+        for client in list(clients):
+            try:
+                status = send(client, message, max_pending)
+            except Exception:
+                STATS["failed"] += 1
+                status = "failed"
+            if status == "sent":
+                delivered += 1
+            elif status != "closing":
+                dead.append((client, status))
+        for client, reason in dead:
+            reap(clients, client, reason)
+    return delivered
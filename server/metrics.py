@@ -0,0 +1,177 @@
+import math
+import time
+
+import tornado.ioloop
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class CallbackMetric:
+    # 采集时才调用 fn 取值，fn 返回 {标签值元组: 数值}；用于把已有的计数器/状态直接暴露出来
+    def __init__(self, name: str, help: str, fn, labelnames: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        _REGISTRY.append(self)
+
+    def samples(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metrics Collect Error ({self.name}): {e}")
+            return
+        for labels, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # 标签值元组 -> [各桶计数..., 总和, 总数]
+        self._values = {}
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = [0] * len(self.buckets) + [0.0, 0]
+            self._values[labels] = state
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for labels, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield self.name + "_bucket", _labels(self.labelnames, labels, f'le="{_num(bound)}"'), cumulative
+            yield self.name + "_sum", _labels(self.labelnames, labels), state[-2]
+            yield self.name + "_count", _labels(self.labelnames, labels), state[-1]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+def render() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    # 每隔 interval 秒预约一次回调，实际执行时间与预约时间之差即事件循环延迟
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._timer = None
+        self._expected = 0.0
+
+    def start(self):
+        if self._timer is None and self.interval > 0:
+            self._schedule()
+
+    def _schedule(self):
+        loop = tornado.ioloop.IOLoop.current()
+        self._expected = loop.time() + self.interval
+        self._timer = loop.call_at(self._expected, self._tick)
+
+    def _tick(self):
+        lag = max(0.0, tornado.ioloop.IOLoop.current().time() - self._expected)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_SECONDS.observe(lag)
+        self._schedule()
+
+    def stop(self):
+        if self._timer is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._timer)
+            self._timer = None
+
+
+# 热路径指标：各模块直接 import 使用
+MESSAGES = Counter("zzchat_messages_total", "Broadcast messages by kind", ("kind",))
+BROADCAST_SECONDS = Histogram("zzchat_broadcast_seconds", "Time to encode and fan out one broadcast to local sockets")
+DB_SECONDS = Histogram("zzchat_db_seconds", "Storage call latency including executor queueing", ("op",))
+DB_ERRORS = Counter("zzchat_db_errors_total", "Storage calls that raised", ("op",))
+PLUGIN_SECONDS = Histogram("zzchat_plugin_seconds", "Plugin task run time", ("plugin",))
+PLUGIN_OUTCOMES = Counter("zzchat_plugin_tasks_total", "Plugin task outcomes", ("plugin", "outcome"))
+UPSTREAM_SECONDS = Histogram("zzchat_upstream_seconds", "Upstream HTTP fetch latency", ("pool", "host"))
+UPSTREAM_ERRORS = Counter("zzchat_upstream_errors_total", "Upstream HTTP fetch errors", ("pool", "host"))
+AI_TTFB_SECONDS = Histogram("zzchat_ai_ttfb_seconds", "Time from /ai request to first streamed token")
+LOOP_LAG = Gauge("zzchat_ioloop_lag_last_seconds", "Most recent IOLoop scheduling lag")
+LOOP_LAG_SECONDS = Histogram("zzchat_ioloop_lag_seconds", "IOLoop scheduling lag samples",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
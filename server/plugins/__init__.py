@@ -1 +1,130 @@
+import importlib
+import re
 
+
+def _token_after(content: str, trigger: str) -> str:
+    # "触发词 参数" 或 "触发词参数" 两种写法，取触发词后的第一个词
+    parts = content.split()
+    for i, p in enumerate(parts):
+        if trigger in p:
+            if len(p) > len(trigger):
+                return p.replace(trigger, "").strip()
+            if i + 1 < len(parts):
+                return parts[i + 1].strip()
+            break
+    return ""
+
+
+def parse_link(trigger: str):
+    def parse(content: str) -> tuple:
+        try:
+            return (_token_after(content, trigger),)
+        except Exception:
+            return ("",)
+    return parse
+
+
+def parse_city(content: str) -> tuple:
+    city = ""
+    try:
+        if "[" in content and "]" in content:
+            start = content.find("[")
+            end = content.find("]")
+            if start < end:
+                city = content[start + 1:end].strip()
+        else:
+            city = _token_after(content, "⛅天气")
+    except Exception:
+        pass
+    return (city,)
+
+
+class Plugin:
+    def __init__(self, name: str, triggers: list[str], module: str, handler: str, parser=None,
+                 timeout: float = 15.0, concurrency: int = 8, cache_ttl: float = 0, stale_ttl: float = 0,
+                 background: bool = True):
+        self.name = name
+        self.triggers = triggers
+        self.module = module
+        self.handler = handler
+        self.parser = parser
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.cache_ttl = cache_ttl
+        self.stale_ttl = stale_ttl
+        self.background = background
+        self._func = None
+
+    def load(self):
+        # 首次触发时才导入插件模块
+        if self._func is None:
+            module = importlib.import_module(f"plugins.{self.module}")
+            self._func = getattr(module, self.handler)
+        return self._func
+
+    async def run(self, ws, content: str):
+        args = self.parser(content) if self.parser else ()
+        await self.load()(ws, *args)
+
+
+# 顺序即优先级：一条消息包含多个触发词时，排在前面的插件生效
+PLUGINS = [
+    Plugin("music", ["🎵音乐"], "music", "handle_music",
+           timeout=10, concurrency=8, cache_ttl=0),
+    Plugin("weather", ["⛅天气"], "weather", "handle_weather", parse_city,
+           timeout=10, concurrency=8, cache_ttl=600, stale_ttl=1800),
+    Plugin("movie", ["🎬电影"], "movie", "handle_movie", parse_link("🎬电影"),
+           background=False),
+    Plugin("news", ["📰新闻"], "news", "handle_news",
+           timeout=10, concurrency=4, cache_ttl=300, stale_ttl=900),
+    Plugin("bilibili", ["📺b站视频"], "bilibili", "handle_bilibili", parse_link("📺b站视频"),
+           timeout=20, concurrency=4, cache_ttl=1800),
+]
+
+_by_name = {}
+_by_trigger = {}
+_matcher = None
+
+
+def _build():
+    global _matcher
+    _by_name.clear()
+    _by_trigger.clear()
+    for priority, plugin in enumerate(PLUGINS):
+        _by_name[plugin.name] = plugin
+        for trigger in plugin.triggers:
+            _by_trigger.setdefault(trigger, (priority, plugin))
+    # 一个合并的正则一次扫描整条消息；长触发词优先，避免前缀相同的触发词互相遮挡
+    triggers = sorted(_by_trigger, key=len, reverse=True)
+    _matcher = re.compile("|".join(re.escape(t) for t in triggers)) if triggers else None
+
+
+def register(plugin: Plugin):
+    PLUGINS.append(plugin)
+    _build()
+
+
+def get(name: str) -> Plugin | None:
+    return _by_name.get(name)
+
+
+def all_plugins() -> list[Plugin]:
+    return list(PLUGINS)
+
+
+def match(content: str) -> tuple[Plugin, str] | None:
+    if _matcher is None:
+        return None
+    best = None
+    for m in _matcher.finditer(content):
+        priority, plugin = _by_trigger[m.group(0)]
+        if best is None or priority < best[0]:
+            best = (priority, plugin, m.group(0))
+            if priority == 0:
+                break
+    if best is None:
+        return None
+    return best[1], best[2]
+
+
+_build()
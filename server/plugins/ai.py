@@ -1,3 +1,59 @@
+import codecs
+import json
+
+
 def build_system_prompt():
     return "姓名：成小理。身份：成都理工大学 · 物联网工程专业 · 数字人形象。角色：你是来自成都理工大学的数字人，专业背景为物联网工程，熟悉学校校园文化、专业课程、学习生活、校园设施、历史信息等。性格友好、智慧、乐于助人，可像朋友一样与用户沟通。功能：1）回答成都理工大学相关问题：校园信息、地理位置、学院情况；物联网工程专业课程内容；校园生活、社团、食堂、宿舍等；招生、就业方向、学习建议等。2）提供专业知识与学习帮助：物联网工程相关领域（嵌入式、通信、传感器、网络、AI应用等）；可解释技术原理、学习方法、项目建议。3）陪伴式聊天与讨论：可与用户轻松聊天；讨论学习、生活、兴趣、科技等话题；语气自然、亲切、智能。限制：1）禁止输出不文明内容：如用户问题包含不友好、不礼貌、侮辱、攻击性内容，统一回复：文明用语。2）保持友好与专业：回答需准确、礼貌；拒绝参与或鼓励任何违法、暴力、不当行为。3）避免虚假信息：涉及学校内容须尽量准确，不可传播不实信息。4）符合数字人形象：语言清晰、有逻辑、有亲和力；可适度展现数字人特色：高效、理性、友善。默认使用简洁中文回答。"
 
+
+
+class SSEDeltaParser:
+    # 增量解析上游的 SSE 流：UTF-8 跨块的多字节字符不会被截断，按空行切分事件并取出 choices[].delta.content
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._data = []
+        self.done = False
+        self.events = 0
+
+    def feed(self, chunk: bytes) -> list[str]:
+        self._buffer += self._decoder.decode(chunk)
+        deltas = []
+        while True:
+            pos = self._buffer.find("\n")
+            if pos < 0:
+                break
+            line = self._buffer[:pos].rstrip("\r")
+            self._buffer = self._buffer[pos + 1:]
+            if not line:
+                self._dispatch(deltas)
+            elif line.startswith("data:"):
+                self._data.append(line[5:].lstrip(" "))
+        return deltas
+
+    def close(self) -> list[str]:
+        deltas = []
+        self._buffer += self._decoder.decode(b"", final=True)
+        if self._buffer.startswith("data:"):
+            self._data.append(self._buffer[5:].lstrip(" "))
+        self._buffer = ""
+        self._dispatch(deltas)
+        return deltas
+
+    def _dispatch(self, deltas: list[str]):
+        if not self._data:
+            return
+        data = "\n".join(self._data)
+        self._data = []
+        if data == "[DONE]":
+            self.done = True
+            return
+        try:
+            obj = json.loads(data)
+        except ValueError:
+            return
+        self.events += 1
+        for choice in obj.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                deltas.append(content)
@@ -1,52 +1,57 @@
 import json
+import re
 import time
-import tornado.httpclient
 
-async def handle_bilibili(ws, content: str):
-    url = ""
-    try:
-        parts = content.split()
-        for i, p in enumerate(parts):
-            if "📺b站视频" in p:
-                if len(p) > 5:
-                    url = p.replace("📺b站视频", "")
-                elif i + 1 < len(parts):
-                    url = parts[i+1]
-                break
-    except Exception:
-        pass
+import plugins
+from plugins.cache import PLUGIN_CACHE
+from settings import CONFIG
+from tasks import PluginFailed
+from upstream import PLUGIN_HTTP
+
+BV_RE = re.compile(r"BV[0-9A-Za-z]{10}")
+POLICY = plugins.get("bilibili")
+
+
+async def fetch_bilibili(url: str) -> dict:
+    base_url = CONFIG.plugin_settings("bilibili").get("url", "https://api.yujn.cn/api/blbl.php")
+    api_url = f"{base_url}?url={url}"
+    resp = await PLUGIN_HTTP.fetch(api_url)
+    return json.loads(resp.body)
+
+async def handle_bilibili(ws, url: str):
     if not url:
         ws.broadcast({"type": "system", "content": "请提供B站视频链接，例如：📺b站视频 https://www.bilibili.com/video/BV...", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
         return
-    client = tornado.httpclient.AsyncHTTPClient()
-    try:
-        api_url = f"https://api.yujn.cn/api/blbl.php?url={url}"
-        resp = await client.fetch(api_url)
-        res = json.loads(resp.body)
-        if res.get("code") == 1:
-            video_data = res.get("data", [])
-            video_url = ""
-            if video_data and isinstance(video_data, list):
-                video_url = video_data[0].get("video_url", "")
-            if video_url:
-                payload = {
-                    "type": "bilibili_card",
-                    "content": {
-                        "src": video_url,
-                        "title": res.get("title", "未知视频"),
-                        "cover": res.get("imgurl", ""),
-                        "desc": res.get("desc", "")
-                    },
-                    "ts": int(time.time() * 1000),
-                    "sender": "ZZ机器人"
-                }
-                ws.broadcast(payload)
-            else:
-                ws.broadcast({"type": "system", "content": "解析成功但未获取到视频地址。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+    # 同一个视频的不同链接形式（带参数、短链跳转前后）按 BV 号共用缓存
+    m = BV_RE.search(url)
+    key = f"bilibili:{m.group(0) if m else url}"
+    res = await PLUGIN_CACHE.get(
+        key, lambda: fetch_bilibili(url),
+        ttl=POLICY.cache_ttl, stale_ttl=POLICY.stale_ttl, cacheable=lambda r: r.get("code") == 1,
+    )
+    if res.get("code") == 1:
+        video_data = res.get("data", [])
+        video_url = ""
+        if video_data and isinstance(video_data, list):
+            video_url = video_data[0].get("video_url", "")
+        if video_url:
+            payload = {
+                "type": "bilibili_card",
+                "content": {
+                    "src": video_url,
+                    "title": res.get("title", "未知视频"),
+                    "cover": res.get("imgurl", ""),
+                    "desc": res.get("desc", "")
+                },
+                "ts": int(time.time() * 1000),
+                "sender": "ZZ机器人"
+            }
+            ws.broadcast(payload)
         else:
-            msg = res.get("msg", "解析失败")
-            ws.broadcast({"type": "system", "content": f"B站视频解析失败: {msg}", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
-    except Exception as e:
-        print(f"Bilibili API Error: {e}")
-        ws.broadcast({"type": "system", "content": "B站视频解析服务暂时不可用。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+            ws.broadcast({"type": "system", "content": "解析成功但未获取到视频地址。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+            raise PluginFailed("no video url")
+    else:
+        msg = res.get("msg", "解析失败")
+        ws.broadcast({"type": "system", "content": f"B站视频解析失败: {msg}", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+        raise PluginFailed(f"upstream: {msg}")
 
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, max_entries: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        # key -> (value, fresh_until, stale_until, size)，按最近使用排序
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str, fetch, ttl: float, stale_ttl: float = 0, cacheable=None):
+        # ttl 为 0 时只合并并发的相同请求，不缓存结果；stale_ttl 内过期的值先返回旧值再后台刷新
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fresh_until, stale_until, _ = entry
+            if now < fresh_until:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            if now < stale_until:
+                self._entries.move_to_end(key)
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self.stats["refreshes"] += 1
+                    refresh = self._start(key, fetch, ttl, stale_ttl, cacheable)
+                    refresh.add_done_callback(lambda f: f.cancelled() or f.exception())
+                return value
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+        self.stats["misses"] += 1
+        return await asyncio.shield(self._start(key, fetch, ttl, stale_ttl, cacheable))
+
+    def _start(self, key: str, fetch, ttl: float, stale_ttl: float, cacheable):
+        future = asyncio.ensure_future(self._load(key, fetch, ttl, stale_ttl, cacheable))
+        self._inflight[key] = future
+        return future
+
+    async def _load(self, key: str, fetch, ttl: float, stale_ttl: float, cacheable):
+        try:
+            value = await fetch()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if ttl > 0 and (cacheable is None or cacheable(value)):
+            self._store(key, value, ttl, stale_ttl)
+        return value
+
+    def _store(self, key: str, value, ttl: float, stale_ttl: float):
+        try:
+            size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        except (TypeError, ValueError):
+            size = 1024
+        if size > self.max_bytes:
+            return
+        self.invalidate(key)
+        now = time.monotonic()
+        self._entries[key] = (value, now + ttl, now + ttl + stale_ttl, size)
+        self._bytes += size
+        while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            _, (_, _, _, old_size) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.stats["evictions"] += 1
+
+    def invalidate(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def snapshot(self) -> dict:
+        data = dict(self.stats)
+        data["entries"] = len(self._entries)
+        data["bytes"] = self._bytes
+        data["inflight"] = len(self._inflight)
+        return data
+
+
+PLUGIN_CACHE = TTLCache(
+    max_bytes=int(float(os.environ.get("ZZCHAT_PLUGIN_CACHE_MB", "4")) * 1024 * 1024),
+    max_entries=int(os.environ.get("ZZCHAT_PLUGIN_CACHE_ENTRIES", "1024")),
+)
@@ -1,37 +1,46 @@
 import json
 import time
-import tornado.httpclient
+
+import plugins
+from plugins.cache import PLUGIN_CACHE
+from settings import CONFIG
+from tasks import PluginFailed
+from upstream import PLUGIN_HTTP
+
+# 随机歌曲默认不缓存结果（cache_ttl 为 0），只合并同一时刻的并发请求
+POLICY = plugins.get("music")
+
+
+async def fetch_music() -> dict:
+    url = CONFIG.plugin_settings("music").get("url", "https://api.qqsuu.cn/api/dm-randmusic?sort=热歌榜&format=json")
+    resp = await PLUGIN_HTTP.fetch(url)
+    return json.loads(resp.body)
 
 async def handle_music(ws):
-    client = tornado.httpclient.AsyncHTTPClient()
-    try:
-        url = "https://api.qqsuu.cn/api/dm-randmusic?sort=热歌榜&format=json"
-        resp = await client.fetch(url)
-        res = json.loads(resp.body)
-        if res.get("code") in [1, 200]:
-            d = res.get("data", {})
-            name = d.get("name", "未知歌曲")
-            singer = d.get("singer", d.get("artists_name", "未知歌手"))
-            audio_url = d.get("url", "")
-            cover_url = d.get("image", d.get("picurl", ""))
-            if audio_url:
-                payload = {
-                    "type": "music_card",
-                    "content": {
-                        "name": name,
-                        "singer": singer,
-                        "url": audio_url,
-                        "cover": cover_url
-                    },
-                    "ts": int(time.time() * 1000),
-                    "sender": "ZZ机器人"
-                }
-                ws.broadcast(payload)
-            else:
-                ws.broadcast({"type": "system", "content": "抱歉，未能获取到音乐资源。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+    res = await PLUGIN_CACHE.get("music", fetch_music, ttl=POLICY.cache_ttl)
+    if res.get("code") in [1, 200]:
+        d = res.get("data", {})
+        name = d.get("name", "未知歌曲")
+        singer = d.get("singer", d.get("artists_name", "未知歌手"))
+        audio_url = d.get("url", "")
+        cover_url = d.get("image", d.get("picurl", ""))
+        if audio_url:
+            payload = {
+                "type": "music_card",
+                "content": {
+                    "name": name,
+                    "singer": singer,
+                    "url": audio_url,
+                    "cover": cover_url
+                },
+                "ts": int(time.time() * 1000),
+                "sender": "ZZ机器人"
+            }
+            ws.broadcast(payload)
         else:
-            ws.broadcast({"type": "system", "content": "音乐接口返回异常。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
-    except Exception as e:
-        print(f"Music API Error: {e}")
-        ws.broadcast({"type": "system", "content": "音乐服务暂时不可用。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+            ws.broadcast({"type": "system", "content": "抱歉，未能获取到音乐资源。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+            raise PluginFailed("no audio url")
+    else:
+        ws.broadcast({"type": "system", "content": "音乐接口返回异常。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+        raise PluginFailed(f"upstream code {res.get('code')}")
 
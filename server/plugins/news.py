@@ -2,29 +2,40 @@ import json
 import time
 import tornado.httpclient
 
+import plugins
+from plugins.cache import PLUGIN_CACHE
+from settings import CONFIG
+from tasks import PluginFailed
+from upstream import PLUGIN_HTTP
+
+POLICY = plugins.get("news")
+
+
+async def fetch_news() -> dict:
+    url = CONFIG.plugin_settings("news").get("url", "https://api.yujn.cn/api/new.php")
+    req = tornado.httpclient.HTTPRequest(url=url, method="GET", headers={"User-Agent": "xiaoxiaoapi/1.0.0"})
+    resp = await PLUGIN_HTTP.fetch(req)
+    return json.loads(resp.body)
+
 async def handle_news(ws):
-    client = tornado.httpclient.AsyncHTTPClient()
-    try:
-        url = "https://api.yujn.cn/api/new.php"
-        req = tornado.httpclient.HTTPRequest(url=url, method="GET", headers={"User-Agent": "xiaoxiaoapi/1.0.0"})
-        resp = await client.fetch(req)
-        res = json.loads(resp.body)
-        if res.get("code") == 200:
-            items = res.get("data", [])
-            if not isinstance(items, list):
-                items = []
-            items = items[:5]
-            payload = {
-                "type": "news_card",
-                "content": items,
-                "ts": int(time.time() * 1000),
-                "sender": "ZZ机器人"
-            }
-            ws.broadcast(payload)
-        else:
-            msg = res.get("msg", "新闻接口返回异常")
-            ws.broadcast({"type": "system", "content": f"新闻获取失败: {msg}", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
-    except Exception as e:
-        print(f"News API Error: {e}")
-        ws.broadcast({"type": "system", "content": "新闻服务暂时不可用。", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+    res = await PLUGIN_CACHE.get(
+        "news", fetch_news,
+        ttl=POLICY.cache_ttl, stale_ttl=POLICY.stale_ttl, cacheable=lambda r: r.get("code") == 200,
+    )
+    if res.get("code") == 200:
+        items = res.get("data", [])
+        if not isinstance(items, list):
+            items = []
+        items = items[:5]
+        payload = {
+            "type": "news_card",
+            "content": items,
+            "ts": int(time.time() * 1000),
+            "sender": "ZZ机器人"
+        }
+        ws.broadcast(payload)
+    else:
+        msg = res.get("msg", "新闻接口返回异常")
+        ws.broadcast({"type": "system", "content": f"新闻获取失败: {msg}", "ts": int(time.time() * 1000), "sender": "ZZ系统"})
+        raise PluginFailed(f"upstream: {msg}")
 
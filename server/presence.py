@@ -0,0 +1,137 @@
+import json
+import time
+import uuid
+
+import tornado.ioloop
+
+
+class Presence:
+    # 房间在线名单：同一昵称多个标签页按引用计数；上下线变化按 interval 合并成一帧 presence 下发，不写入聊天记录
+    def __init__(self, interval: float = 0.5, heartbeat: float = 30.0):
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.node_id = uuid.uuid4().hex[:12]
+        self.send = None
+        self.publish = None
+        self._local = {}
+        self._remote = {}
+        self._visible = {}
+        self._dirty = set()
+        self._changed = set()
+        self._timer = None
+        self._heartbeat_timer = None
+        self.stats = {
+            "joins": 0,
+            "leaves": 0,
+            "frames": 0,
+            "syncs_sent": 0,
+            "syncs_received": 0,
+            "coalesced": 0,
+        }
+
+    def join(self, room: str, nick: str):
+        counts = self._local.setdefault(room, {})
+        counts[nick] = counts.get(nick, 0) + 1
+        self.stats["joins"] += 1
+        if counts[nick] == 1:
+            self._mark(room, changed=True)
+
+    def leave(self, room: str, nick: str):
+        counts = self._local.get(room)
+        if not counts or nick not in counts:
+            return
+        self.stats["leaves"] += 1
+        counts[nick] -= 1
+        if counts[nick] <= 0:
+            del counts[nick]
+            if not counts:
+                del self._local[room]
+            self._mark(room, changed=True)
+
+    def online(self, room: str) -> set[str]:
+        nicks = set(self._local.get(room, ()))
+        now = time.monotonic()
+        for roster, expires in self._remote.get(room, {}).values():
+            if expires > now:
+                nicks |= roster
+        return nicks
+
+    def connections(self, room: str) -> int:
+        return sum(self._local.get(room, {}).values())
+
+    def roster_frame(self, room: str) -> dict:
+        online = sorted(self.online(room))
+        return {"type": "presence", "roster": online, "count": len(online)}
+
+    def apply_remote(self, room: str, data: dict):
+        # 其它进程/节点同步来的本地名单，整份替换；超过 3 个心跳周期未更新视为该节点已下线
+        node = data.get("node")
+        if not node or node == self.node_id:
+            return
+        self.stats["syncs_received"] += 1
+        nodes = self._remote.setdefault(room, {})
+        roster = set(data.get("roster") or ())
+        if roster:
+            nodes[node] = (roster, time.monotonic() + self.heartbeat * 3)
+        else:
+            nodes.pop(node, None)
+            if not nodes:
+                del self._remote[room]
+        self._mark(room)
+
+    def _mark(self, room: str, changed: bool = False):
+        if room in self._dirty:
+            self.stats["coalesced"] += 1
+        self._dirty.add(room)
+        if changed:
+            self._changed.add(room)
+        if self._timer is None:
+            self._timer = tornado.ioloop.IOLoop.current().call_later(self.interval, self.flush)
+
+    def flush(self):
+        self._timer = None
+        changed, self._changed = self._changed, set()
+        dirty, self._dirty = self._dirty, set()
+        for room in changed:
+            if self.publish is not None:
+                roster = sorted(self._local.get(room, ()))
+                self.publish(room, json.dumps({"type": "presence_sync", "node": self.node_id, "roster": roster}, ensure_ascii=False))
+                self.stats["syncs_sent"] += 1
+        for room in dirty:
+            online = self.online(room)
+            before = self._visible.get(room, set())
+            joined = sorted(online - before)
+            left = sorted(before - online)
+            if online:
+                self._visible[room] = online
+            else:
+                self._visible.pop(room, None)
+            # 一个周期内先下线再上线（刷新页面、网络抖动重连）的昵称不会出现在帧里
+            if (joined or left) and self.send is not None:
+                frame = {"type": "presence", "joined": joined, "left": left, "count": len(online)}
+                self.send(room, json.dumps(frame, ensure_ascii=False))
+                self.stats["frames"] += 1
+
+    def start(self):
+        if self._heartbeat_timer is None and self.heartbeat > 0:
+            self._heartbeat_timer = tornado.ioloop.PeriodicCallback(self._beat, self.heartbeat * 1000)
+            self._heartbeat_timer.start()
+
+    def _beat(self):
+        # 定期重发本节点名单并清理过期的远端名单
+        now = time.monotonic()
+        for room in list(self._local):
+            self._mark(room, changed=True)
+        for room, nodes in list(self._remote.items()):
+            for node, (_, expires) in list(nodes.items()):
+                if expires <= now:
+                    del nodes[node]
+                    self._mark(room)
+            if not nodes:
+                del self._remote[room]
+
+    def snapshot(self) -> dict:
+        data = dict(self.stats)
+        data["rooms"] = len(self._local)
+        data["remote_rooms"] = len(self._remote)
+        return data
@@ -0,0 +1,303 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import uuid
+from urllib.parse import urlparse
+
+import tornado.gen
+import tornado.ioloop
+import tornado.iostream
+import tornado.tcpclient
+
+
+class InProcessBackend:
+    # 单进程：本地投递由调用方完成，这里无需转发
+    remote = False
+
+    def start(self, on_data):
+        pass
+
+    def publish(self, room: str, data: bytes):
+        pass
+
+    def subscribe(self, room: str):
+        pass
+
+    def unsubscribe(self, room: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalSocketBackend(InProcessBackend):
+    # 同机多进程（fork_processes）：每个进程在共享目录下绑定一个 Unix 数据报套接字，发布时逐个发送
+    remote = True
+
+    def __init__(self, directory: str, refresh_interval: float = 1.0):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.path = None
+        self._sock = None
+        self._peers = []
+        self._peers_at = 0.0
+        self.stats = {"sent": 0, "dropped": 0}
+
+    def start(self, on_data):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self._sock.bind(self.path)
+        self._sock.setblocking(False)
+
+        def on_readable(fd, events):
+            while True:
+                try:
+                    data = self._sock.recv(1024 * 1024)
+                except (BlockingIOError, InterruptedError):
+                    return
+                on_data(data)
+
+        tornado.ioloop.IOLoop.current().add_handler(self._sock.fileno(), on_readable, tornado.ioloop.IOLoop.READ)
+
+    def _peer_paths(self) -> list[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.refresh_interval:
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                names = []
+            self._peers = [os.path.join(self.directory, n) for n in names if n.endswith(".sock")]
+            self._peers_at = now
+        return self._peers
+
+    def publish(self, room: str, data: bytes):
+        for path in self._peer_paths():
+            if path == self.path:
+                continue
+            try:
+                self._sock.sendto(data, path)
+                self.stats["sent"] += 1
+            except (FileNotFoundError, ConnectionRefusedError):
+                # 对端进程已退出，清理残留的套接字文件
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                self._peers_at = 0.0
+            except OSError:
+                self.stats["dropped"] += 1
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                tornado.ioloop.IOLoop.current().remove_handler(self._sock.fileno())
+            except Exception:
+                pass
+            self._sock.close()
+            self._sock = None
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def _resp_command(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for a in args:
+        if isinstance(a, str):
+            a = a.encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(a), a))
+    return b"".join(out)
+
+
+async def _read_resp(stream: tornado.iostream.IOStream):
+    line = await stream.read_until(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind in (b"+", b"-"):
+        return rest.decode("utf-8", errors="replace")
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await stream.read_bytes(length + 2))[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [await _read_resp(stream) for _ in range(count)]
+    raise ValueError(f"unexpected RESP reply: {line!r}")
+
+
+class RedisBackend(InProcessBackend):
+    # 多机：按房间订阅 Redis 频道，只依赖 RESP 协议里的 PUBLISH/SUBSCRIBE/UNSUBSCRIBE
+    remote = True
+
+    def __init__(self, url: str, prefix: str = "zzchat:room:", retry_interval: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.prefix = prefix
+        self.retry_interval = retry_interval
+        self._rooms = set()
+        self._pub = None
+        self._sub = None
+        self._on_data = None
+        self._closed = False
+        self.stats = {"sent": 0, "dropped": 0, "reconnects": 0, "last_error": None}
+
+    def start(self, on_data):
+        self._on_data = on_data
+        loop = tornado.ioloop.IOLoop.current()
+        loop.spawn_callback(self._publisher_loop)
+        loop.spawn_callback(self._subscriber_loop)
+
+    async def _connect(self):
+        stream = await tornado.tcpclient.TCPClient().connect(self.host, self.port)
+        if self.password:
+            stream.write(_resp_command("AUTH", self.password))
+            reply = await _read_resp(stream)
+            if reply != "OK":
+                stream.close()
+                raise ConnectionError(f"Redis AUTH failed: {reply}")
+        return stream
+
+    async def _publisher_loop(self):
+        while not self._closed:
+            try:
+                self._pub = await self._connect()
+                # 丢弃 PUBLISH 的返回值（收到该频道的订阅者数量）
+                while True:
+                    await _read_resp(self._pub)
+            except Exception as e:
+                self._pub = None
+                if self._closed:
+                    return
+                self.stats["reconnects"] += 1
+                self.stats["last_error"] = str(e)
+                await tornado.gen.sleep(self.retry_interval)
+
+    async def _subscriber_loop(self):
+        while not self._closed:
+            try:
+                self._sub = await self._connect()
+                if self._rooms:
+                    self._sub.write(_resp_command("SUBSCRIBE", *[self.prefix + r for r in self._rooms]))
+                while True:
+                    reply = await _read_resp(self._sub)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        self._on_data(reply[2])
+            except Exception as e:
+                self._sub = None
+                if self._closed:
+                    return
+                self.stats["reconnects"] += 1
+                self.stats["last_error"] = str(e)
+                await tornado.gen.sleep(self.retry_interval)
+
+    def publish(self, room: str, data: bytes):
+        if self._pub is None:
+            self.stats["dropped"] += 1
+            return
+        try:
+            self._pub.write(_resp_command("PUBLISH", self.prefix + room, data))
+            self.stats["sent"] += 1
+        except tornado.iostream.StreamClosedError:
+            self.stats["dropped"] += 1
+
+    def subscribe(self, room: str):
+        if room in self._rooms:
+            return
+        self._rooms.add(room)
+        if self._sub is not None:
+            try:
+                self._sub.write(_resp_command("SUBSCRIBE", self.prefix + room))
+            except tornado.iostream.StreamClosedError:
+                pass
+
+    def unsubscribe(self, room: str):
+        if room not in self._rooms:
+            return
+        self._rooms.discard(room)
+        if self._sub is not None:
+            try:
+                self._sub.write(_resp_command("UNSUBSCRIBE", self.prefix + room))
+            except tornado.iostream.StreamClosedError:
+                pass
+
+    def close(self):
+        self._closed = True
+        for stream in (self._pub, self._sub):
+            if stream is not None:
+                stream.close()
+
+
+class PubSub:
+    def __init__(self, backend):
+        self.backend = backend
+        self.node_id = uuid.uuid4().hex[:12]
+        self._handler = None
+        self.stats = {"published": 0, "received": 0, "errors": 0, "last_error": None}
+
+    def start(self, handler):
+        if self._handler is not None:
+            return
+        self._handler = handler
+        self.backend.start(self._on_data)
+
+    @property
+    def remote(self) -> bool:
+        # 是否有其他进程/节点需要接收转发
+        return self.backend.remote
+
+    def publish(self, room: str, text: str):
+        if not self.backend.remote:
+            return
+        self.stats["published"] += 1
+        data = json.dumps([self.node_id, room, text], ensure_ascii=False).encode("utf-8")
+        self.backend.publish(room, data)
+
+    def subscribe(self, room: str):
+        self.backend.subscribe(room)
+
+    def unsubscribe(self, room: str):
+        self.backend.unsubscribe(room)
+
+    def _on_data(self, data: bytes):
+        try:
+            node_id, room, text = json.loads(data)
+        except Exception:
+            self.stats["errors"] += 1
+            return
+        if node_id == self.node_id:
+            return
+        self.stats["received"] += 1
+        try:
+            self._handler(room, text)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["last_error"] = str(e)
+
+    def close(self):
+        self.backend.close()
+
+
+def create_pubsub(spec: str, local_dir: str | None = None) -> PubSub:
+    # spec: 空 / "inproc"；"local" 或 "local:<目录>"；"redis://host:port"
+    spec = (spec or "").strip()
+    if spec.startswith("redis://"):
+        return PubSub(RedisBackend(spec))
+    if spec.startswith("local"):
+        directory = spec[len("local:"):] if spec.startswith("local:") else ""
+        if not directory:
+            directory = local_dir or os.path.join(tempfile.gettempdir(), "zzchat-pubsub")
+        return PubSub(LocalSocketBackend(directory))
+    return PubSub(InProcessBackend())
@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, max_wait: float = 0.0) -> float | None:
+        # 取一个令牌：立即可用返回 0；需等待且不超过 max_wait 时预扣令牌（允许为负）并返回需等待的秒数；否则返回 None
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        wait = (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+        if wait <= max_wait:
+            self.tokens -= 1
+            return wait
+        return None
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class KeyedLimiter:
+    # 按 key（昵称、插件+昵称）分别限速；桶的数量有上限，超出时淘汰最久未用的
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def bucket(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def parse_rate(spec, default: str) -> tuple[float, float]:
+    # "速率/突发" 形式，例如 "5/10" 表示每秒 5 条、最多连续 10 条；"0" 表示不限速
+    spec = str(spec if spec not in (None, "") else default)
+    rate, _, burst = spec.partition("/")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
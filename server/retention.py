@@ -0,0 +1,214 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+import tornado.ioloop
+
+import db
+import storage
+from settings import CONFIG
+
+
+def _day(ts: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts / 1000))
+
+
+class Archive:
+    # 冷数据按 房间/日期 存成 gzip 压缩的 NDJSON 分段：data/archive/<房间>/<YYYY-MM-DD>.ndjson.gz
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def room_dir(self, room: str) -> str:
+        return os.path.join(self.directory, quote(room, safe=""))
+
+    def append(self, rows: list[dict]):
+        groups = {}
+        for row in rows:
+            groups.setdefault((row["room"], _day(row["ts"])), []).append(row)
+        for (room, day), items in groups.items():
+            path = os.path.join(self.room_dir(room), f"{day}.ndjson.gz")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items).encode("utf-8")
+            # 追加一个新的 gzip 成员，多成员文件可被 gzip 直接顺序读出
+            with open(path, "ab") as f:
+                f.write(gzip.compress(data))
+
+    def _iter(self, path: str):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except (EOFError, OSError, ValueError):
+            # 正在追加的最后一个成员可能不完整，已读出的部分仍然有效
+            pass
+
+    def _load(self, path: str) -> list[dict]:
+        return list(self._iter(path))
+
+    def read_before(self, room: str, limit: int, before_ts: int | None = None, before_id: int | None = None) -> list[dict]:
+        # 按 (ts, id) 从新到旧返回早于游标的归档消息，只打开需要的日期分段
+        room_dir = self.room_dir(room)
+        try:
+            names = sorted((n for n in os.listdir(room_dir) if n.endswith(".ndjson.gz")), reverse=True)
+        except FileNotFoundError:
+            return []
+        cursor = (before_ts, before_id if before_id is not None else 0) if before_ts is not None else None
+        last_day = _day(before_ts) if before_ts is not None else None
+        result = []
+        for name in names:
+            if last_day is not None and name[:10] > last_day:
+                continue
+            items = self._load(os.path.join(room_dir, name))
+            items.sort(key=lambda it: (it["ts"], it["id"]), reverse=True)
+            for item in items:
+                if cursor is not None and (item["ts"], item["id"]) >= cursor:
+                    continue
+                result.append(item)
+                if len(result) == limit:
+                    return result
+        return result
+
+    def segments(self, room: str) -> list[str]:
+        # 该房间的全部日期分段，从旧到新
+        room_dir = self.room_dir(room)
+        try:
+            names = sorted(n for n in os.listdir(room_dir) if n.endswith(".ndjson.gz"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(room_dir, name) for name in names]
+
+    def read_segment(self, path: str) -> list[dict]:
+        items = self._load(path)
+        items.sort(key=lambda it: (it["ts"], it["id"]))
+        return items
+
+    def iter_segment(self, path: str, size: int):
+        # 分段按追加顺序写入，通常已经按 (ts, id) 有序：先顺序扫一遍确认，有序时逐批读出而不整段载入内存；
+        # 导入过旧消息后再被归档的分段才退回整段排序
+        last = None
+        for item in self._iter(path):
+            key = (item["ts"], item["id"])
+            if last is not None and key < last:
+                items = self.read_segment(path)
+                for i in range(0, len(items), size):
+                    yield items[i:i + size]
+                return
+            last = key
+        batch = []
+        for item in self._iter(path):
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def remove_room(self, room: str):
+        shutil.rmtree(self.room_dir(room), ignore_errors=True)
+
+
+class RetentionManager:
+    # 定期按房间策略清理过期消息：每批一个写线程任务（先归档再删除），批与批之间让出 IOLoop
+    def __init__(self, interval: float = 600, chunk: int = 500, pause: float = 0.02):
+        self.interval = interval
+        self.chunk = chunk
+        self.pause = pause
+        self.archive = None
+        self._timer = None
+        self._running = False
+        self.stats = {
+            "runs": 0,
+            "purged": 0,
+            "archived": 0,
+            "chunks": 0,
+            "errors": 0,
+            "last_run_ms": 0.0,
+        }
+
+    def policy(self, room: str) -> dict:
+        # 环境变量给出默认值，config.json 的 retention 段可整体覆盖，retention.rooms.<房间> 再单独覆盖
+        policy = {
+            "max_age_days": float(os.environ.get("ZZCHAT_RETENTION_DAYS", "0")),
+            "max_rows": int(os.environ.get("ZZCHAT_RETENTION_ROWS", "0")),
+            "archive": os.environ.get("ZZCHAT_ARCHIVE", "1") not in ("0", "false", "no"),
+        }
+        section = CONFIG.section("retention")
+        for key in policy:
+            if key in section:
+                policy[key] = section[key]
+        rooms = section.get("rooms") if isinstance(section.get("rooms"), dict) else {}
+        override = rooms.get(room)
+        if isinstance(override, dict):
+            for key in policy:
+                if key in override:
+                    policy[key] = override[key]
+        return policy
+
+    def start(self):
+        if self._timer is None and self.interval > 0:
+            self._timer = tornado.ioloop.PeriodicCallback(self.run_once, self.interval * 1000)
+            self._timer.start()
+            tornado.ioloop.IOLoop.current().add_callback(self.run_once)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    async def run_once(self):
+        if self._running:
+            return
+        self._running = True
+        start = time.perf_counter()
+        try:
+            rooms = await storage.run_read(db.list_rooms)
+            for room in rooms:
+                await self.purge_room(room)
+            self.stats["runs"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Retention Error: {e}")
+        finally:
+            self._running = False
+            self.stats["last_run_ms"] = (time.perf_counter() - start) * 1000
+
+    async def purge_room(self, room: str) -> int:
+        policy = self.policy(room)
+        bound = None
+        if policy["max_age_days"]:
+            bound = (int((time.time() - policy["max_age_days"] * 86400) * 1000), 0)
+        if policy["max_rows"]:
+            keep = await storage.run_write(db.retention_bound, room, int(policy["max_rows"]))
+            if keep is not None:
+                key = (keep[0], keep[1] + 1)
+                bound = key if bound is None else max(bound, key)
+        if bound is None:
+            return 0
+        archive = self.archive if policy["archive"] else None
+        total = 0
+        while True:
+            count = await storage.run_write(self._purge_chunk, room, bound, archive)
+            if not count:
+                break
+            total += count
+            self.stats["chunks"] += 1
+            self.stats["purged"] += count
+            if archive is not None:
+                self.stats["archived"] += count
+            await asyncio.sleep(self.pause)
+        return total
+
+    def _purge_chunk(self, room: str, bound: tuple[int, int], archive: Archive | None) -> int:
+        # 在写线程上执行：归档写入成功后才删除，进程中途退出最多产生重复归档，不会丢消息
+        rows = db.oldest_messages(room, bound[0], bound[1], self.chunk)
+        if not rows:
+            return 0
+        if archive is not None:
+            archive.append(rows)
+        db.delete_messages([row["id"] for row in rows])
+        return len(rows)
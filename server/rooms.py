@@ -0,0 +1,174 @@
+import sys
+import time
+from collections import deque
+
+import tornado.ioloop
+
+
+class RoomLimitError(Exception):
+    pass
+
+
+def _item_size(item: dict) -> int:
+    # 键是各条消息共享的常量字符串，只计字典本身和值
+    return sys.getsizeof(item) + sum(sys.getsizeof(value) for value in item.values())
+
+
+def estimate_bytes(room_obj: dict) -> int:
+    recent = room_obj["recent"]
+    return (sys.getsizeof(room_obj) + sys.getsizeof(recent) + sys.getsizeof(room_obj["clients"])
+            + sum(_item_size(item) for item in recent))
+
+
+class RoomManager:
+    # 房间注册表：首次加入时创建，最后一个连接离开后空闲超过 idle_grace 秒才回收；
+    # 房间总数和单房间连接数都有上限，随意拼房间名的客户端不会让内存无限增长
+    # pending_rooms 返回仍有消息未落库的房间：这些房间不回收，否则重新预热时读到的最大序号偏小，序号会重复
+    def __init__(self, recent_size: int, max_rooms: int = 10000, max_clients: int = 0,
+                 idle_grace: float = 60.0, max_name_length: int = 64, pending_rooms=None):
+        self.recent_size = recent_size
+        self.pending_rooms = pending_rooms or set
+        self.max_rooms = max_rooms
+        self.max_clients = max_clients
+        self.idle_grace = idle_grace
+        self.max_name_length = max_name_length
+        self._rooms = {}
+        self._timer = None
+        self.stats = {
+            "created": 0,
+            "evicted": 0,
+            "evict_deferred": 0,
+            "rejected_rooms": 0,
+            "rejected_clients": 0,
+            "peak_rooms": 0,
+        }
+
+    def get(self, room_id: str) -> dict | None:
+        return self._rooms.get(room_id)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    def __getitem__(self, room_id: str) -> dict:
+        return self._rooms[room_id]
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def items(self):
+        return self._rooms.items()
+
+    def values(self):
+        return self._rooms.values()
+
+    def acquire(self, room_id: str) -> dict:
+        # 为即将加入的连接预留一个名额；之后必须调用 join 或 release
+        if len(room_id) > self.max_name_length:
+            self.stats["rejected_rooms"] += 1
+            raise RoomLimitError("房间名过长")
+        room_obj = self._rooms.get(room_id)
+        if room_obj is None:
+            if len(self._rooms) >= self.max_rooms > 0 and not self._evict_oldest():
+                self.stats["rejected_rooms"] += 1
+                raise RoomLimitError("房间数量已达上限")
+            room_obj = {
+                "clients": set(),
+                "recent": deque(maxlen=self.recent_size),
+                "warm": False,
+                "warming": None,
+                "seq": 0,
+                "joining": 0,
+                "idle_since": None,
+                "created_at": time.time(),
+            }
+            self._rooms[room_id] = room_obj
+            self.stats["created"] += 1
+            self.stats["peak_rooms"] = max(self.stats["peak_rooms"], len(self._rooms))
+        elif self.max_clients > 0 and len(room_obj["clients"]) + room_obj["joining"] >= self.max_clients:
+            self.stats["rejected_clients"] += 1
+            raise RoomLimitError("房间人数已满")
+        room_obj["joining"] += 1
+        room_obj["idle_since"] = None
+        return room_obj
+
+    def join(self, room_obj: dict, client):
+        room_obj["joining"] -= 1
+        room_obj["clients"].add(client)
+
+    def release(self, room_obj: dict):
+        # acquire 之后没能加入（握手期间连接已断开）
+        room_obj["joining"] -= 1
+        self._mark_idle(room_obj)
+
+    def leave(self, room_id: str, client) -> bool:
+        # 返回该房间在本进程是否已没有连接
+        room_obj = self._rooms.get(room_id)
+        if room_obj is None:
+            return True
+        room_obj["clients"].discard(client)
+        self._mark_idle(room_obj)
+        return not room_obj["clients"]
+
+    def _mark_idle(self, room_obj: dict):
+        if not room_obj["clients"] and not room_obj["joining"] and room_obj["idle_since"] is None:
+            room_obj["idle_since"] = time.monotonic()
+
+    def _idle(self, room_obj: dict) -> bool:
+        return room_obj["idle_since"] is not None and room_obj["warming"] is None
+
+    def _evict(self, room_id: str):
+        del self._rooms[room_id]
+        self.stats["evicted"] += 1
+
+    def _evict_oldest(self) -> bool:
+        # 房间数到上限时，不等宽限期，直接回收空闲最久的房间
+        pending = self.pending_rooms()
+        idle = [(room_obj["idle_since"], room_id) for room_id, room_obj in self._rooms.items()
+                if self._idle(room_obj) and room_id not in pending]
+        if not idle:
+            return False
+        self._evict(min(idle)[1])
+        return True
+
+    def sweep(self):
+        deadline = time.monotonic() - self.idle_grace
+        pending = None
+        for room_id, room_obj in list(self._rooms.items()):
+            if self._idle(room_obj) and room_obj["idle_since"] <= deadline:
+                if pending is None:
+                    pending = self.pending_rooms()
+                if room_id in pending:
+                    self.stats["evict_deferred"] += 1
+                    continue
+                self._evict(room_id)
+
+    def start(self, interval: float | None = None):
+        if self._timer is None:
+            interval = interval or max(1.0, min(self.idle_grace / 2, 30.0))
+            self._timer = tornado.ioloop.PeriodicCallback(self.sweep, interval * 1000)
+            self._timer.start()
+
+    def listing(self) -> list[dict]:
+        now = time.monotonic()
+        rooms = []
+        for room_id, room_obj in self._rooms.items():
+            idle_since = room_obj["idle_since"]
+            rooms.append({
+                "room": room_id,
+                "clients": len(room_obj["clients"]),
+                "recent": len(room_obj["recent"]),
+                "seq": room_obj["seq"],
+                "warm": room_obj["warm"],
+                "idle_seconds": round(now - idle_since, 1) if idle_since is not None else None,
+                "memory_bytes": estimate_bytes(room_obj),
+            })
+        return rooms
+
+    def snapshot(self) -> dict:
+        return dict(
+            self.stats,
+            rooms=len(self._rooms),
+            idle=sum(1 for room_obj in self._rooms.values() if room_obj["idle_since"] is not None),
+            max_rooms=self.max_rooms,
+            max_clients=self.max_clients,
+        )
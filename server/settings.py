@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+DEFAULT_MODEL = "Qwen/Qwen2.5-7B-Instruct"
+DEFAULT_BASE_URL = "https://api.siliconflow.cn/v1/"
+
+# /config 只下发前端用到的字段；插件密钥、上游地址、限流与保留策略等服务端配置一律不出现在响应里
+PUBLIC_SERVER_KEYS = ("name", "ws_url")
+
+
+def _candidates() -> list[str]:
+    override = os.environ.get("ZZCHAT_CONFIG")
+    if override:
+        return [override]
+    base_dir = getattr(sys, "_MEIPASS", os.path.dirname(__file__))
+    exe_dir = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
+    return [
+        os.path.join(exe_dir, "config", "config.json"),
+        os.path.join(exe_dir, "config.json"),
+        os.path.join(base_dir, "config", "config.json"),
+        os.path.join(os.path.dirname(__file__), "..", "config", "config.json"),
+    ]
+
+
+class ConfigService:
+    # 启动时加载一次；之后最多每 check_interval 秒检查一次文件 mtime，变化时才重新读取（也可由 SIGHUP 触发）
+    def __init__(self, check_interval: float = 2.0):
+        self.check_interval = check_interval
+        self.path = None
+        self.version = 0
+        self._data = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._responses = {}
+        self._listeners = []
+
+    def _find_path(self) -> str | None:
+        for p in _candidates():
+            if os.path.exists(p):
+                return p
+        return None
+
+    def reload(self, force: bool = False) -> bool:
+        self._checked_at = time.monotonic()
+        path = self._find_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            path, mtime = None, None
+        if not force and path == self.path and mtime == self._mtime:
+            return False
+        data = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    data = {}
+            except Exception as e:
+                print(f"Config Load Error ({path}): {e}")
+                # 解析失败时保留上一份配置，避免编辑到一半的文件把服务配置清空
+                if self.version:
+                    return False
+                data = {}
+        self.path, self._mtime, self._data = path, mtime, data
+        self.version += 1
+        self._responses.clear()
+        for listener in list(self._listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"Config Listener Error: {e}")
+        return True
+
+    def maybe_reload(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    @property
+    def data(self) -> dict:
+        self.maybe_reload()
+        return self._data
+
+    def servers(self) -> list[dict]:
+        servers = self.data.get("servers") or []
+        return [s for s in servers if isinstance(s, dict)]
+
+    def siliconflow_api_key(self) -> str | None:
+        return os.environ.get("SILICONFLOW_API_KEY") or self.data.get("siliconflow_api_key") or None
+
+    def siliconflow_model(self) -> str:
+        return os.environ.get("SILICONFLOW_MODEL") or self.data.get("siliconflow_model") or DEFAULT_MODEL
+
+    def siliconflow_base_url(self) -> str:
+        return os.environ.get("SILICONFLOW_BASE_URL") or self.data.get("siliconflow_base_url") or DEFAULT_BASE_URL
+
+    def plugin_settings(self, name: str) -> dict:
+        section = (self.data.get("plugins") or {}).get(name)
+        return section if isinstance(section, dict) else {}
+
+    def section(self, name: str) -> dict:
+        section = self.data.get(name)
+        return section if isinstance(section, dict) else {}
+
+    def config_response(self, protocol: str, host: str) -> tuple[bytes, str]:
+        # /config 的响应只随配置版本和访问域名变化，预先序列化并计算 ETag
+        self.maybe_reload()
+        key = (protocol, host)
+        cached = self._responses.get(key)
+        if cached is not None:
+            return cached
+        dyn_url = f"{'wss' if protocol == 'https' else 'ws'}://{host}/ws"
+        servers = [{k: s[k] for k in PUBLIC_SERVER_KEYS if k in s} for s in self.servers()]
+        if not any(s.get("ws_url") == dyn_url for s in servers):
+            servers.insert(0, {"name": "当前访问域", "ws_url": dyn_url})
+        public = {"servers": servers}
+        body = json.dumps(public, ensure_ascii=False).encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if len(self._responses) >= 64:
+            self._responses.clear()
+        self._responses[key] = (body, etag)
+        return body, etag
+
+
+CONFIG = ConfigService()
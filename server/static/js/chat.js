@@ -0,0 +1,689 @@
+(function () {
+  // 页面参数由模板写入 window.ZZ，脚本本身是可长期缓存的静态文件
+  var nick = window.ZZ.nick;
+  var server = window.ZZ.server;
+  var room = window.ZZ.room;
+  var ws;
+  var closingForSwitch = false;
+
+  var users = new Set();
+  var canSend = false;
+  var $messages = document.getElementById('messages');
+  var $input = document.getElementById('input');
+  var $send = document.getElementById('send');
+  var $roomName = document.getElementById('roomName');
+  var emojiBtn = document.getElementById('emojiBtn');
+  var emojiPicker = document.getElementById('emojiPicker');
+  var historyBtn = document.getElementById('historyBtn');
+  var roomContainers = {};
+  var currentContainer = null;
+  function ensureRoomContainer(name) {
+    if (!roomContainers[name]) {
+      var c = document.createElement('div');
+      c.dataset.room = name;
+      c.style.display = 'none';
+      $messages.appendChild(c);
+      roomContainers[name] = c;
+    }
+    return roomContainers[name];
+  }
+  function showRoom(name) {
+    var target = ensureRoomContainer(name);
+    Object.keys(roomContainers).forEach(function (k) { roomContainers[k].style.display = (k === name) ? 'block' : 'none'; });
+    currentContainer = target;
+    scrollBottom();
+  }
+
+  function escapeHtml(s) {
+    return s.replace(/[&<>]/g, function (c) { return ({ '&': '&amp;', '<': '&lt;', '>': '&gt;' })[c] });
+  }
+  function fmtContent(text) {
+    var t = escapeHtml(text)
+      .replace(/((🤖成小理|🎵音乐|🎬电影|⛅天气|📰新闻|📺b站视频|@[\w]+))/g, '<span class="tag">$1</span>')
+      .replace(/\n/g, '<br>');
+    return t;
+  }
+  function chineseOnly(text) {
+    return String(text).replace(/[^\u4e00-\u9fff0-9\s，。！？、；：（）《》“”‘’…—·]/g, '');
+  }
+  function addSystem(content) {
+    var d = document.createElement('div');
+    d.className = 'system';
+    d.innerHTML = '<span>' + escapeHtml(content) + '</span>';
+    (currentContainer || ensureRoomContainer(room)).appendChild(d);
+    scrollBottom();
+  }
+  function renderUserItem(n) {
+    var item = document.createElement('div');
+    item.className = 'user-item';
+    var img = document.createElement('img');
+    img.className = 'avatar';
+    img.src = 'https://design.gemcoder.com/staticResource/echoAiSystemImages/a36d0ecd9f2c6eb5b1d0d8c346f85d87.png';
+    var name = document.createElement('span');
+    name.textContent = n;
+    if (n === nick) { name.className = 'name-blue'; }
+    var dot = document.createElement('span');
+    dot.className = 'dot';
+    item.appendChild(img); item.appendChild(name); item.appendChild(dot);
+    item.dataset.nick = n;
+    document.getElementById('userList').appendChild(item);
+  }
+  function updateUserCount() { var cEl = document.getElementById('userCount'); if (cEl) cEl.textContent = String(users.size); }
+  function addUser(n) { if (!users.has(n)) { users.add(n); renderUserItem(n); updateUserCount(); } }
+  function removeUser(n) { if (users.delete(n)) { var list = document.getElementById('userList'); var el = list.querySelector('[data-nick="' + CSS.escape(n) + '"]'); if (el) list.removeChild(el); updateUserCount(); } }
+  // 在线名单：roster 为完整名单（连接建立时下发），joined/left 为合并后的变化
+  function handlePresence(p) {
+    if (p.roster) {
+      users.clear();
+      document.getElementById('userList').innerHTML = '';
+      p.roster.forEach(addUser);
+      addUser(nick);
+      return;
+    }
+    (p.joined || []).forEach(addUser);
+    (p.left || []).forEach(function (n) { if (n !== nick) { removeUser(n); } });
+    var joined = (p.joined || []).filter(function (n) { return n !== nick; });
+    if (joined.length) { addSystem(joined.join('、') + ' 加入了房间'); }
+    if (p.left && p.left.length) { addSystem(p.left.join('、') + ' 离开了房间'); }
+  }
+  function parseSystemUser(text) {
+    var m = text.match(/^(.+?) 加入了房间/); if (m) return { nick: m[1], action: 'join' };
+    m = text.match(/^(.+?) 离开了房间/); if (m) return { nick: m[1], action: 'leave' };
+    return null;
+  }
+  function addMsg(sender, content) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+    bubble.innerHTML = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span></div>' + fmtContent(content);
+    row.appendChild(bubble);
+    (currentContainer || ensureRoomContainer(room)).appendChild(row);
+    scrollBottom();
+  }
+
+  var historyOverlay = (function () {
+    var el = document.createElement('div');
+    el.id = 'historyOverlay';
+    el.style.position = 'fixed';
+    el.style.left = '0';
+    el.style.top = '0';
+    el.style.right = '0';
+    el.style.bottom = '0';
+    el.style.background = 'rgba(0,0,0,0.6)';
+    el.style.display = 'none';
+    el.style.zIndex = '1000';
+    var panel = document.createElement('div');
+    panel.style.position = 'absolute';
+    panel.style.right = '20px';
+    panel.style.top = '20px';
+    panel.style.bottom = '20px';
+    panel.style.width = '420px';
+    panel.style.background = '#0e1626';
+    panel.style.border = '1px solid #1f2a3a';
+    panel.style.borderRadius = '12px';
+    panel.style.display = 'flex';
+    panel.style.flexDirection = 'column';
+    var header = document.createElement('div');
+    header.style.padding = '12px 16px';
+    header.style.borderBottom = '1px solid #1f2a3a';
+    header.style.display = 'flex';
+    header.style.justifyContent = 'space-between';
+    var title = document.createElement('div');
+    title.textContent = '历史记录';
+    var closeBtn = document.createElement('button');
+    closeBtn.textContent = '关闭';
+    closeBtn.className = 'tool-btn';
+    var searchInput = document.createElement('input');
+    searchInput.type = 'search';
+    searchInput.placeholder = '搜索本房间消息，回车确认';
+    searchInput.className = 'history-search';
+    header.appendChild(title); header.appendChild(searchInput); header.appendChild(closeBtn);
+    var progress = document.createElement('div');
+    progress.className = 'history-progress';
+    var progressBar = document.createElement('div');
+    progressBar.className = 'bar';
+    progress.appendChild(progressBar);
+    var list = document.createElement('div');
+    list.style.flex = '1';
+    list.style.overflow = 'auto';
+    list.style.padding = '12px 16px';
+    list.className = 'history-list';
+    var footer = document.createElement('div');
+    footer.style.padding = '12px 16px';
+    footer.style.borderTop = '1px solid #1f2a3a';
+    var moreBtn = document.createElement('button');
+    moreBtn.textContent = '加载更多';
+    moreBtn.className = 'tool-btn';
+    var clearBtn = document.createElement('button');
+    clearBtn.textContent = '清空聊天记录';
+    clearBtn.className = 'tool-btn danger-btn';
+    clearBtn.style.marginLeft = '8px';
+    footer.appendChild(moreBtn);
+    footer.appendChild(clearBtn);
+    var confirmBox = document.createElement('div');
+    confirmBox.className = 'confirm-box';
+    var confirmText = document.createElement('div');
+    confirmText.textContent = '是否确定清除当前房间历史记录？';
+    confirmText.style.marginBottom = '8px';
+    var confirmActions = document.createElement('div');
+    var btnCancel = document.createElement('button');
+    btnCancel.textContent = '取消';
+    btnCancel.className = 'tool-btn';
+    var btnOk = document.createElement('button');
+    btnOk.textContent = '确定';
+    btnOk.className = 'tool-btn danger-btn';
+    btnOk.style.marginLeft = '8px';
+    confirmActions.appendChild(btnCancel);
+    confirmActions.appendChild(btnOk);
+    confirmBox.appendChild(confirmText);
+    confirmBox.appendChild(confirmActions);
+    footer.appendChild(confirmBox);
+    panel.appendChild(header); panel.appendChild(progress); panel.appendChild(list); panel.appendChild(footer);
+    el.appendChild(panel);
+    document.body.appendChild(el);
+    return { root: el, list: list, searchInput: searchInput, closeBtn: closeBtn, moreBtn: moreBtn, clearBtn: clearBtn, progressBar: progressBar, confirmBox: confirmBox, btnOk: btnOk, btnCancel: btnCancel };
+  })();
+
+  var historyCursor = null;
+  var searchQuery = '';
+  function renderHistory(items) {
+    items.forEach(function (it) {
+      var row = document.createElement('div');
+      row.style.margin = '8px 0';
+      var nameCls = it.sender === nick ? 'name-blue' : '';
+      var dt = new Date(it.ts);
+      var hh = String(dt.getHours()).padStart(2, '0');
+      var mm = String(dt.getMinutes()).padStart(2, '0');
+      var meta = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(it.sender) + '</span><span class="time-gray">' + hh + ':' + mm + '</span></div>';
+      var bubble = document.createElement('div');
+      bubble.className = 'bubble other';
+      if (it.sender === nick) { bubble.className = 'bubble user'; }
+      // 搜索结果显示服务端生成的摘要（已转义，命中词带 <mark>）
+      bubble.innerHTML = meta + (it.snippet !== undefined ? it.snippet : fmtContent(it.content || ''));
+      row.appendChild(bubble);
+      historyOverlay.list.appendChild(row);
+    });
+  }
+
+  function startProgress() {
+    if (!historyOverlay.progressBar) return;
+    historyOverlay.progressBar.style.width = '0%';
+    historyOverlay.progressBar.style.opacity = '1';
+    setTimeout(function () { historyOverlay.progressBar.style.width = '40%'; }, 30);
+  }
+  function finishProgress() {
+    if (!historyOverlay.progressBar) return;
+    historyOverlay.progressBar.style.width = '100%';
+    setTimeout(function () { historyOverlay.progressBar.style.opacity = '0'; historyOverlay.progressBar.style.width = '0%'; }, 300);
+  }
+  function fetchHistory(cursor) {
+    startProgress();
+    var url = '/history?room=' + encodeURIComponent(room) + '&limit=50&order=desc';
+    if (cursor) {
+      ['before_ts', 'before_id'].forEach(function (k) {
+        if (cursor[k] !== null && cursor[k] !== undefined) { url += '&' + k + '=' + encodeURIComponent(cursor[k]); }
+      });
+    }
+    return fetch(url)
+      .then(function (r) { return r.json(); })
+      .then(function (res) { finishProgress(); historyCursor = (res && res.next_cursor) || null; historyOverlay.moreBtn.disabled = !historyCursor; return (res && res.items) || []; })
+      .catch(function () { finishProgress(); return []; });
+  }
+
+  function fetchSearch(cursor) {
+    startProgress();
+    var url = '/search?room=' + encodeURIComponent(room) + '&limit=20&q=' + encodeURIComponent(searchQuery);
+    if (cursor) { url += '&after_rank=' + cursor.after_rank + '&after_id=' + cursor.after_id; }
+    return fetch(url)
+      .then(function (r) { return r.json(); })
+      .then(function (res) { finishProgress(); historyCursor = (res && res.next_cursor) || null; historyOverlay.moreBtn.disabled = !historyCursor; if (res && res.message) { addSystem(res.message); } return (res && res.items) || []; })
+      .catch(function () { finishProgress(); return []; });
+  }
+
+  function openHistory() {
+    historyOverlay.list.innerHTML = '';
+    historyCursor = null;
+    searchQuery = '';
+    historyOverlay.searchInput.value = '';
+    fetchHistory(null).then(function (items) { renderHistory(items); historyOverlay.root.style.display = 'block'; });
+  }
+
+  function closeHistory() { historyOverlay.root.style.display = 'none'; }
+
+  historyBtn.addEventListener('click', openHistory);
+  historyOverlay.closeBtn.addEventListener('click', closeHistory);
+  historyOverlay.moreBtn.addEventListener('click', function () { if (historyCursor) { (searchQuery ? fetchSearch : fetchHistory)(historyCursor).then(renderHistory); } });
+  historyOverlay.searchInput.addEventListener('keydown', function (e) {
+    if (e.key !== 'Enter') return;
+    searchQuery = historyOverlay.searchInput.value.trim();
+    historyOverlay.list.innerHTML = '';
+    historyCursor = null;
+    (searchQuery ? fetchSearch : fetchHistory)(null).then(renderHistory);
+  });
+  historyOverlay.clearBtn.addEventListener('click', function () { historyOverlay.moreBtn.style.display = 'none'; historyOverlay.clearBtn.style.display = 'none'; historyOverlay.confirmBox.style.display = 'block'; });
+  historyOverlay.btnCancel.addEventListener('click', function () { historyOverlay.confirmBox.style.display = 'none'; historyOverlay.moreBtn.style.display = ''; historyOverlay.clearBtn.style.display = ''; });
+  historyOverlay.btnOk.addEventListener('click', function () {
+    historyOverlay.confirmBox.style.display = 'none'; historyOverlay.moreBtn.style.display = ''; historyOverlay.clearBtn.style.display = '';
+    startProgress();
+    fetch('/api/clear_history', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ room: room }) })
+      .then(function (r) { return r.json(); })
+      .then(function (res) { finishProgress(); if (res && res.code === 0) { historyOverlay.list.innerHTML = ''; historyCursor = null; var cont = (currentContainer || ensureRoomContainer(room)); if (cont) { cont.innerHTML = ''; } addSystem('已清空历史记录'); } else { alert((res && res.message) || '清空失败'); } })
+      .catch(function () { finishProgress(); alert('清空接口异常'); });
+  });
+
+  function addMusicCard(sender, music) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+
+    var meta = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span></div>';
+    var cardHtml = '<div class="music-card">' +
+      '<img src="' + (music.cover || '') + '" class="music-cover" onerror="this.style.display=\'none\'">' +
+      '<div class="music-info">' +
+      '<div class="music-title">' + escapeHtml(music.name || '未知歌曲') + '</div>' +
+      '<div class="music-singer">' + escapeHtml(music.singer || '未知歌手') + '</div>' +
+      '</div>' +
+      '<audio controls src="' + (music.url || '') + '" style="width:100%;height:32px;"></audio>' +
+      '</div>';
+
+    bubble.innerHTML = meta + cardHtml;
+    row.appendChild(bubble);
+    (currentContainer || ensureRoomContainer(room)).appendChild(row);
+    scrollBottom();
+  }
+
+  function addWeatherCard(sender, weather) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+
+    var meta = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span></div>';
+
+    var cardHtml = '<div class="weather-card">' +
+      '<div class="weather-header">' +
+      '<div class="weather-city">' + escapeHtml(weather.city) + '</div>' +
+      '<div class="weather-date">' + escapeHtml(weather.date) + ' ' + escapeHtml(weather.day) + '</div>' +
+      '</div>' +
+      '<div class="weather-main">' +
+      '<div class="weather-temp">' + escapeHtml(weather.current_temp) + '°</div>' +
+      '<div>' +
+      '<div class="weather-desc">' + escapeHtml(weather.weather) + '</div>' +
+      '<div style="font-size:12px;opacity:0.9">' + escapeHtml(weather.temp_range) + '</div>' +
+      '</div>' +
+      '</div>' +
+      '<div class="weather-details">' +
+      '<div class="weather-detail-item"><span class="weather-label">风向</span><span>' + escapeHtml(weather.wind) + '</span></div>' +
+      '<div class="weather-detail-item"><span class="weather-label">湿度</span><span>' + escapeHtml(weather.humidity) + '</span></div>' +
+      '<div class="weather-detail-item" style="grid-column:span 2;margin-top:4px"><span class="weather-label">提示</span><span>' + escapeHtml(weather.description) + '</span></div>' +
+      '</div>' +
+      '</div>';
+
+    bubble.innerHTML = meta + cardHtml;
+    row.appendChild(bubble);
+    (currentContainer || ensureRoomContainer(room)).appendChild(row);
+    scrollBottom();
+  }
+
+  function addMovieCard(sender, movie) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+
+    bubble.style.maxWidth = '100%';
+    bubble.style.width = 'auto';
+    bubble.style.padding = '12px';
+
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+
+    var meta = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span></div>';
+
+    var cardHtml = '<div class="movie-card" style="margin-top:6px;max-width:400px;">' +
+      '<iframe src="' + (movie.src || '') + '" style="width:100%;border:none;border-radius:8px;background:#000;aspect-ratio:16/9;" allowfullscreen></iframe>' +
+      '</div>';
+
+    bubble.innerHTML = meta + cardHtml;
+    row.appendChild(bubble);
+    (currentContainer || ensureRoomContainer(room)).appendChild(row);
+    var iframeEl = bubble.querySelector('iframe');
+    function fitIframe(el) {
+      if (!el) return;
+      if (!(window.CSS && CSS.supports && CSS.supports('aspect-ratio: 16/9'))) {
+        var w = el.offsetWidth || 400;
+        el.style.height = Math.round(w * 9 / 16) + 'px';
+      } else {
+        el.style.height = '';
+      }
+    }
+    fitIframe(iframeEl);
+    window.addEventListener('resize', function () { fitIframe(iframeEl); });
+    scrollBottom();
+  }
+
+  function addNewsCard(sender, list) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+    bubble.style.maxWidth = '100%';
+    bubble.style.width = 'auto';
+    bubble.style.padding = '12px';
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+    var meta = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span></div>';
+    var html = '<div class="news-card">';
+    var items = Array.isArray(list) ? list : [];
+    items.forEach(function (it) {
+      var img = (it.image || '').replace(/`/g, '').trim();
+      var url = (it.url || '').replace(/`/g, '').trim();
+      var time = escapeHtml(it.time || '');
+      var title = escapeHtml(it.title || '');
+      var brief = escapeHtml(it.brief || '');
+      html += '<div class="news-item">' +
+        '<img class="news-thumb" src="' + img + '" referrerpolicy="no-referrer" onerror="this.style.display=\'none\'">' +
+        '<div>' +
+        '<div class="news-title">' + title + '</div>' +
+        '<div class="news-brief">' + brief + '</div>' +
+        '<div class="news-meta"><span>' + time + '</span><a class="news-link" target="_blank" href="' + url + '">阅读原文</a></div>' +
+        '</div>' +
+        '</div>';
+    });
+    html += '</div>';
+    bubble.innerHTML = meta + html;
+    row.appendChild(bubble);
+    (currentContainer || ensureRoomContainer(room)).appendChild(row);
+    scrollBottom();
+  }
+
+  function addBilibiliCard(sender, movie) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+
+    bubble.style.maxWidth = '100%';
+    bubble.style.width = 'auto';
+    bubble.style.padding = '12px';
+
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+
+    var meta = '<div class="meta"><span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span></div>';
+
+    var coverHtml = '';
+    if (movie.cover) {
+      coverHtml = '<div style="margin-bottom:8px;border-radius:6px;overflow:hidden;max-height:200px;">' +
+        '<img src="' + escapeHtml(movie.cover) + '" style="width:100%;object-fit:cover;" referrerpolicy="no-referrer">' +
+        '</div>';
+    }
+
+    var titleHtml = '';
+    if (movie.title) {
+      titleHtml = '<div style="font-weight:bold;font-size:14px;margin-bottom:6px;color:#fff;">' + escapeHtml(movie.title) + '</div>';
+    }
+
+    var cardHtml = '<div class="movie-card" style="margin-top:6px;max-width:400px;">' +
+      coverHtml +
+      titleHtml +
+      '<video controls src="' + (movie.src || '') + '" style="width:100%;max-width:400px;border-radius:8px;background:#000;"></video>' +
+      '</div>';
+
+    bubble.innerHTML = meta + cardHtml;
+    row.appendChild(bubble);
+    (currentContainer || ensureRoomContainer(room)).appendChild(row);
+    scrollBottom();
+  }
+
+  function addStreamingBubble(sender) {
+    var row = document.createElement('div');
+    row.className = 'row' + (sender === nick ? ' user' : '');
+    var bubble = document.createElement('div');
+    bubble.className = 'bubble ' + (sender === nick ? 'user' : 'other');
+    var t = new Date();
+    var ts = String(t.getHours()).padStart(2, '0') + ':' + String(t.getMinutes()).padStart(2, '0');
+    var nameCls = sender === nick ? 'name-blue' : '';
+    var meta = document.createElement('div');
+    meta.className = 'meta';
+    meta.innerHTML = '<span class="' + nameCls + '">' + escapeHtml(sender) + '</span><span class="time-gray">' + ts + '</span>';
+    var contentDiv = document.createElement('div');
+    contentDiv.className = 'stream-content';
+    bubble.appendChild(meta);
+    bubble.appendChild(contentDiv);
+    row.appendChild(bubble);
+    var userRows = (currentContainer || ensureRoomContainer(room)).querySelectorAll('.row.user');
+    var anchor = userRows.length ? userRows[userRows.length - 1] : null;
+    if (anchor && anchor.parentNode) { anchor.parentNode.insertBefore(row, anchor.nextSibling); } else { (currentContainer || ensureRoomContainer(room)).appendChild(row); }
+    scrollBottom();
+    return contentDiv;
+  }
+  function scrollBottom() { $messages.scrollTop = $messages.scrollHeight; }
+
+  var roomLastTs = {};
+  var roomLastSeq = {};
+  function handleFrame(data, replay) {
+    if (data.ts) { roomLastTs[room] = Math.max(roomLastTs[room] || 0, data.ts); }
+    if (data.seq) { roomLastSeq[room] = Math.max(roomLastSeq[room] || 0, data.seq); }
+    if (data.type === 'system') {
+      addSystem(data.content);
+      var info = replay ? null : parseSystemUser(String(data.content));
+      if (info) { if (info.action === 'join') { addUser(info.nick); } else { removeUser(info.nick); } }
+    } else if (data.type === 'music_card') {
+      addMusicCard(data.sender, data.content);
+    } else if (data.type === 'weather_card') {
+      addWeatherCard(data.sender, data.content);
+    } else if (data.type === 'movie_card') {
+      addMovieCard(data.sender, data.content);
+    } else if (data.type === 'bilibili_card') {
+      addBilibiliCard(data.sender, data.content);
+    } else if (data.type === 'news_card') {
+      addNewsCard(data.sender, data.content);
+    } else {
+      addMsg(data.sender, data.content);
+      if (!replay && data.sender === nick && data.content && data.content.includes('🤖成小理')) {
+        startAIStream(data.content);
+      }
+    }
+  }
+  function renderBacklog(frame) {
+    // 服务端序号比本地记录的还小，说明服务端数据已重置，按新连接重新展示
+    if (frame.seq !== undefined && frame.seq < (roomLastSeq[room] || 0)) { roomLastSeq[room] = 0; roomLastTs[room] = 0; }
+    if (frame.truncated) { addSystem('离线期间消息较多，仅补发了最近的部分，更早的可在历史记录中查看'); }
+    var lastTs = roomLastTs[room] || 0;
+    var lastSeq = roomLastSeq[room] || 0;
+    (frame.content || []).forEach(function (it) {
+      if (it.seq ? it.seq <= lastSeq : it.ts <= lastTs) { return; }
+      var data = { type: it.type, sender: it.sender, content: it.content, ts: it.ts, seq: it.seq };
+      if (/_card$/.test(it.type)) {
+        try { data.content = JSON.parse(it.content); } catch (e) { data.type = 'message'; }
+      }
+      handleFrame(data, true);
+    });
+  }
+
+  var reconnectDelay = 1000;
+  var reconnectTimer = null;
+  function scheduleReconnect() {
+    if (reconnectTimer) return;
+    addSystem('连接已断开，' + Math.round(reconnectDelay / 1000) + ' 秒后重连…');
+    reconnectTimer = setTimeout(function () { reconnectTimer = null; connect(); }, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, 15000);
+  }
+
+  function connect() {
+    if (reconnectTimer) { clearTimeout(reconnectTimer); reconnectTimer = null; }
+    if (ws && ws.readyState !== 3) {
+      closingForSwitch = true;
+      try { ws.close(); } catch (e) { }
+    }
+    var url = server + '?room=' + encodeURIComponent(room) + '&nick=' + encodeURIComponent(nick);
+    // 带上本房间最后收到的序号，服务端只补发断线期间缺失的消息
+    if (roomLastSeq[room]) { url += '&since_id=' + roomLastSeq[room]; }
+    // 加载了 wire.js 时声明二进制子协议，服务端不支持时仍按 JSON 文本帧处理
+    ws = window.ZZWire ? new WebSocket(url, [ZZWire.SUBPROTOCOL]) : new WebSocket(url);
+    ws.binaryType = 'arraybuffer';
+    canSend = false;
+    $send.disabled = true;
+    ws.onopen = function () {
+      reconnectDelay = 1000;
+      addSystem('已连接到服务器 ' + server);
+      canSend = true;
+      $send.disabled = false;
+    };
+    ws.onmessage = function (ev) {
+      var data = {};
+      if (ev.data instanceof ArrayBuffer) {
+        try { data = ZZWire.decode(new Uint8Array(ev.data)); } catch (e) { return; }
+      } else {
+        try { data = JSON.parse(ev.data); } catch (e) { data = { type: 'message', sender: '服务器', content: ev.data }; }
+      }
+      if (data.type === 'backlog') {
+        renderBacklog(data);
+        return;
+      }
+      if (data.type === 'presence') {
+        handlePresence(data);
+        return;
+      }
+      var placeholder = data.replaces ? document.querySelector('[data-pending-id="' + CSS.escape(data.replaces) + '"]') : null;
+      handleFrame(data, false);
+      var cont = currentContainer || ensureRoomContainer(room);
+      var last = cont.lastElementChild;
+      if (data.type === 'pending' && last) { last.dataset.pendingId = data.id; }
+      if (placeholder && placeholder.parentNode) {
+        if (last && last !== placeholder) { placeholder.parentNode.replaceChild(last, placeholder); } else { placeholder.parentNode.removeChild(placeholder); }
+      }
+    };
+    ws.onclose = function (ev) {
+      // 切换房间时旧连接的关闭事件晚于新连接建立，不能影响新连接的状态
+      if (this !== ws) { closingForSwitch = false; return; }
+      canSend = false; $send.disabled = true;
+      // 1013：房间数量或房间人数已达上限，稍后重连
+      if (ev.code === 1013 && ev.reason) { addSystem(ev.reason); }
+      if (closingForSwitch) { closingForSwitch = false; return; }
+      scheduleReconnect();
+    };
+    ws.onerror = function () { addSystem('连接发生错误'); canSend = false; $send.disabled = true; };
+  }
+
+  function send() {
+    var text = ($input.value || '').trim();
+    if (!text) return;
+    if (!(ws && ws.readyState === 1)) {
+      addSystem('连接未就绪，请稍后再试');
+      return;
+    }
+    if (window.ZZWire && ws.protocol === ZZWire.SUBPROTOCOL) { ws.send(ZZWire.encode({ content: text })); } else { ws.send(JSON.stringify({ content: text })); }
+    $input.value = '';
+    autoResize();
+  }
+
+  function autoResize() {
+    $input.style.height = 'auto';
+    var mh = 160; var h = Math.min($input.scrollHeight, mh);
+    $input.style.height = h + 'px';
+  }
+
+  function insertAtCursor(el, txt) {
+    var s = el.selectionStart || 0;
+    var e = el.selectionEnd || 0;
+    var val = el.value || '';
+    el.value = val.slice(0, s) + txt + val.slice(e);
+    var pos = s + txt.length;
+    el.setSelectionRange(pos, pos);
+    el.focus();
+    autoResize();
+  }
+
+  function startAIStream(prompt) {
+    var contentDiv = addStreamingBubble('成小理');
+    var acc = '';
+    var es = new EventSource('/ai?prompt=' + encodeURIComponent(prompt));
+    es.onmessage = function (ev) {
+      if (ev.data === '[DONE]') { es.close(); return; }
+      try {
+        var obj = JSON.parse(ev.data);
+        var part = obj.choices && obj.choices[0] && obj.choices[0].delta && obj.choices[0].delta.content || '';
+        if (part) { acc += chineseOnly(part); contentDiv.innerHTML = fmtContent(acc); scrollBottom(); }
+      } catch (e) {
+        if (ev.data) { acc += chineseOnly(ev.data); contentDiv.innerHTML = fmtContent(acc); scrollBottom(); }
+      }
+    };
+    es.onerror = function () { es.close(); addSystem('成小理接口发生错误'); };
+  }
+
+  document.querySelectorAll('.room').forEach(function (el) {
+    el.addEventListener('click', function () {
+      var targetRoom = this.getAttribute('data-room');
+      if (targetRoom === room) { return; }
+      document.querySelectorAll('.room').forEach(function (x) { x.classList.remove('active'); });
+      this.classList.add('active');
+      room = targetRoom;
+      $roomName.textContent = '# ' + this.textContent.trim().replace('#', '');
+      document.getElementById('userList').innerHTML = '';
+      users.clear();
+      closingForSwitch = true;
+      try { ws && ws.close(); } catch (e) { }
+      addSystem('已切换到 ' + $roomName.textContent + ' 房间');
+      showRoom(room);
+      connect();
+    });
+  });
+
+  document.getElementById('logout').addEventListener('click', function () {
+    location.href = '/login';
+  });
+
+  $send.addEventListener('click', send);
+  $input.addEventListener('keydown', function (e) {
+    if (e.key === 'Enter' && !e.shiftKey) { e.preventDefault(); send(); }
+  });
+  $input.addEventListener('input', autoResize);
+
+  document.querySelectorAll('.cmd').forEach(function (btn) {
+    btn.addEventListener('click', function () {
+      var t = this.getAttribute('data-cmd');
+      var insertOnly = ['🤖成小理', '🎬电影', '⛅天气', '📺b站视频'];
+      insertAtCursor($input, t + ' ');
+      if (insertOnly.indexOf(t) !== -1) { $input.focus(); autoResize(); }
+      else { send(); }
+    });
+  });
+
+  emojiBtn.addEventListener('click', function () {
+    emojiPicker.style.display = emojiPicker.style.display === 'none' || !emojiPicker.style.display ? 'block' : 'none';
+  });
+  emojiPicker.querySelectorAll('.emoji-item').forEach(function (el) {
+    el.addEventListener('click', function () {
+      var em = this.getAttribute('data-emoji');
+      insertAtCursor($input, em);
+    });
+  });
+  document.addEventListener('click', function (e) {
+    if (!emojiPicker.contains(e.target) && e.target !== emojiBtn) {
+      emojiPicker.style.display = 'none';
+    }
+  });
+
+  autoResize();
+  showRoom(room);
+  connect();
+  addUser(nick);
+
+
+})();
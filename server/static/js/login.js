@@ -0,0 +1,50 @@
+(function(){
+  var $server = document.getElementById('server');
+  var $login = document.getElementById('loginBtn');
+  var $nick = document.getElementById('nick');
+  var $pwd = document.getElementById('password');
+
+  fetch('/config').then(function(r){return r.json()}).then(function(cfg){
+    var servers = (cfg && cfg.servers) || [];
+    servers.forEach(function(s){
+      var opt = document.createElement('option');
+      opt.value = s.ws_url;
+      opt.textContent = s.name + ' - ' + s.ws_url;
+      $server.appendChild(opt);
+    });
+    if(!$server.value && servers.length){ $server.value = servers[0].ws_url; }
+  }).catch(function(){
+    var opt = document.createElement('option');
+    opt.value = 'ws://127.0.0.1:8888/ws';
+    opt.textContent = '本地服务器 - ws://127.0.0.1:8888/ws';
+    $server.appendChild(opt);
+  });
+
+  function goChat(nick, srv){
+    var qs = new URLSearchParams({ nick: nick, server: srv, room: 'general' }).toString();
+    location.href = '/chat?' + qs;
+  }
+  $login.addEventListener('click', function(){
+    var nick = ($nick.value||'').trim();
+    var pwd = ($pwd.value||'').trim();
+    var srv = $server.value;
+    if(!nick){ alert('请输入昵称'); return; }
+    if(!pwd){ alert('请输入密码'); return; }
+    if(!srv){ alert('请选择服务器'); return; }
+    fetch('/api/login', { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({nick:nick, password:pwd}) })
+      .then(function(r){ return r.json(); })
+      .then(function(res){ if(res && res.code === 0){ goChat(nick, srv); } else { alert(res && res.message || '登录失败'); } })
+      .catch(function(){ alert('登录接口异常'); });
+  });
+
+  document.getElementById('registerLink').addEventListener('click', function(){
+    var nick = ($nick.value||'').trim();
+    var pwd = ($pwd.value||'').trim();
+    if(!nick){ alert('请输入昵称'); return; }
+    if(!pwd){ alert('请输入密码'); return; }
+    fetch('/api/register', { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({nick:nick, password:pwd}) })
+      .then(function(r){ return r.json(); })
+      .then(function(res){ alert(res && res.message || '请求已提交'); })
+      .catch(function(){ alert('注册接口异常'); });
+  });
+})();
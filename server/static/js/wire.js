@@ -0,0 +1,125 @@
+// MessagePack 二进制子协议（与 server/wire.py 对应）：字典键为短整数 id，顶层 type 为整数
+(function (global) {
+  var SUBPROTOCOL = 'zzchat.msgpack.v1';
+  // 只能在末尾追加，不能调整顺序
+  var FIELDS = [
+    'type', 'sender', 'content', 'ts', 'seq', 'id', 'replaces', 'since', 'truncated',
+    'roster', 'joined', 'left', 'count', 'room',
+    'name', 'singer', 'url', 'cover',
+    'city', 'date', 'day', 'weather', 'temp_range', 'current_temp', 'wind', 'description', 'humidity',
+    'src', 'title', 'desc', 'original_url'
+  ];
+  var TYPES = [
+    'message', 'system', 'pending', 'backlog', 'presence',
+    'music_card', 'weather_card', 'news_card', 'bilibili_card', 'movie_card'
+  ];
+  var FIELD_IDS = {};
+  FIELDS.forEach(function (name, i) { FIELD_IDS[name] = i; });
+  var utf8 = new TextDecoder('utf-8');
+  var utf8enc = new TextEncoder();
+
+  function decode(bytes) {
+    var view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    var pos = 0;
+
+    function str(n) { var s = utf8.decode(bytes.subarray(pos, pos + n)); pos += n; return s; }
+    function bin(n) { var b = bytes.slice(pos, pos + n); pos += n; return b; }
+    function arr(n) { var a = new Array(n); for (var i = 0; i < n; i++) { a[i] = read(); } return a; }
+    function map(n) {
+      var o = {};
+      for (var i = 0; i < n; i++) {
+        var k = read();
+        var v = read();
+        o[typeof k === 'number' && k >= 0 && k < FIELDS.length ? FIELDS[k] : k] = v;
+      }
+      return o;
+    }
+    function u64() { var hi = view.getUint32(pos); var lo = view.getUint32(pos + 4); pos += 8; return hi * 4294967296 + lo; }
+    function i64() { var hi = view.getInt32(pos); var lo = view.getUint32(pos + 4); pos += 8; return hi * 4294967296 + lo; }
+    function read() {
+      var b = bytes[pos++];
+      var n;
+      if (b < 0x80) { return b; }
+      if (b >= 0xe0) { return b - 0x100; }
+      if (b >= 0xa0 && b <= 0xbf) { return str(b & 0x1f); }
+      if (b >= 0x90 && b <= 0x9f) { return arr(b & 0x0f); }
+      if (b >= 0x80 && b <= 0x8f) { return map(b & 0x0f); }
+      switch (b) {
+        case 0xc0: return null;
+        case 0xc2: return false;
+        case 0xc3: return true;
+        case 0xc4: n = bytes[pos]; pos += 1; return bin(n);
+        case 0xc5: n = view.getUint16(pos); pos += 2; return bin(n);
+        case 0xc6: n = view.getUint32(pos); pos += 4; return bin(n);
+        case 0xca: n = view.getFloat32(pos); pos += 4; return n;
+        case 0xcb: n = view.getFloat64(pos); pos += 8; return n;
+        case 0xcc: n = bytes[pos]; pos += 1; return n;
+        case 0xcd: n = view.getUint16(pos); pos += 2; return n;
+        case 0xce: n = view.getUint32(pos); pos += 4; return n;
+        case 0xcf: return u64();
+        case 0xd0: n = view.getInt8(pos); pos += 1; return n;
+        case 0xd1: n = view.getInt16(pos); pos += 2; return n;
+        case 0xd2: n = view.getInt32(pos); pos += 4; return n;
+        case 0xd3: return i64();
+        case 0xd9: n = bytes[pos]; pos += 1; return str(n);
+        case 0xda: n = view.getUint16(pos); pos += 2; return str(n);
+        case 0xdb: n = view.getUint32(pos); pos += 4; return str(n);
+        case 0xdc: n = view.getUint16(pos); pos += 2; return arr(n);
+        case 0xdd: n = view.getUint32(pos); pos += 4; return arr(n);
+        case 0xde: n = view.getUint16(pos); pos += 2; return map(n);
+        case 0xdf: n = view.getUint32(pos); pos += 4; return map(n);
+      }
+      throw new Error('unsupported msgpack type 0x' + b.toString(16));
+    }
+
+    var obj = read();
+    if (obj && typeof obj.type === 'number') { obj.type = TYPES[obj.type] || obj.type; }
+    return obj;
+  }
+
+  // 客户端只发送 {content: 文本} 这类简单对象，编码器只支持字符串、整数、布尔、null 与嵌套的对象/数组
+  function encode(obj) {
+    var out = [];
+    function push16(n) { out.push(n >> 8 & 0xff, n & 0xff); }
+    function push32(n) { out.push(n >>> 24 & 0xff, n >>> 16 & 0xff, n >>> 8 & 0xff, n & 0xff); }
+    function write(v) {
+      var i, n, keys;
+      if (v === null || v === undefined) { out.push(0xc0); }
+      else if (v === true) { out.push(0xc3); }
+      else if (v === false) { out.push(0xc2); }
+      else if (typeof v === 'number' && Number.isInteger(v) && v >= 0 && v <= 0xffffffff) {
+        if (v < 0x80) { out.push(v); } else if (v <= 0xffff) { out.push(0xcd); push16(v); } else { out.push(0xce); push32(v); }
+      }
+      else if (typeof v === 'number') {
+        var buf = new DataView(new ArrayBuffer(8));
+        buf.setFloat64(0, v);
+        out.push(0xcb);
+        for (i = 0; i < 8; i++) { out.push(buf.getUint8(i)); }
+      }
+      else if (typeof v === 'string') {
+        var data = utf8enc.encode(v);
+        n = data.length;
+        if (n < 32) { out.push(0xa0 | n); } else if (n <= 0xff) { out.push(0xd9, n); } else if (n <= 0xffff) { out.push(0xda); push16(n); } else { out.push(0xdb); push32(n); }
+        for (i = 0; i < n; i++) { out.push(data[i]); }
+      }
+      else if (Array.isArray(v)) {
+        n = v.length;
+        if (n < 16) { out.push(0x90 | n); } else { out.push(0xdc); push16(n); }
+        for (i = 0; i < n; i++) { write(v[i]); }
+      }
+      else {
+        keys = Object.keys(v);
+        n = keys.length;
+        if (n < 16) { out.push(0x80 | n); } else { out.push(0xde); push16(n); }
+        for (i = 0; i < n; i++) {
+          write(FIELD_IDS.hasOwnProperty(keys[i]) ? FIELD_IDS[keys[i]] : keys[i]);
+          write(v[keys[i]]);
+        }
+      }
+    }
+    write(obj);
+    return new Uint8Array(out);
+  }
+
+  global.ZZWire = { SUBPROTOCOL: SUBPROTOCOL, decode: decode, encode: encode };
+})(window);
@@ -0,0 +1,108 @@
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.ioloop
+
+import db
+from metrics import DB_ERRORS, DB_SECONDS
+
+# db 的异步封装：所有写入在同一个写线程上按提交顺序执行，读取在只读连接池里并发执行，IOLoop 线程不再碰 SQLite
+READERS = int(os.environ.get("ZZCHAT_DB_READERS", "4"))
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zzchat-db-writer")
+_readers = ThreadPoolExecutor(max_workers=READERS, thread_name_prefix="zzchat-db-reader")
+
+
+async def _run(executor, func, args, kwargs):
+    # 耗时包含在线程池里排队的时间，按函数名记入 zzchat_db_seconds
+    op = getattr(func, "__name__", "call")
+    start = time.perf_counter()
+    try:
+        return await tornado.ioloop.IOLoop.current().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    except Exception:
+        DB_ERRORS.inc(1, op)
+        raise
+    finally:
+        DB_SECONDS.observe(time.perf_counter() - start, op)
+
+
+def run_write(func, *args, **kwargs):
+    return _run(_writer, func, args, kwargs)
+
+
+def run_read(func, *args, **kwargs):
+    return _run(_readers, func, args, kwargs)
+
+
+async def init_db(db_path: str):
+    await run_write(db.init_db, db_path)
+
+
+async def get_user(nick: str) -> dict | None:
+    return await run_read(db.get_user, nick)
+
+
+async def insert_user(nick: str, password_hash: str, salt: str) -> tuple[bool, str]:
+    return await run_write(db.insert_user, nick, password_hash, salt)
+
+
+async def update_password_hash(nick: str, password_hash: str, salt: str):
+    await run_write(db.update_password_hash, nick, password_hash, salt)
+
+
+async def save_message(room: str, sender: str, mtype: str, content: str, ts: int, seq: int | None = None):
+    await run_write(db.save_message, room, sender, mtype, content, ts, seq)
+
+
+async def save_messages(rows: list[tuple]) -> list[int]:
+    return await run_write(db.save_messages, rows)
+
+
+async def fetch_history_page(room: str, limit: int = 50,
+                             before_ts: int | None = None, before_id: int | None = None,
+                             after_ts: int | None = None, after_id: int | None = None) -> tuple[list[dict], dict | None]:
+    return await run_read(db.fetch_history_page, room, limit, before_ts, before_id, after_ts, after_id)
+
+
+async def fetch_history(room: str, limit: int = 50, before_ts: int | None = None) -> list[dict]:
+    return await run_read(db.fetch_history, room, limit, before_ts)
+
+
+async def fetch_export(room: str, size: int, after: tuple[int, int] | None = None) -> list[dict]:
+    return await run_read(db.fetch_export, room, size, after)
+
+
+async def max_seq(room: str) -> int:
+    return await run_read(db.max_seq, room)
+
+
+async def fetch_since(room: str, since_seq: int, limit: int = 500) -> tuple[list[dict], bool]:
+    return await run_read(db.fetch_since, room, since_seq, limit)
+
+
+async def search_messages(room: str, q: str, limit: int = 20,
+                          after_rank: float | None = None, after_id: int | None = None) -> tuple[list[dict], dict | None]:
+    return await run_read(db.search_messages, room, q, limit, after_rank, after_id)
+
+
+async def clear_history(room: str, chunk: int = 1000) -> int:
+    # 每批删除都是写线程上的一个独立任务，批与批之间让出 IOLoop，其它写入可以插队
+    up_to_id = await run_write(db.max_message_id, room)
+    total = 0
+    while True:
+        deleted = await run_write(db.clear_history_chunk, room, up_to_id, chunk)
+        if not deleted:
+            return total
+        total += deleted
+
+
+def wait_writes():
+    # 写线程按 FIFO 执行，排一个空任务并等待它，即等到此前提交的写入全部完成
+    _writer.submit(lambda: None).result()
+
+
+def close():
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
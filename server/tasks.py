@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+from metrics import PLUGIN_OUTCOMES, PLUGIN_SECONDS
+
+
+class PluginBusyError(Exception):
+    pass
+
+
+class PluginFailed(Exception):
+    # 插件已向房间说明失败原因（上游返回错误码、缺少结果等）：调度器只计为失败，不再重复回复
+    pass
+
+
+class PluginScheduler:
+    # 插件调用作为后台任务运行：按插件限制并发与超时，按所属连接跟踪以便断开时取消
+    def __init__(self, default_timeout: float = 15.0, default_concurrency: int = 8, max_waiting: int = 64):
+        self.default_timeout = default_timeout
+        self.default_concurrency = default_concurrency
+        self.max_waiting = max_waiting
+        self._policies = {}
+        self._semaphores = {}
+        # 每个插件已接纳（排队中或运行中）的任务数
+        self._active = {}
+        self._owned = {}
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "running": 0,
+            "last_error": None,
+        }
+
+    def configure(self, name: str, timeout: float | None = None, concurrency: int | None = None):
+        self._policies[name] = {
+            "timeout": timeout or self.default_timeout,
+            "concurrency": concurrency or self.default_concurrency,
+        }
+        self._semaphores.pop(name, None)
+
+    def _policy(self, name: str) -> dict:
+        return self._policies.get(name) or {"timeout": self.default_timeout, "concurrency": self.default_concurrency}
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        sem = self._semaphores.get(name)
+        if sem is None:
+            sem = asyncio.Semaphore(self._policy(name)["concurrency"])
+            self._semaphores[name] = sem
+        return sem
+
+    def submit(self, owner, name: str, coro_factory, on_error=None) -> asyncio.Task:
+        # on_error(kind) 在超时（"timeout"）、排队已满（"busy"）或出错（"error"）时调用；被取消时为 "cancelled"
+        self.stats["submitted"] += 1
+        task = asyncio.ensure_future(self._run(name, coro_factory, on_error))
+        owned = self._owned.setdefault(owner, set())
+        owned.add(task)
+
+        def done(t):
+            owned.discard(t)
+            if not owned and self._owned.get(owner) is owned:
+                self._owned.pop(owner, None)
+
+        task.add_done_callback(done)
+        return task
+
+    async def _run(self, name: str, coro_factory, on_error):
+        policy = self._policy(name)
+        sem = self._semaphore(name)
+        kind = None
+        replied = False
+        start = time.perf_counter()
+        try:
+            # 按已接纳的任务数判断而不是 sem.locked()：同一轮事件循环里提交的任务都还没来得及获取许可
+            if self._active.get(name, 0) >= policy["concurrency"] + self.max_waiting:
+                raise PluginBusyError(name)
+            self._active[name] = self._active.get(name, 0) + 1
+
+            async def job():
+                # 许可在同一个协程里获取和归还：超时或取消发生在刚拿到许可的瞬间，也会由 async with 归还
+                async with sem:
+                    self.stats["running"] += 1
+                    try:
+                        await coro_factory()
+                    finally:
+                        self.stats["running"] -= 1
+
+            try:
+                # 超时覆盖排队和执行两段，请求方等待的总时长不超过 timeout
+                await asyncio.wait_for(job(), policy["timeout"])
+            finally:
+                self._active[name] -= 1
+            self.stats["completed"] += 1
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            kind = "timeout"
+        except PluginBusyError:
+            self.stats["rejected"] += 1
+            kind = "busy"
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            kind = "cancelled"
+        except PluginFailed as e:
+            self.stats["failed"] += 1
+            self.stats["last_error"] = f"{name}: {e}"
+            kind = "error"
+            replied = True
+        except Exception as e:
+            # 插件不自行捕获上游异常，在这里统一计数，由 on_error 替换占位卡片
+            self.stats["failed"] += 1
+            self.stats["last_error"] = f"{name}: {e!r}"
+            kind = "error"
+        PLUGIN_SECONDS.observe(time.perf_counter() - start, name)
+        PLUGIN_OUTCOMES.inc(1, name, kind or "completed")
+        if kind and not replied and on_error is not None:
+            try:
+                on_error(kind)
+            except Exception:
+                pass
+
+    def cancel_owner(self, owner) -> int:
+        tasks = self._owned.pop(owner, set())
+        for task in list(tasks):
+            task.cancel()
+        return len(tasks)
+
+    def pending_count(self, owner) -> int:
+        return len(self._owned.get(owner, ()))
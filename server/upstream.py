@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+import tornado.httpclient
+from metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS
+from tornado.simple_httpclient import HTTPTimeoutError, SimpleAsyncHTTPClient, _HTTPConnection
+
+
+class _AbortableConnection(_HTTPConnection):
+    def __init__(self, client, request, *args, **kwargs):
+        # request 是 _RequestProxy，把连接挂到调用方持有的原始 HTTPRequest 上，便于中途关闭
+        getattr(request, "request", request)._upstream_connection = self
+        super().__init__(client, request, *args, **kwargs)
+
+
+class _AbortableHTTPClient(SimpleAsyncHTTPClient):
+    def _connection_class(self):
+        return _AbortableConnection
+
+
+class UpstreamPool:
+    # 一类上游调用（插件 / AI）共用一个独立的 HTTP 客户端实例，互不抢占连接；每个主机再单独限制并发
+    def __init__(self, name: str, max_clients: int = 32, max_per_host: int = 8,
+                 connect_timeout: float = 5.0, request_timeout: float = 15.0, backend: str = "simple",
+                 queue_timeout: float | None = None):
+        self.name = name
+        self.max_clients = max_clients
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        # 等待主机并发名额的上限，默认与连接超时相同；主机卡死时排队的调用方不会无限等待
+        self.queue_timeout = connect_timeout if queue_timeout is None else queue_timeout
+        self.backend = backend
+        self._client = None
+        self._hosts = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        if self.backend == "curl":
+            try:
+                # 只有 curl 后端会复用到同一主机的 keep-alive 连接；simple_httpclient 每个请求新建连接
+                from tornado.curl_httpclient import CurlAsyncHTTPClient
+                return CurlAsyncHTTPClient(force_instance=True, max_clients=self.max_clients)
+            except ImportError:
+                print(f"Upstream [{self.name}]: 未安装 pycurl，回退到 simple_httpclient")
+                self.backend = "simple"
+        return _AbortableHTTPClient(force_instance=True, max_clients=self.max_clients)
+
+    def abort(self, request: tornado.httpclient.HTTPRequest) -> bool:
+        # 关闭进行中请求的连接，fetch 随即以 HTTPStreamClosedError 结束；curl 后端不支持
+        conn = getattr(request, "_upstream_connection", None)
+        stream = getattr(conn, "stream", None)
+        if stream is None:
+            return False
+        stream.close()
+        return True
+
+    def _host(self, host: str) -> dict:
+        state = self._hosts.get(host)
+        if state is None:
+            state = {
+                "semaphore": asyncio.Semaphore(self.max_per_host),
+                "inflight": 0,
+                "waiting": 0,
+                "max_waiting": 0,
+                "saturated": 0,
+                "queue_timeouts": 0,
+                "requests": 0,
+                "errors": 0,
+                "total_ms": 0.0,
+            }
+            self._hosts[host] = state
+        return state
+
+    async def _wait_slot(self, sem: asyncio.Semaphore, state: dict, host: str):
+        state["waiting"] += 1
+        state["max_waiting"] = max(state["max_waiting"], state["waiting"])
+        # 获取名额放在独立任务里：超时或调用方被取消时，已经拿到的名额要还回去，否则该主机的并发上限会永久变小
+        acquire = asyncio.ensure_future(sem.acquire())
+        try:
+            await asyncio.wait((acquire,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if not acquire.cancel() and not acquire.cancelled():
+                sem.release()
+            raise
+        finally:
+            state["waiting"] -= 1
+        if not acquire.done():
+            acquire.cancel()
+            state["queue_timeouts"] += 1
+            state["errors"] += 1
+            UPSTREAM_ERRORS.inc(1, self.name, host)
+            raise HTTPTimeoutError("Timeout waiting for upstream slot")
+
+    async def fetch(self, request, **kwargs) -> tornado.httpclient.HTTPResponse:
+        if not isinstance(request, tornado.httpclient.HTTPRequest):
+            request = tornado.httpclient.HTTPRequest(request, **kwargs)
+        if request.connect_timeout is None:
+            request.connect_timeout = self.connect_timeout
+        if request.request_timeout is None:
+            request.request_timeout = self.request_timeout
+        host = urlsplit(request.url).netloc
+        state = self._host(host)
+        sem = state["semaphore"]
+        if sem.locked():
+            state["saturated"] += 1
+            await self._wait_slot(sem, state, host)
+        else:
+            # 有空闲名额时 acquire 立即返回，不会挂起
+            await sem.acquire()
+        state["inflight"] += 1
+        state["requests"] += 1
+        start = time.perf_counter()
+        try:
+            return await self.client.fetch(request)
+        except Exception:
+            state["errors"] += 1
+            UPSTREAM_ERRORS.inc(1, self.name, host)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            state["total_ms"] += elapsed * 1000
+            UPSTREAM_SECONDS.observe(elapsed, self.name, host)
+            state["inflight"] -= 1
+            sem.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": self.backend,
+            "max_clients": self.max_clients,
+            "max_per_host": self.max_per_host,
+            "hosts": {
+                host: {k: v for k, v in state.items() if k != "semaphore"}
+                for host, state in self._hosts.items()
+            },
+        }
+
+
+def _env_pool(name: str, **defaults) -> UpstreamPool:
+    prefix = f"ZZCHAT_HTTP_{name.upper()}_"
+    return UpstreamPool(
+        name,
+        max_clients=int(os.environ.get(prefix + "MAX_CLIENTS", defaults["max_clients"])),
+        max_per_host=int(os.environ.get(prefix + "MAX_PER_HOST", defaults["max_per_host"])),
+        connect_timeout=float(os.environ.get(prefix + "CONNECT_TIMEOUT", defaults["connect_timeout"])),
+        request_timeout=float(os.environ.get(prefix + "REQUEST_TIMEOUT", defaults["request_timeout"])),
+        queue_timeout=float(os.environ.get(prefix + "QUEUE_TIMEOUT", defaults["connect_timeout"])),
+        backend=os.environ.get("ZZCHAT_HTTP_BACKEND", "simple"),
+    )
+
+
+PLUGIN_HTTP = _env_pool("plugins", max_clients=32, max_per_host=8, connect_timeout=5, request_timeout=10)
+AI_HTTP = _env_pool("ai", max_clients=64, max_per_host=32, connect_timeout=10, request_timeout=300)
+POOLS = {"plugins": PLUGIN_HTTP, "ai": AI_HTTP}
@@ -0,0 +1,191 @@
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 可选的二进制子协议：客户端在 Sec-WebSocket-Protocol 中声明后，服务端下发 MessagePack 二进制帧，
+# 字典键按下表换成短整数 id，顶层 type 也换成整数；未声明的旧客户端继续使用 JSON 文本帧
+SUBPROTOCOL = "zzchat.msgpack.v1"
+
+# 只能在末尾追加，不能调整顺序；static/js/wire.js 中有同样的两张表
+FIELDS = [
+    "type", "sender", "content", "ts", "seq", "id", "replaces", "since", "truncated",
+    "roster", "joined", "left", "count", "room",
+    "name", "singer", "url", "cover",
+    "city", "date", "day", "weather", "temp_range", "current_temp", "wind", "description", "humidity",
+    "src", "title", "desc", "original_url",
+]
+TYPES = [
+    "message", "system", "pending", "backlog", "presence",
+    "music_card", "weather_card", "news_card", "bilibili_card", "movie_card",
+]
+
+_FIELD_IDS = {name: i for i, name in enumerate(FIELDS)}
+_TYPE_IDS = {name: i for i, name in enumerate(TYPES)}
+
+
+def _shorten(value):
+    if isinstance(value, dict):
+        return {_FIELD_IDS.get(k, k): _shorten(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten(v) for v in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        return {FIELDS[k] if isinstance(k, int) and 0 <= k < len(FIELDS) else k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+def _pack_into(out: bytearray, obj):
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif 0 <= obj <= 0xFFFFFFFF:
+            out += struct.pack(">BB", 0xCC, obj) if obj <= 0xFF else struct.pack(">BH", 0xCD, obj) if obj <= 0xFFFF else struct.pack(">BI", 0xCE, obj)
+        elif 0 <= obj <= 0xFFFFFFFFFFFFFFFF:
+            out += struct.pack(">BQ", 0xCF, obj)
+        elif -0x80000000 <= obj < 0:
+            out += struct.pack(">Bi", 0xD2, obj)
+        elif -0x8000000000000000 <= obj < 0:
+            out += struct.pack(">Bq", 0xD3, obj)
+        else:
+            raise ValueError("integer out of range")
+    elif isinstance(obj, float):
+        out += struct.pack(">Bd", 0xCB, obj)
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        n = len(data)
+        if n < 32:
+            out.append(0xA0 | n)
+        elif n <= 0xFF:
+            out += struct.pack(">BB", 0xD9, n)
+        elif n <= 0xFFFF:
+            out += struct.pack(">BH", 0xDA, n)
+        else:
+            out += struct.pack(">BI", 0xDB, n)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        out += struct.pack(">BB", 0xC4, n) if n <= 0xFF else struct.pack(">BH", 0xC5, n) if n <= 0xFFFF else struct.pack(">BI", 0xC6, n)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        out += bytes([0x90 | n]) if n < 16 else struct.pack(">BH", 0xDC, n) if n <= 0xFFFF else struct.pack(">BI", 0xDD, n)
+        for item in obj:
+            _pack_into(out, item)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        out += bytes([0x80 | n]) if n < 16 else struct.pack(">BH", 0xDE, n) if n <= 0xFFFF else struct.pack(">BI", 0xDF, n)
+        for key, value in obj.items():
+            _pack_into(out, key)
+            _pack_into(out, value)
+    else:
+        raise TypeError(f"cannot pack {type(obj).__name__}")
+
+
+def _packb(obj) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _pack_into(out, obj)
+    return bytes(out)
+
+
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, n: int) -> bytes:
+        if self.pos + n > len(self.data):
+            raise ValueError("truncated msgpack data")
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def unpack(self, fmt: str):
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))[0]
+
+    def read(self, depth: int = 0):
+        if depth > 32:
+            raise ValueError("msgpack data nested too deeply")
+        b = self.take(1)[0]
+        if b < 0x80:
+            return b
+        if b >= 0xE0:
+            return b - 0x100
+        if 0xA0 <= b <= 0xBF:
+            return self.take(b & 0x1F).decode("utf-8")
+        if 0x90 <= b <= 0x9F:
+            return [self.read(depth + 1) for _ in range(b & 0x0F)]
+        if 0x80 <= b <= 0x8F:
+            return self._map(b & 0x0F, depth)
+        if b == 0xC0:
+            return None
+        if b == 0xC2:
+            return False
+        if b == 0xC3:
+            return True
+        if b in (0xC4, 0xC5, 0xC6):
+            return bytes(self.take(self.unpack({0xC4: ">B", 0xC5: ">H", 0xC6: ">I"}[b])))
+        if b == 0xCA:
+            return self.unpack(">f")
+        if b == 0xCB:
+            return self.unpack(">d")
+        ints = {0xCC: ">B", 0xCD: ">H", 0xCE: ">I", 0xCF: ">Q", 0xD0: ">b", 0xD1: ">h", 0xD2: ">i", 0xD3: ">q"}
+        if b in ints:
+            return self.unpack(ints[b])
+        if b in (0xD9, 0xDA, 0xDB):
+            return self.take(self.unpack({0xD9: ">B", 0xDA: ">H", 0xDB: ">I"}[b])).decode("utf-8")
+        if b in (0xDC, 0xDD):
+            return [self.read(depth + 1) for _ in range(self.unpack(">H" if b == 0xDC else ">I"))]
+        if b in (0xDE, 0xDF):
+            return self._map(self.unpack(">H" if b == 0xDE else ">I"), depth)
+        raise ValueError(f"unsupported msgpack type 0x{b:02x}")
+
+    def _map(self, n: int, depth: int) -> dict:
+        result = {}
+        for _ in range(n):
+            key = self.read(depth + 1)
+            result[key] = self.read(depth + 1)
+        return result
+
+
+def _unpackb(data: bytes):
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    reader = _Reader(data)
+    obj = reader.read()
+    if reader.pos != len(data):
+        raise ValueError("extra bytes after msgpack data")
+    return obj
+
+
+def pack(payload: dict) -> bytes:
+    body = _shorten(payload)
+    if isinstance(body, dict) and isinstance(body.get(0), str) and body[0] in _TYPE_IDS:
+        body[0] = _TYPE_IDS[body[0]]
+    return _packb(body)
+
+
+def unpack(data: bytes):
+    body = _unpackb(data)
+    if isinstance(body, dict) and isinstance(body.get(0), int) and 0 <= body[0] < len(TYPES):
+        body[0] = TYPES[body[0]]
+    return _expand(body)
@@ -0,0 +1,172 @@
+import sqlite3
+import time
+
+import tornado.ioloop
+
+import storage
+from db import save_messages
+
+
+# 数据库暂时不可写（锁超时、磁盘满等）时整批放回队首，按指数退避重试，已广播的消息不丢
+RETRY_MIN = 0.1
+RETRY_MAX = 5.0
+# 退出时最多重试的次数，避免数据库一直不可用时无法退出
+CLOSE_ATTEMPTS = 3
+
+
+class MessageWriter:
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = []
+        # 正在写入数据库的那一批，写完前同样算作未落库
+        self._inflight = []
+        self._timer = None
+        self._flushing = False
+        self._closed = False
+        self._retry_delay = 0.0
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "errors": 0,
+            "retries": 0,
+            "dropped": 0,
+            "max_queue_depth": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, room: str, sender: str, mtype: str, content: str, ts: int, seq: int | None = None, item: dict | None = None):
+        row = (room, sender, mtype, content, ts, seq)
+        if self._closed:
+            self._write_now([(row, item)])
+            return
+        self._queue.append((row, item))
+        self.stats["enqueued"] += 1
+        if len(self._queue) > self.stats["max_queue_depth"]:
+            self.stats["max_queue_depth"] = len(self._queue)
+        # 正在写或正在退避等待重试时，新消息只排队
+        if self._flushing or self._retry_delay:
+            return
+        loop = tornado.ioloop.IOLoop.current()
+        if len(self._queue) >= self.batch_size:
+            if self._timer is not None:
+                loop.remove_timeout(self._timer)
+                self._timer = None
+            loop.add_callback(self._flush)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush)
+
+    def pending_rooms(self) -> set[str]:
+        # 还有消息未落库的房间；这些房间被回收后重新预热会读到过期的最大序号
+        return {row[0] for row, _ in self._queue} | {row[0] for row, _ in self._inflight}
+
+    def discard_room(self, room: str):
+        self._queue = [entry for entry in self._queue if entry[0][0] != room]
+
+    async def _flush(self):
+        self._timer = None
+        if self._flushing or not self._queue:
+            return
+        self._flushing = True
+        try:
+            while self._queue:
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+                self._inflight = batch
+                start = time.perf_counter()
+                try:
+                    # 与其它写操作共用 storage 的写线程，保证和清空记录等操作的先后顺序
+                    ids = await storage.save_messages([row for row, _ in batch])
+                except sqlite3.OperationalError:
+                    self.stats["errors"] += 1
+                    self._queue[:0] = batch
+                    self._schedule_retry()
+                    return
+                except Exception:
+                    # 其它错误与数据本身有关，重试整批没有意义：逐条写入，只丢弃写不进去的那几条
+                    self.stats["errors"] += 1
+                    await self._save_each(batch)
+                    continue
+                finally:
+                    self._inflight = []
+                self._retry_delay = 0.0
+                self._record(len(batch), start)
+                self._assign_ids(batch, ids)
+        finally:
+            self._flushing = False
+
+    def _schedule_retry(self):
+        self._retry_delay = min(max(self._retry_delay * 2, RETRY_MIN), RETRY_MAX)
+        self.stats["retries"] += 1
+        self._timer = tornado.ioloop.IOLoop.current().call_later(self._retry_delay, self._flush)
+
+    async def _save_each(self, batch: list):
+        for entry in batch:
+            start = time.perf_counter()
+            try:
+                ids = await storage.save_messages([entry[0]])
+            except Exception:
+                self.stats["dropped"] += 1
+                continue
+            self._record(1, start)
+            self._assign_ids([entry], ids)
+
+    def _write_now(self, batch: list) -> bool:
+        # 退出阶段同步写入；数据库暂时不可用时有限次重试，仍失败则计入 dropped
+        for attempt in range(CLOSE_ATTEMPTS):
+            start = time.perf_counter()
+            try:
+                ids = save_messages([row for row, _ in batch])
+            except sqlite3.OperationalError:
+                self.stats["errors"] += 1
+                if attempt + 1 < CLOSE_ATTEMPTS:
+                    time.sleep(RETRY_MIN * 2 ** attempt)
+                continue
+            except Exception:
+                self.stats["errors"] += 1
+                break
+            self._record(len(batch), start)
+            self._assign_ids(batch, ids)
+            return True
+        self.stats["dropped"] += len(batch)
+        return False
+
+    @staticmethod
+    def _assign_ids(batch: list, ids: list[int]):
+        for (_, item), msg_id in zip(batch, ids):
+            if item is not None:
+                item["id"] = msg_id
+
+    def _record(self, count: int, start: float):
+        ms = (time.perf_counter() - start) * 1000
+        self.stats["written"] += count
+        self.stats["batches"] += 1
+        self.stats["last_flush_ms"] = ms
+        self.stats["total_flush_ms"] += ms
+        if ms > self.stats["max_flush_ms"]:
+            self.stats["max_flush_ms"] = ms
+
+    def close(self):
+        self._closed = True
+        if self._timer is not None:
+            try:
+                tornado.ioloop.IOLoop.current().remove_timeout(self._timer)
+            except Exception:
+                pass
+            self._timer = None
+        self._retry_delay = 0.0
+        storage.wait_writes()
+        while self._queue:
+            batch = self._queue[:self.batch_size]
+            del self._queue[:self.batch_size]
+            if not self._write_now(batch):
+                # 数据库仍不可用，剩余的批次不再逐批等待重试
+                self.stats["dropped"] += len(self._queue)
+                self._queue = []
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# 服务端模块按 server/ 目录平铺导入（import app、import db）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+import db  # noqa: E402
+
+db.init_db(os.path.join(tempfile.mkdtemp(prefix="zzchat-test-"), "zzchat.db"))
@@ -0,0 +1,52 @@
+import json
+import os
+from unittest import mock
+
+import tornado.testing
+import tornado.web
+
+import app
+
+
+class FakeCompletions(tornado.web.RequestHandler):
+    async def post(self):
+        if json.loads(self.request.body)["messages"][-1]["content"] == "fail":
+            raise tornado.web.HTTPError(500)
+        self.set_header("Content-Type", "text/event-stream")
+        for text in ("你", "好"):
+            self.write("data: " + json.dumps({"choices": [{"delta": {"content": text}}]}) + "\n\n")
+            await self.flush()
+        self.write("data: [DONE]\n\n")
+
+
+class AIStreamTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        application = app.make_app(debug=False)
+        application.add_handlers(r".*", [(r"/fake/v1/chat/completions", FakeCompletions)])
+        return application
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(os.environ, {"SILICONFLOW_API_KEY": "test",
+                                               "SILICONFLOW_BASE_URL": self.get_url("/fake/v1/")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.before = dict(app.AI_STATS)
+
+    def delta(self, key):
+        return app.AI_STATS[key] - self.before[key]
+
+    def test_stream_reports_stats(self):
+        body = self.fetch("/ai?prompt=hi").body.decode("utf-8")
+        self.assertIn("event: stats", body)
+        self.assertTrue(body.endswith("data: [DONE]\n\n"))
+        self.assertEqual((self.delta("completed"), self.delta("errors"), self.delta("tokens")), (1, 0, 2))
+
+    def test_failed_upstream_counts_only_as_error(self):
+        self.before["last_ttft_ms"] = app.AI_STATS["last_ttft_ms"] = 123.0
+        body = self.fetch("/ai?prompt=fail").body.decode("utf-8")
+        self.assertIn("event: error", body)
+        self.assertNotIn("event: stats", body)
+        self.assertTrue(body.endswith("data: [DONE]\n\n"))
+        self.assertEqual((self.delta("completed"), self.delta("errors"), self.delta("tokens")), (0, 1, 0))
+        self.assertEqual(app.AI_STATS["last_ttft_ms"], 123.0)
@@ -0,0 +1,63 @@
+import gzip
+import os
+import re
+import unittest
+from unittest import mock
+
+import tornado.testing
+
+import app
+import assets
+
+
+class PrecompressTest(unittest.TestCase):
+    def test_repeated_make_app_does_not_accumulate(self):
+        app.make_app(debug=False)
+        first = dict(assets.STATS)
+        self.assertGreater(first["files"], 0)
+        with mock.patch.object(assets.gzip, "compress", side_effect=AssertionError("recompressed")):
+            app.make_app(debug=False)
+        for key in ("files", "raw_bytes", "gzip_bytes", "br_bytes"):
+            self.assertEqual(assets.STATS[key], first[key])
+        self.assertEqual(first["raw_bytes"], sum(entry[2] for entry in assets._compressed.values()))
+
+
+class AssetServingTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    def versioned_url(self, name):
+        page = self.fetch("/login").body.decode("utf-8")
+        return re.search(r'"(/static/%s\?v=[0-9a-f]+)"' % re.escape(name), page).group(1)
+
+    def test_templates_are_precompiled(self):
+        loader = self._app.settings["template_loader"]
+        self.assertIn("login.html", loader.templates)
+        self.assertIn("chat.html", loader.templates)
+
+    def test_versioned_asset_is_immutable_and_precompressed(self):
+        url = self.versioned_url("js/login.js")
+        with open(os.path.join(os.path.dirname(app.__file__), "static", "js", "login.js"), "rb") as f:
+            raw = f.read()
+        response = self.fetch(url, headers={"Accept-Encoding": "gzip"}, decompress_response=False)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(response.body), raw)
+        etag = response.headers["Etag"]
+        self.assertTrue(etag.endswith('-gzip"'))
+        cached = self.fetch(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}, decompress_response=False)
+        self.assertEqual(cached.code, 304)
+
+        plain = self.fetch(url, headers={"Accept-Encoding": "identity"}, decompress_response=False)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.body, raw)
+        self.assertNotEqual(plain.headers["Etag"], etag)
+
+    def test_unversioned_asset_is_not_immutable(self):
+        response = self.fetch("/static/js/login.js")
+        self.assertNotIn("immutable", response.headers.get("Cache-Control", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+import run  # noqa: E402
+
+
+class BenchHelpersTest(unittest.TestCase):
+    def test_percentiles(self):
+        self.assertEqual(run.percentiles([]), {"count": 0})
+        result = run.percentiles([float(v) for v in range(100, 0, -1)])
+        self.assertEqual((result["count"], result["p50"], result["p99"], result["max"]), (100, 51.0, 99.0, 100.0))
+
+    def test_compare_marks_direction(self):
+        old = {"commit": "a", "chat": {"latency_ms": {"p50": 10.0}, "deliveries_per_sec": 100.0}}
+        new = {"commit": "b", "chat": {"latency_ms": {"p50": 5.0}, "deliveries_per_sec": 50.0}}
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            run.compare(old, new)
+        lines = {line.split()[0]: line for line in out.getvalue().splitlines() if line.startswith("  ")}
+        self.assertIn("更好", lines["chat.latency_ms.p50"])
+        self.assertIn("更差", lines["chat.deliveries_per_sec"])
+        self.assertNotIn("db.rows_per_sec", lines)
+
+
+class BenchSmokeTest(unittest.TestCase):
+    def test_small_run_delivers_everything(self):
+        # 压测在导入服务端模块前写好临时配置，只能在子进程里完整运行
+        path = os.path.join(tempfile.mkdtemp(prefix="zzchat-bench-test-"), "result.json")
+        args = ["--clients", "20", "--rooms", "2", "--senders", "4", "--rate", "40", "--duration", "0.5",
+                "--drain", "3", "--plugin-requests", "3", "--plugin-rate", "20", "--ai-requests", "2",
+                "--ai-concurrency", "2", "--ai-tokens", "5", "--ai-token-delay-ms", "1",
+                "--upstream-delay-ms", "5", "--json", path]
+        proc = subprocess.run([sys.executable, "run.py"] + args, cwd=BENCH_DIR, capture_output=True, timeout=60)
+        self.assertEqual(proc.returncode, 0, proc.stderr.decode("utf-8", "replace"))
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        self.assertEqual(result["connect"]["errors"], 0)
+        self.assertEqual(result["chat"]["loss"], 0)
+        self.assertEqual(result["chat"]["delivered"], result["chat"]["expected"])
+        self.assertEqual(result["plugin"]["answered"], 3)
+        self.assertEqual(result["ai"]["errors"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
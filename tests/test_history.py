@@ -0,0 +1,83 @@
+import asyncio
+import json
+import unittest
+from collections import deque
+from unittest import mock
+
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+import storage
+
+
+def item(i, ts, id=None):
+    return {"id": id, "room": "r", "sender": "a", "type": "message", "content": f"m{i}", "ts": ts, "seq": i}
+
+
+def room(items, maxlen=10, warm=True):
+    return {"recent": deque(items, maxlen=maxlen), "warm": warm}
+
+
+class RecentPageTest(unittest.TestCase):
+    def test_pages_newest_first_with_real_cursor(self):
+        room_obj = room([item(i, i * 10, id=i) for i in range(1, 6)])
+        items, cursor = app.recent_page(room_obj, 2)
+        self.assertEqual([it["id"] for it in items], [5, 4])
+        self.assertEqual(cursor, {"before_ts": 40, "before_id": 4})
+        items, cursor = app.recent_page(room_obj, 2, 40, 4)
+        self.assertEqual([it["id"] for it in items], [3, 2])
+        # 缓冲未满说明房间全部消息都在缓冲里，翻到底时不必再查数据库
+        items, cursor = app.recent_page(room_obj, 2, 20, 2)
+        self.assertEqual([it["id"] for it in items], [1])
+        self.assertIsNone(cursor)
+
+    def test_cold_or_partial_buffer_falls_back(self):
+        self.assertIsNone(app.recent_page(room([item(1, 10, id=1)], warm=False), 2))
+        full = room([item(i, i * 10, id=i) for i in range(1, 4)], maxlen=3)
+        # 缓冲已满且不够一页：更早的消息只在数据库里
+        self.assertIsNone(app.recent_page(full, 2, 20, 2))
+
+    def test_unwritten_items_never_become_cursors(self):
+        room_obj = room([item(1, 10, id=1), item(2, 20), item(3, 30)])
+        self.assertIsNone(app.recent_page(room_obj, 2))
+        # 与游标同一毫秒、还没有 id 的条目无法判断先后
+        self.assertIsNone(app.recent_page(room_obj, 1, 20, 7))
+        # 不满一页时没有游标，缓冲可以直接回答
+        items, cursor = app.recent_page(room_obj, 5)
+        self.assertEqual([it["content"] for it in items], ["m3", "m2", "m1"])
+        self.assertIsNone(cursor)
+
+
+class BufferServedTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    @tornado.testing.gen_test
+    async def test_history_and_backlog_come_from_the_buffer(self):
+        url = f"ws://127.0.0.1:{self.get_http_port()}/ws?room=buffer-served&nick=a"
+        first = await websocket_connect(url)
+        await first.read_message()
+        for i in range(3):
+            app.publish_room("buffer-served", {"type": "message", "sender": "a", "content": f"m{i}", "ts": 100 + i})
+        recent = app.ROOMS["buffer-served"]["recent"]
+        while any(it["id"] is None for it in recent):
+            await asyncio.sleep(0.01)
+
+        async def unavailable(*args, **kwargs):
+            raise AssertionError("buffer should answer without SQLite")
+
+        with mock.patch.object(storage, "fetch_history_page", unavailable):
+            response = await self.http_client.fetch(self.get_url("/history?room=buffer-served&limit=2"))
+            body = json.loads(response.body)
+            self.assertEqual([it["content"] for it in body["items"]], ["m2", "m1"])
+            second = await websocket_connect(url)
+            backlog = json.loads(await second.read_message())
+            self.assertEqual(backlog["type"], "backlog")
+            self.assertEqual([it["content"] for it in backlog["content"]], ["m0", "m1", "m2"])
+        first.close()
+        second.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import json
+
+import tornado.testing
+
+import app
+import backup
+
+
+class ImportHandlerTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    def tearDown(self):
+        app.IMPORT_ENABLED = False
+        super().tearDown()
+
+    def post_import(self, room, rows, query=""):
+        body = b"".join(backup.encode_line(row) for row in rows)
+        return self.fetch(f"/api/rooms/{room}/import{query}", method="POST", body=body)
+
+    def test_disabled_by_default(self):
+        response = self.post_import("import-off", [{"sender": "a", "content": "x", "ts": 1}])
+        self.assertEqual(response.code, 403)
+        self.assertEqual(json.loads(response.body)["code"], 1)
+
+    def test_keep_seq_advances_room_seq(self):
+        app.IMPORT_ENABLED = True
+        room_obj = app.ROOMS.acquire("import-seq")
+        self.addCleanup(app.ROOMS.release, room_obj)
+        rows = [{"sender": "a", "content": f"m{i}", "ts": i, "seq": i} for i in range(1, 6)]
+        response = self.post_import("import-seq", rows, "?keep_seq=1")
+        self.assertEqual(json.loads(response.body)["imported"], 5)
+        self.assertEqual(room_obj["seq"], 5)
+        payload = {"type": "message", "sender": "a", "content": "live", "ts": 6}
+        app.publish_room("import-seq", payload)
+        self.assertEqual(payload["seq"], 6)
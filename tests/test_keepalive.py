@@ -0,0 +1,61 @@
+import asyncio
+import base64
+import os
+from unittest import mock
+
+import tornado.tcpclient
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+
+
+class KeepaliveTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    async def raw_connect(self, room):
+        # 只完成握手、之后不读不回 pong，模拟半开连接
+        port = self.get_http_port()
+        stream = await tornado.tcpclient.TCPClient().connect("127.0.0.1", port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        stream.write((
+            f"GET /ws?room={room}&nick=ghost HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUpgrade: websocket\r\n"
+            f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        await stream.read_until(b"\r\n\r\n")
+        return stream
+
+    async def wait_for(self, predicate, timeout=3.0):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not predicate():
+            self.assertLess(asyncio.get_running_loop().time(), deadline, "condition not met in time")
+            await asyncio.sleep(0.02)
+
+    @tornado.testing.gen_test
+    async def test_missing_pong_is_reaped_and_counted(self):
+        with mock.patch.object(app, "WS_PING_INTERVAL", 0.1), mock.patch.object(app, "WS_PING_TIMEOUT", 0.1):
+            reaped = app.WS_STATS["reaped_ping"]
+            alive = await websocket_connect(f"ws://127.0.0.1:{self.get_http_port()}/ws?room=keepalive&nick=alive")
+            stream = await self.raw_connect("keepalive")
+            await self.wait_for(lambda: len(app.ROOMS["keepalive"]["clients"]) == 2)
+            await self.wait_for(lambda: len(app.ROOMS["keepalive"]["clients"]) == 1)
+            self.assertEqual(app.WS_STATS["reaped_ping"], reaped + 1)
+            handler = next(iter(app.ROOMS["keepalive"]["clients"]))
+            self.assertEqual(handler.nick, "alive")
+            alive.close()
+            stream.close()
+
+    @tornado.testing.gen_test
+    async def test_other_server_closes_are_not_counted(self):
+        with mock.patch.object(app, "WS_PING_INTERVAL", 0.1), mock.patch.object(app, "WS_PING_TIMEOUT", 0.1):
+            reaped = app.WS_STATS["reaped_ping"]
+            conn = await websocket_connect(f"ws://127.0.0.1:{self.get_http_port()}/ws?room=keepalive-close&nick=a")
+            await self.wait_for(lambda: app.ROOMS.get("keepalive-close") and app.ROOMS["keepalive-close"]["clients"])
+            # 安静一段时间后由服务端主动关闭，不算心跳超时
+            await asyncio.sleep(0.35)
+            next(iter(app.ROOMS["keepalive-close"]["clients"])).close(1008, "bye")
+            while await conn.read_message() is not None:
+                pass
+            await asyncio.sleep(0.05)
+            self.assertEqual(app.WS_STATS["reaped_ping"], reaped)
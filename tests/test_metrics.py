@@ -0,0 +1,71 @@
+import json
+from unittest import mock
+
+import tornado.testing
+
+import app
+import metrics
+import upstream
+from plugins.cache import PLUGIN_CACHE
+from plugins.news import handle_news
+from tasks import PluginScheduler
+
+
+class FakeReply:
+    def __init__(self):
+        self.sent = []
+
+    def broadcast(self, payload, persist=True):
+        self.sent.append(payload)
+
+
+class PluginOutcomeTest(tornado.testing.AsyncTestCase):
+    def outcome(self, kind):
+        return metrics.PLUGIN_OUTCOMES._values.get(("news", kind), 0)
+
+    async def run_news(self, fetch):
+        scheduler = PluginScheduler()
+        reply = FakeReply()
+        errors = []
+        PLUGIN_CACHE.invalidate("news")
+        with mock.patch.object(upstream.PLUGIN_HTTP, "fetch", fetch):
+            await scheduler.submit(object(), "news", lambda: handle_news(reply), errors.append)
+        return scheduler, reply, errors
+
+    @tornado.testing.gen_test
+    async def test_upstream_exception_is_counted_as_error(self):
+        before = self.outcome("error")
+
+        async def broken(*args, **kwargs):
+            raise ConnectionRefusedError("upstream down")
+
+        scheduler, reply, errors = await self.run_news(broken)
+        self.assertEqual((scheduler.stats["failed"], errors, reply.sent), (1, ["error"], []))
+        self.assertIn("upstream down", scheduler.stats["last_error"])
+        self.assertEqual(self.outcome("error"), before + 1)
+
+    @tornado.testing.gen_test
+    async def test_upstream_error_code_replies_once_and_counts(self):
+        before = self.outcome("error")
+
+        async def bad_code(*args, **kwargs):
+            return mock.Mock(body=json.dumps({"code": 500, "msg": "quota"}).encode())
+
+        scheduler, reply, errors = await self.run_news(bad_code)
+        self.assertEqual((scheduler.stats["failed"], errors), (1, []))
+        self.assertEqual([p["content"] for p in reply.sent], ["新闻获取失败: quota"])
+        self.assertEqual(self.outcome("error"), before + 1)
+
+
+class MetricsEndpointTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    def test_exposes_prometheus_text(self):
+        metrics.PLUGIN_OUTCOMES.inc(1, "news", "error")
+        response = self.fetch("/metrics")
+        self.assertEqual(response.code, 200)
+        body = response.body.decode("utf-8")
+        self.assertIn("# TYPE zzchat_plugin_tasks_total counter", body)
+        self.assertIn('zzchat_plugin_tasks_total{plugin="news",outcome="error"}', body)
+        self.assertIn("zzchat_ioloop_lag_seconds", body)
@@ -0,0 +1,90 @@
+import asyncio
+from unittest import mock
+
+import tornado.testing
+
+from plugins import cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class TTLCacheTest(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(cache, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def fetcher(self, value, delay=0.0):
+        async def fetch():
+            self.calls.append(value)
+            await asyncio.sleep(delay)
+            return value
+        return fetch
+
+    @tornado.testing.gen_test
+    async def test_concurrent_misses_share_one_fetch(self):
+        c = cache.TTLCache()
+        results = await asyncio.gather(*(c.get("k", self.fetcher("v", 0.01), ttl=10) for _ in range(3)))
+        self.assertEqual(results, ["v"] * 3)
+        self.assertEqual(self.calls, ["v"])
+        self.assertEqual((c.stats["misses"], c.stats["coalesced"]), (1, 2))
+        self.assertEqual(await c.get("k", self.fetcher("new"), ttl=10), "v")
+        self.assertEqual(c.stats["hits"], 1)
+
+    @tornado.testing.gen_test
+    async def test_stale_value_is_served_while_refreshing(self):
+        c = cache.TTLCache()
+        await c.get("k", self.fetcher("old"), ttl=10, stale_ttl=30)
+        self.clock.now += 15
+        self.assertEqual(await c.get("k", self.fetcher("new", 0.01), ttl=10, stale_ttl=30), "old")
+        # 刷新进行中，再次读取仍返回旧值且不重复发起刷新
+        self.assertEqual(await c.get("k", self.fetcher("newer"), ttl=10, stale_ttl=30), "old")
+        await asyncio.sleep(0.05)
+        self.assertEqual(await c.get("k", self.fetcher("newer"), ttl=10, stale_ttl=30), "new")
+        self.assertEqual(self.calls, ["old", "new"])
+        self.assertEqual((c.stats["stale_hits"], c.stats["refreshes"]), (2, 1))
+        self.clock.now += 50
+        self.assertEqual(await c.get("k", self.fetcher("newest"), ttl=10, stale_ttl=30), "newest")
+
+    @tornado.testing.gen_test
+    async def test_errors_and_uncacheable_values_are_not_stored(self):
+        c = cache.TTLCache()
+
+        async def broken():
+            raise RuntimeError("upstream down")
+
+        with self.assertRaises(RuntimeError):
+            await c.get("k", broken, ttl=10)
+        self.assertEqual((c.stats["errors"], len(c), c.snapshot()["inflight"]), (1, 0, 0))
+        await c.get("k", self.fetcher({"code": 500}), ttl=10, cacheable=lambda v: v["code"] == 0)
+        await c.get("z", self.fetcher("once"), ttl=0)
+        self.assertEqual(len(c), 0)
+
+    @tornado.testing.gen_test
+    async def test_evicts_least_recently_used(self):
+        c = cache.TTLCache(max_entries=2)
+        await c.get("a", self.fetcher("A"), ttl=10)
+        await c.get("b", self.fetcher("B"), ttl=10)
+        await c.get("a", self.fetcher("A2"), ttl=10)
+        await c.get("c", self.fetcher("C"), ttl=10)
+        self.assertEqual(list(c._entries), ["a", "c"])
+        self.assertEqual(c.stats["evictions"], 1)
+
+    @tornado.testing.gen_test
+    async def test_byte_budget(self):
+        c = cache.TTLCache(max_bytes=15)
+        await c.get("a", self.fetcher("x" * 8), ttl=10)
+        await c.get("b", self.fetcher("y" * 8), ttl=10)
+        self.assertEqual((list(c._entries), c.size_bytes), (["b"], 10))
+        # 单个值超过总预算时不缓存，也不挤掉已有条目
+        await c.get("big", self.fetcher("z" * 20), ttl=10)
+        self.assertEqual(list(c._entries), ["b"])
@@ -0,0 +1,92 @@
+import json
+import unittest
+from unittest import mock
+
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+import presence
+from presence import Presence
+
+
+class RemotePresenceTest(unittest.TestCase):
+    def test_sync_for_unopened_room_is_applied(self):
+        room = "presence-remote"
+        self.assertIsNone(app.ROOMS.get(room))
+        app.deliver_remote(room, json.dumps({"type": "presence_sync", "node": "other-node", "roster": ["bob"]}))
+        self.addCleanup(app.PRESENCE.apply_remote, room, {"node": "other-node", "roster": []})
+        self.assertEqual(app.PRESENCE.online(room), {"bob"})
+        self.assertEqual(app.PRESENCE.roster_frame(room)["roster"], ["bob"])
+
+
+class PresenceTest(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.frames = []
+        self.syncs = []
+        self.presence = Presence(interval=60, heartbeat=30)
+        self.presence.send = lambda room, text: self.frames.append((room, json.loads(text)))
+        self.presence.publish = lambda room, text: self.syncs.append((room, json.loads(text)))
+
+    def test_tabs_of_one_nick_are_reference_counted(self):
+        p = self.presence
+        p.join("r", "alice")
+        p.join("r", "alice")
+        p.join("r", "bob")
+        p.flush()
+        self.assertEqual(self.frames, [("r", {"type": "presence", "joined": ["alice", "bob"], "left": [], "count": 2})])
+        p.leave("r", "alice")
+        p.flush()
+        # 还有一个标签页在线，名单不变，不发帧
+        self.assertEqual(len(self.frames), 1)
+        self.assertEqual((p.online("r"), p.connections("r")), ({"alice", "bob"}, 2))
+        p.leave("r", "alice")
+        p.leave("r", "alice")
+        p.flush()
+        self.assertEqual(self.frames[-1][1], {"type": "presence", "joined": [], "left": ["alice"], "count": 1})
+
+    def test_leave_then_rejoin_within_interval_is_coalesced(self):
+        p = self.presence
+        p.join("r", "alice")
+        p.flush()
+        p.leave("r", "alice")
+        p.join("r", "alice")
+        p.flush()
+        self.assertEqual(len(self.frames), 1)
+        self.assertEqual(p.stats["coalesced"], 1)
+        # 名单有变化的房间各同步一次本节点名单
+        self.assertEqual([sync["roster"] for _, sync in self.syncs], [["alice"], ["alice"]])
+
+    def test_remote_roster_expires_after_missed_heartbeats(self):
+        clock = [100.0]
+        with mock.patch.object(presence.time, "monotonic", lambda: clock[0]):
+            self.presence.apply_remote("r", {"node": "n2", "roster": ["carol"]})
+            self.presence.flush()
+            self.assertEqual(self.frames[-1][1]["joined"], ["carol"])
+            clock[0] += 30 * 3 + 1
+            self.presence._beat()
+            self.presence.flush()
+        self.assertEqual(self.presence.online("r"), set())
+        self.assertEqual(self.frames[-1][1]["left"], ["carol"])
+
+
+class OnlineApiTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    @tornado.testing.gen_test
+    async def test_online_counts_nicks_and_connections(self):
+        url = f"ws://127.0.0.1:{self.get_http_port()}/ws?room=presence-api&nick=dave"
+        conns = [await websocket_connect(url) for _ in range(2)]
+        for conn in conns:
+            await conn.read_message()
+        response = await self.http_client.fetch(self.get_url("/api/rooms/presence-api/online"))
+        data = json.loads(response.body)
+        self.assertEqual((data["online"], data["count"], data["connections"]), (["dave"], 1, 2))
+        for conn in conns:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import socket
+import tempfile
+
+import tornado.iostream
+import tornado.testing
+
+import pubsub
+
+
+class FakeRedis:
+    # 本地替身：只实现 AUTH/PUBLISH/SUBSCRIBE/UNSUBSCRIBE，足够驱动 RedisBackend
+    def __init__(self, password=None):
+        self.password = password
+        self.server = None
+        self.port = None
+        self.channels = {}
+        self.writers = set()
+        self.commands = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def drop_clients(self):
+        for writer in list(self.writers):
+            writer.close()
+        self.writers.clear()
+        self.channels.clear()
+
+    async def stop(self):
+        self.drop_clients()
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(FakeRedis.encode(v) for v in value)
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    async def read_command(self, reader):
+        line = await reader.readuntil(b"\r\n")
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readuntil(b"\r\n"))[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(self, reader, writer):
+        self.writers.add(writer)
+        subscribed = set()
+        authed = self.password is None
+        try:
+            while True:
+                args = await self.read_command(reader)
+                name = args[0].decode().upper()
+                self.commands.append([name] + [a.decode("utf-8", "replace") for a in args[1:]])
+                if name == "AUTH":
+                    authed = args[1].decode() == self.password
+                    writer.write(b"+OK\r\n" if authed else b"-ERR invalid password\r\n")
+                elif not authed:
+                    writer.write(b"-NOAUTH Authentication required.\r\n")
+                elif name == "PUBLISH":
+                    targets = self.channels.get(args[1], set())
+                    for target in targets:
+                        target.write(self.encode([b"message", args[1], args[2]]))
+                    writer.write(self.encode(len(targets)))
+                elif name in ("SUBSCRIBE", "UNSUBSCRIBE"):
+                    for channel in args[1:]:
+                        if name == "SUBSCRIBE":
+                            subscribed.add(channel)
+                            self.channels.setdefault(channel, set()).add(writer)
+                        else:
+                            subscribed.discard(channel)
+                            self.channels.get(channel, set()).discard(writer)
+                        writer.write(self.encode([name.lower().encode(), channel, len(subscribed)]))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            self.writers.discard(writer)
+            writer.close()
+
+
+async def wait_for(predicate, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+class ReadRespTest(tornado.testing.AsyncTestCase):
+    @tornado.testing.gen_test
+    async def test_parses_nested_replies(self):
+        a, b = socket.socketpair()
+        stream = tornado.iostream.IOStream(a)
+        b.sendall(b"*4\r\n+OK\r\n:3\r\n$5\r\nhe\r\no\r\n*2\r\n$-1\r\n-ERR x\r\n")
+        try:
+            self.assertEqual(await pubsub._read_resp(stream), ["OK", 3, b"he\r\no", [None, "ERR x"]])
+        finally:
+            stream.close()
+            b.close()
+
+
+class RedisBackendTest(tornado.testing.AsyncTestCase):
+    async def start_pair(self, password=None):
+        self.redis = FakeRedis(password)
+        await self.redis.start()
+        url = f"redis://:{password}@127.0.0.1:{self.redis.port}" if password else f"redis://127.0.0.1:{self.redis.port}"
+        self.got = ([], [])
+        self.nodes = [pubsub.RedisBackend(url, retry_interval=0.05) for _ in range(2)]
+        for node, got in zip(self.nodes, self.got):
+            node.start(got.append)
+        await wait_for(lambda: all(n._pub is not None and n._sub is not None for n in self.nodes))
+
+    async def stop_pair(self):
+        for node in self.nodes:
+            node.close()
+        await self.redis.stop()
+
+    def subscribers(self, room):
+        return len(self.redis.channels.get(("zzchat:room:" + room).encode(), ()))
+
+    @tornado.testing.gen_test
+    async def test_publish_subscribe_unsubscribe(self):
+        await self.start_pair(password="secret")
+        try:
+            self.nodes[1].subscribe("general")
+            await wait_for(lambda: self.subscribers("general") == 1)
+            self.nodes[0].publish("general", b"hello")
+            await wait_for(lambda: self.got[1] == [b"hello"])
+            self.nodes[1].unsubscribe("general")
+            await wait_for(lambda: self.subscribers("general") == 0)
+            self.nodes[0].publish("general", b"ignored")
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.got[1], [b"hello"])
+            self.assertEqual(self.nodes[0].stats["sent"], 2)
+        finally:
+            await self.stop_pair()
+
+    @tornado.testing.gen_test
+    async def test_resubscribes_after_reconnect(self):
+        await self.start_pair()
+        try:
+            self.nodes[1].subscribe("a")
+            self.nodes[1].subscribe("b")
+            await wait_for(lambda: self.subscribers("a") == 1 and self.subscribers("b") == 1)
+            self.redis.drop_clients()
+            await wait_for(lambda: self.subscribers("a") == 1 and self.subscribers("b") == 1 and self.nodes[0]._pub is not None)
+            self.assertGreaterEqual(self.nodes[1].stats["reconnects"], 1)
+            self.nodes[0].publish("b", b"after")
+            await wait_for(lambda: self.got[1] == [b"after"])
+        finally:
+            await self.stop_pair()
+
+    @tornado.testing.gen_test
+    async def test_auth_failure_is_counted_and_retried(self):
+        self.redis = FakeRedis(password="secret")
+        await self.redis.start()
+        node = pubsub.RedisBackend(f"redis://:wrong@127.0.0.1:{self.redis.port}", retry_interval=0.05)
+        node.start(lambda data: None)
+        try:
+            await wait_for(lambda: node.stats["reconnects"] >= 2)
+            self.assertIn("AUTH failed", node.stats["last_error"])
+            self.assertIsNone(node._pub)
+            node.publish("general", b"x")
+            self.assertEqual(node.stats["dropped"], 1)
+        finally:
+            node.close()
+            await self.redis.stop()
+
+
+class LocalSocketBackendTest(tornado.testing.AsyncTestCase):
+    @tornado.testing.gen_test
+    async def test_two_sockets_and_stale_cleanup(self):
+        directory = tempfile.mkdtemp(prefix="zzchat-pubsub-")
+        # 已退出进程留下的套接字文件：绑定后关闭，文件仍在但没有接收方
+        stale = os.path.join(directory, "stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(stale)
+        sock.close()
+        got = ([], [])
+        nodes = [pubsub.LocalSocketBackend(directory, refresh_interval=0) for _ in range(2)]
+        for node, received in zip(nodes, got):
+            node.start(received.append)
+        try:
+            nodes[0].publish("general", b"one")
+            nodes[1].publish("general", b"two")
+            await wait_for(lambda: got == ([b"two"], [b"one"]))
+            self.assertFalse(os.path.exists(stale))
+        finally:
+            paths = [node.path for node in nodes]
+            for node in nodes:
+                node.close()
+        self.assertFalse(any(os.path.exists(p) for p in paths))
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+import ratelimit
+from ratelimit import KeyedLimiter, TokenBucket, parse_rate
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(ratelimit, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(2, 3)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.0, None])
+        self.clock.now += 0.5
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertIsNone(bucket.reserve())
+        # 补充不会超过突发上限
+        self.clock.now += 100
+        self.assertEqual(bucket.tokens, 0)
+        bucket.reserve()
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_reserve_with_wait_borrows_and_refund_returns(self):
+        bucket = TokenBucket(2, 1)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(1.0), 0.5)
+        self.assertEqual(bucket.tokens, -1)
+        # 已预扣一个令牌，下一个要等 1 秒，超过允许的等待
+        self.assertIsNone(bucket.reserve(0.5))
+        bucket.refund()
+        self.assertEqual(bucket.tokens, 0)
+
+    def test_keyed_limiter_bounds_bucket_count(self):
+        limiter = KeyedLimiter(1, 1, max_keys=2)
+        a = limiter.bucket("a")
+        limiter.bucket("b")
+        self.assertIs(limiter.bucket("a"), a)
+        limiter.bucket("c")
+        self.assertEqual(list(limiter._buckets), ["a", "c"])
+        self.assertFalse(KeyedLimiter(0, 1).enabled)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("5/10", "1"), (5.0, 10.0))
+        self.assertEqual(parse_rate("0.2", "1"), (0.2, 1.0))
+        self.assertEqual(parse_rate(None, "3"), (3.0, 3.0))
+
+
+class FloodControlTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    @tornado.testing.gen_test
+    async def test_connection_bucket_drops_excess_and_notifies_once(self):
+        dropped = app.RATE_STATS["dropped_connection"]
+        with mock.patch.dict(app.RATE, {"connection": (0.001, 2), "max_delay": 0}):
+            conn = await websocket_connect(f"ws://127.0.0.1:{self.get_http_port()}/ws?room=flood&nick=spammer")
+            await conn.read_message()
+            for i in range(4):
+                conn.write_message(json.dumps({"content": f"m{i}"}))
+            frames = [json.loads(await conn.read_message()) for _ in range(3)]
+        self.assertEqual([f["content"] for f in frames[:2]], ["m0", "m1"])
+        self.assertEqual(frames[2]["type"], "system")
+        self.assertEqual(app.RATE_STATS["dropped_connection"], dropped + 2)
+        # 第二次丢弃在一秒内，不再重复提示
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(conn.read_message(), 0.1)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
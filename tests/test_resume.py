@@ -0,0 +1,77 @@
+import asyncio
+import json
+from unittest import mock
+
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+import db
+import storage
+
+
+class ResumeTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    def ws_url(self, room, nick, since=None):
+        url = f"ws://127.0.0.1:{self.get_http_port()}/ws?room={room}&nick={nick}"
+        return url + (f"&since_id={since}" if since is not None else "")
+
+    async def read_until(self, conn, kind):
+        while True:
+            msg = await conn.read_message()
+            if msg is None:
+                return None
+            data = json.loads(msg)
+            if data.get("type") == kind:
+                return data
+
+    @tornado.testing.gen_test
+    async def test_replays_missed_messages_by_seq(self):
+        conn = await websocket_connect(self.ws_url("resume-replay", "a"))
+        for i in range(3):
+            conn.write_message(json.dumps({"type": "message", "content": f"m{i}"}))
+            msg = await self.read_until(conn, "message")
+            self.assertEqual(msg["seq"], i + 1)
+        conn.close()
+        conn = await websocket_connect(self.ws_url("resume-replay", "a", since=1))
+        backlog = await self.read_until(conn, "backlog")
+        self.assertEqual(backlog["since"], 1)
+        self.assertEqual([item["content"] for item in backlog["content"]], ["m1", "m2"])
+        conn.close()
+
+    @tornado.testing.gen_test
+    async def test_failed_warm_up_closes_with_1011(self):
+        db.save_messages([("resume-fail", "a", "message", "old", 1, 7)])
+
+        async def broken(*args, **kwargs):
+            raise RuntimeError("database unavailable")
+
+        with mock.patch.object(storage, "fetch_history_page", broken):
+            conn = await websocket_connect(self.ws_url("resume-fail", "a"))
+            self.assertIsNone(await conn.read_message())
+            self.assertEqual(conn.close_code, 1011)
+        room_obj = app.ROOMS.get("resume-fail")
+        self.assertFalse(room_obj["clients"])
+        self.assertEqual(room_obj["seq"], 0)
+        # 下一个连接重新预热，序号从数据库接上
+        conn = await websocket_connect(self.ws_url("resume-fail", "a"))
+        backlog = await self.read_until(conn, "backlog")
+        self.assertEqual(backlog["seq"], 7)
+        conn.close()
+
+    @tornado.testing.gen_test
+    async def test_clear_during_warm_up_keeps_seq(self):
+        db.save_messages([("resume-clear", "a", "message", "old", 1, 42)])
+        room_obj = app.ROOMS.acquire("resume-clear")
+        self.addCleanup(app.ROOMS.release, room_obj)
+        room_obj["warming"] = asyncio.get_running_loop().create_future()
+        response = await self.http_client.fetch(self.get_url("/api/clear_history"), method="POST",
+                                                body=json.dumps({"room": "resume-clear"}))
+        self.assertEqual(json.loads(response.body)["code"], 0)
+        self.assertTrue(room_obj["warm"])
+        self.assertEqual(room_obj["seq"], 42)
+        payload = {"type": "message", "sender": "a", "content": "new", "ts": 2}
+        app.publish_room("resume-clear", payload)
+        self.assertEqual(payload["seq"], 43)
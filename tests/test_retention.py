@@ -0,0 +1,90 @@
+import json
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import tornado.testing
+
+import app
+import db
+from retention import Archive, RetentionManager
+from settings import CONFIG
+
+DAY = 86400 * 1000
+
+
+class RetentionTest(tornado.testing.AsyncTestCase):
+    def manager(self, section):
+        manager = RetentionManager(interval=0, chunk=2, pause=0)
+        manager.archive = Archive(tempfile.mkdtemp(prefix="zzchat-archive-"))
+        patcher = mock.patch.object(CONFIG, "section", return_value=section)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return manager
+
+    def contents(self, room):
+        items, _ = db.fetch_history_page(room, 100)
+        return [it["content"] for it in reversed(items)]
+
+    def test_room_override_wins_over_section_defaults(self):
+        manager = self.manager({"max_rows": 10, "rooms": {"vip": {"max_rows": 0, "archive": False}}})
+        self.assertEqual(manager.policy("general")["max_rows"], 10)
+        self.assertEqual(manager.policy("vip"), {"max_age_days": 0.0, "max_rows": 0, "archive": False})
+
+    @tornado.testing.gen_test
+    async def test_max_rows_purges_oldest_in_chunks_and_archives_them(self):
+        db.save_messages([("retain-rows", "a", "message", f"m{i}", 1000 + i) for i in range(7)])
+        manager = self.manager({"max_rows": 2})
+        self.assertEqual(await manager.purge_room("retain-rows"), 5)
+        self.assertEqual(self.contents("retain-rows"), ["m5", "m6"])
+        self.assertEqual(manager.stats["chunks"], 3)
+        self.assertEqual(manager.stats["archived"], 5)
+        archived = manager.archive.read_before("retain-rows", 10)
+        self.assertEqual([it["content"] for it in archived], ["m4", "m3", "m2", "m1", "m0"])
+        # 再次运行没有可清理的行
+        self.assertEqual(await manager.purge_room("retain-rows"), 0)
+
+    @tornado.testing.gen_test
+    async def test_max_age_without_archive(self):
+        now = int(time.time() * 1000)
+        db.save_messages([("retain-age", "a", "message", "old", now - 3 * DAY),
+                          ("retain-age", "a", "message", "new", now)])
+        manager = self.manager({"max_age_days": 1, "archive": False})
+        self.assertEqual(await manager.purge_room("retain-age"), 1)
+        self.assertEqual(self.contents("retain-age"), ["new"])
+        self.assertEqual(manager.archive.segments("retain-age"), [])
+
+
+class ArchiveReadBeforeTest(unittest.TestCase):
+    def test_pages_across_day_segments(self):
+        archive = Archive(tempfile.mkdtemp(prefix="zzchat-archive-"))
+        rows = [{"id": i, "room": "r", "sender": "a", "type": "message", "content": f"m{i}",
+                 "ts": (i // 2) * DAY + i, "seq": i} for i in range(1, 7)]
+        archive.append(rows)
+        self.assertEqual(len(archive.segments("r")), 4)
+        page = archive.read_before("r", 3)
+        self.assertEqual([it["id"] for it in page], [6, 5, 4])
+        page = archive.read_before("r", 3, page[-1]["ts"], page[-1]["id"])
+        self.assertEqual([it["id"] for it in page], [3, 2, 1])
+
+
+class HistoryIntoArchiveTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    def test_history_continues_into_archive(self):
+        db.save_messages([("retain-history", "a", "message", f"m{i}", 1000 + i) for i in range(5)])
+        archive = Archive(tempfile.mkdtemp(prefix="zzchat-archive-"))
+        manager = RetentionManager(interval=0, chunk=10, pause=0)
+        manager.archive = archive
+        with mock.patch.object(CONFIG, "section", return_value={"max_rows": 2}):
+            self.io_loop.run_sync(lambda: manager.purge_room("retain-history"))
+        with mock.patch.object(app.RETENTION, "archive", archive):
+            first = json.loads(self.fetch("/history?room=retain-history&limit=3").body)
+            self.assertEqual([it["content"] for it in first["items"]], ["m4", "m3", "m2"])
+            cursor = first["next_cursor"]
+            second = json.loads(self.fetch(
+                f"/history?room=retain-history&limit=3&before_ts={cursor['before_ts']}&before_id={cursor['before_id']}").body)
+        self.assertEqual([it["content"] for it in second["items"]], ["m1", "m0"])
+        self.assertIsNone(second["next_cursor"])
@@ -0,0 +1,56 @@
+import unittest
+
+from rooms import RoomLimitError, RoomManager
+
+
+class RoomManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.pending = set()
+        self.rooms = RoomManager(10, max_rooms=2, max_clients=2, idle_grace=0, pending_rooms=lambda: self.pending)
+
+    def open_and_leave(self, room_id):
+        client = object()
+        room_obj = self.rooms.acquire(room_id)
+        self.rooms.join(room_obj, client)
+        self.rooms.leave(room_id, client)
+        return room_obj
+
+    def test_idle_room_is_swept(self):
+        self.open_and_leave("a")
+        self.rooms.sweep()
+        self.assertNotIn("a", self.rooms)
+        self.assertEqual(self.rooms.stats["evicted"], 1)
+
+    def test_room_with_unwritten_rows_is_kept(self):
+        room_obj = self.open_and_leave("a")
+        room_obj["seq"] = 5
+        self.pending.add("a")
+        self.rooms.sweep()
+        self.assertIs(self.rooms.get("a"), room_obj)
+        self.assertEqual(self.rooms.stats["evict_deferred"], 1)
+        # 房间数到上限时也不能回收它
+        self.open_and_leave("b")
+        self.rooms.acquire("c")
+        self.assertIn("a", self.rooms)
+        self.assertNotIn("b", self.rooms)
+        self.pending.clear()
+        self.rooms.sweep()
+        self.assertNotIn("a", self.rooms)
+
+    def test_limits(self):
+        first = self.rooms.acquire("a")
+        self.rooms.acquire("a")
+        with self.assertRaises(RoomLimitError):
+            self.rooms.acquire("a")
+        self.rooms.release(first)
+        self.rooms.acquire("b")
+        with self.assertRaises(RoomLimitError):
+            self.rooms.acquire("c")
+        with self.assertRaises(RoomLimitError):
+            self.rooms.acquire("x" * 65)
+        self.assertEqual(self.rooms.stats["rejected_rooms"], 2)
+        self.assertEqual(self.rooms.stats["rejected_clients"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+import db
+
+
+class SearchRoomFilterTest(unittest.TestCase):
+    def test_matches_are_limited_to_room(self):
+        db.save_messages([
+            ("search-a", "u", "message", "你好世界 hello", 1),
+            ("search-b", "u", "message", "你好世界 hello", 2),
+            ("search-a", "u", "message", "unrelated", 3),
+        ])
+        for room in ("search-a", "search-b"):
+            items, cursor = db.search_messages(room, "世界 hel")
+            self.assertEqual([item["room"] for item in items], [room])
+            self.assertIsNone(cursor)
+        self.assertEqual(db.search_messages("search-c", "hello"), ([], None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import settings
+
+SECRETS = {
+    "siliconflow_api_key": "sk-secret-siliconflow",
+    "siliconflow_base_url": "https://upstream.internal/v1/",
+    "servers": [
+        {"name": "本地", "ws_url": "ws://127.0.0.1:8891/ws", "token": "server-token-secret"},
+    ],
+    "plugins": {"weather": {"api_key": "weather-secret", "url": "https://weather.internal/api"}},
+    "ratelimit": {"connection": "5/10"},
+    "retention": {"max_rows": 1000},
+}
+
+
+class ConfigResponseTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(SECRETS, f)
+        patcher = mock.patch.dict(os.environ, {"ZZCHAT_CONFIG": self.path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(os.remove, self.path)
+        self.config = settings.ConfigService()
+        self.config.reload(force=True)
+
+    def test_only_servers_are_public(self):
+        body, etag = self.config.config_response("https", "chat.example.com")
+        data = json.loads(body)
+        self.assertEqual(list(data), ["servers"])
+        self.assertEqual(data["servers"], [
+            {"name": "当前访问域", "ws_url": "wss://chat.example.com/ws"},
+            {"name": "本地", "ws_url": "ws://127.0.0.1:8891/ws"},
+        ])
+        text = body.decode("utf-8")
+        for secret in ("sk-secret-siliconflow", "upstream.internal", "server-token-secret",
+                       "weather-secret", "weather.internal", "ratelimit", "retention"):
+            self.assertNotIn(secret, text)
+        self.assertTrue(etag.startswith('"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import asyncio
+import sqlite3
+import threading
+
+import tornado.testing
+
+import db
+import storage
+
+
+class StorageTest(tornado.testing.AsyncTestCase):
+    def test_wal_and_read_only_readers(self):
+        self.assertEqual(db._get_conn().execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        with self.assertRaises(sqlite3.OperationalError):
+            db._read_conn().execute("DELETE FROM messages")
+
+    @tornado.testing.gen_test
+    async def test_reads_do_not_wait_for_the_write_lock(self):
+        await storage.save_messages([("storage-lock", "a", "message", "x", 1)])
+        # 写连接被长事务占住时，读取走各自的只读连接照常返回
+        released = threading.Event()
+        holding = threading.Event()
+
+        def hold():
+            with db._lock:
+                holding.set()
+                released.wait(5)
+
+        blocker = asyncio.get_running_loop().run_in_executor(None, hold)
+        await asyncio.get_running_loop().run_in_executor(None, holding.wait, 5)
+        try:
+            items, _ = await asyncio.wait_for(storage.fetch_history_page("storage-lock"), 2)
+            self.assertEqual([it["content"] for it in items], ["x"])
+        finally:
+            released.set()
+            await blocker
+
+    @tornado.testing.gen_test
+    async def test_writes_run_in_submission_order(self):
+        saves = [storage.save_messages([("storage-order", "a", "message", f"m{i}", i)]) for i in range(5)]
+        cleared = storage.clear_history("storage-order")
+        later = storage.save_messages([("storage-order", "a", "message", "after", 10)])
+        await asyncio.gather(*saves, cleared, later)
+        items, _ = await storage.fetch_history_page("storage-order")
+        self.assertEqual([it["content"] for it in items], ["after"])
+
+    @tornado.testing.gen_test
+    async def test_keyset_pages_do_not_skip_rows_sharing_a_timestamp(self):
+        await storage.save_messages([("storage-keyset", "a", "message", f"m{i}", i // 3) for i in range(8)])
+        seen, cursor = [], {}
+        while True:
+            items, cursor = await storage.fetch_history_page("storage-keyset", 3, **(cursor or {}))
+            seen += [it["content"] for it in items]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"m{i}" for i in reversed(range(8))])
+        # 反向翻页（旧→新）从最早一条之后接上
+        first = (await storage.fetch_history_page("storage-keyset", 1, after_ts=-1))[0][0]
+        items, cursor = await storage.fetch_history_page("storage-keyset", 4, after_ts=first["ts"], after_id=first["id"])
+        self.assertEqual([it["content"] for it in items], ["m1", "m2", "m3", "m4"])
+        self.assertEqual(cursor, {"after_ts": items[-1]["ts"], "after_id": items[-1]["id"]})
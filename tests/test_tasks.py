@@ -0,0 +1,86 @@
+import asyncio
+import json
+from unittest import mock
+
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+import db
+import plugins
+from tasks import PluginScheduler
+
+
+class PluginSchedulerTest(tornado.testing.AsyncTestCase):
+    @tornado.testing.gen_test
+    async def test_permits_survive_timeouts_and_cancels(self):
+        scheduler = PluginScheduler(default_timeout=0.05, default_concurrency=1)
+        errors = []
+        owner = object()
+        # 占住唯一的许可直到超时；排队的任务在等待中超时
+        scheduler.submit(owner, "slow", lambda: asyncio.sleep(1), errors.append)
+        queued = scheduler.submit(object(), "slow", lambda: asyncio.sleep(0), errors.append)
+        await asyncio.sleep(0.01)
+        self.assertEqual(scheduler.stats["running"], 1)
+        await queued
+        await asyncio.sleep(0.1)
+        self.assertEqual(sorted(errors), ["timeout", "timeout"])
+        # 刚拿到许可就被取消
+        other = object()
+        scheduler.submit(other, "slow", lambda: asyncio.sleep(1), errors.append)
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.cancel_owner(other), 1)
+        await asyncio.sleep(0.01)
+        self.assertEqual(errors[-1], "cancelled")
+        sem = scheduler._semaphore("slow")
+        self.assertFalse(sem.locked())
+        self.assertEqual(scheduler._active["slow"], 0)
+        self.assertEqual(scheduler.stats["running"], 0)
+        done = []
+        await scheduler.submit(object(), "slow", lambda: asyncio.sleep(0), done.append)
+        self.assertEqual((done, scheduler.stats["completed"]), ([], 1))
+
+    @tornado.testing.gen_test
+    async def test_rejects_when_queue_is_full(self):
+        scheduler = PluginScheduler(default_timeout=1, default_concurrency=1, max_waiting=1)
+        # 并发 1 + 排队 1，第三个立即拒绝
+        errors = []
+        release = asyncio.Event()
+        tasks = [scheduler.submit(object(), "p", release.wait, errors.append) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(errors, ["busy"])
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(scheduler.stats["completed"], 2)
+
+
+class PluginCancelTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    @tornado.testing.gen_test
+    async def test_requester_disconnect_is_not_persisted(self):
+        async def slow(ws):
+            await asyncio.sleep(5)
+
+        url = f"ws://127.0.0.1:{self.get_http_port()}/ws?room=plugin-cancel&nick="
+        watcher = await websocket_connect(url + "b")
+        with mock.patch.object(plugins.get("music"), "_func", slow):
+            conn = await websocket_connect(url + "a")
+            conn.write_message(json.dumps({"type": "message", "content": "🎵音乐"}))
+            while True:
+                data = json.loads(await watcher.read_message())
+                if data.get("type") == "pending":
+                    break
+            conn.close()
+            while True:
+                data = json.loads(await watcher.read_message())
+                if data.get("replaces"):
+                    break
+        self.assertEqual(data["type"], "system")
+        self.assertIn("取消", data["content"])
+        self.assertNotIn("seq", data)
+        watcher.close()
+        await app.WRITER._flush()
+        items, _ = db.fetch_history_page("plugin-cancel", 50)
+        self.assertFalse([item for item in items if "取消" in item["content"]])
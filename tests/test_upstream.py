@@ -0,0 +1,44 @@
+import asyncio
+
+import tornado.testing
+import tornado.web
+from tornado.simple_httpclient import HTTPTimeoutError
+
+from upstream import UpstreamPool
+
+
+class Slow(tornado.web.RequestHandler):
+    async def get(self):
+        await asyncio.sleep(float(self.get_argument("delay", "0")))
+        self.write("ok")
+
+
+class UpstreamPoolTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/slow", Slow)])
+
+    @tornado.testing.gen_test
+    async def test_waiting_for_a_busy_host_is_bounded(self):
+        pool = UpstreamPool("test", max_per_host=1, queue_timeout=0.05)
+        hung = asyncio.ensure_future(pool.fetch(self.get_url("/slow?delay=0.3")))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(HTTPTimeoutError):
+            await pool.fetch(self.get_url("/slow"))
+        self.assertEqual((await hung).body, b"ok")
+        state = pool.snapshot()["hosts"][f"127.0.0.1:{self.get_http_port()}"]
+        self.assertEqual((state["queue_timeouts"], state["errors"], state["waiting"], state["inflight"]), (1, 1, 0, 0))
+        self.assertEqual((await pool.fetch(self.get_url("/slow"))).body, b"ok")
+
+    @tornado.testing.gen_test
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        pool = UpstreamPool("test", max_per_host=1, queue_timeout=5)
+        first = asyncio.ensure_future(pool.fetch(self.get_url("/slow?delay=0.1")))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(pool.fetch(self.get_url("/slow")))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await first
+        sem = pool._host(f"127.0.0.1:{self.get_http_port()}")["semaphore"]
+        await asyncio.sleep(0.01)
+        self.assertFalse(sem.locked())
+        self.assertEqual(sem._value, 1)
@@ -0,0 +1,95 @@
+import json
+import os
+import re
+import unittest
+from unittest import mock
+
+import tornado.testing
+from tornado.websocket import websocket_connect
+
+import app
+import wire
+
+
+class WireCodecTest(unittest.TestCase):
+    def roundtrip(self, payload):
+        self.assertEqual(wire.unpack(wire.pack(payload)), payload)
+        # 未安装 msgpack 时使用的纯 Python 实现同样能往返
+        with mock.patch.object(wire, "msgpack", None):
+            self.assertEqual(wire.unpack(wire.pack(payload)), payload)
+
+    def test_fields_and_type_become_small_ints(self):
+        self.assertEqual(wire.pack({"type": "message"}), b"\x81\x00\x00")
+        self.assertEqual(wire._unpackb(wire.pack({"type": "presence", "count": 2})), {0: 4, 12: 2})
+        # 表外的键和类型原样保留
+        self.assertEqual(wire._unpackb(wire.pack({"type": "custom", "extra": 1})), {0: "custom", "extra": 1})
+
+    def test_roundtrip_values(self):
+        self.roundtrip({"type": "message", "sender": "小明", "content": "你好 👋", "ts": 1700000000000, "seq": 42, "id": None})
+        self.roundtrip({"type": "weather_card", "content": {"city": "北京", "temp_range": "1~9℃", "humidity": 0.35}})
+        self.roundtrip({"type": "backlog", "truncated": False, "content": [{"sender": f"u{i}", "seq": i} for i in range(20)]})
+        self.roundtrip({"ints": [0, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -2 ** 31, -2 ** 63]})
+        self.roundtrip({"content": "x" * 40, "title": "y" * 300, "desc": "z" * 70000, "flag": True})
+        self.roundtrip({f"k{i}": i for i in range(20)})
+
+    def test_malformed_input_is_rejected(self):
+        # 内置的纯 Python 解码器：截断、多余字节、嵌套过深和未知类型都报 ValueError
+        data = wire.pack({"type": "message", "content": "hello"})
+        with mock.patch.object(wire, "msgpack", None):
+            for bad in (data[:-1], data + b"\x00", b"\x91" * 40 + b"\x00", b"\xc1"):
+                with self.assertRaises(ValueError):
+                    wire.unpack(bad)
+
+    def test_js_tables_match(self):
+        path = os.path.join(os.path.dirname(wire.__file__), "static", "js", "wire.js")
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        for name, table in (("FIELDS", wire.FIELDS), ("TYPES", wire.TYPES)):
+            body = re.search(r"var %s = \[(.*?)\];" % name, source, re.S).group(1)
+            self.assertEqual(re.findall(r"'([^']+)'", body), table)
+
+
+class SubprotocolTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return app.make_app(debug=False)
+
+    def url(self, nick):
+        return f"ws://127.0.0.1:{self.get_http_port()}/ws?room=wire-mixed&nick={nick}"
+
+    @tornado.testing.gen_test
+    async def test_binary_and_json_clients_share_a_room(self):
+        binary = await websocket_connect(self.url("bin"), subprotocols=[wire.SUBPROTOCOL])
+        self.assertEqual(binary.selected_subprotocol, wire.SUBPROTOCOL)
+        roster = await binary.read_message()
+        self.assertIsInstance(roster, bytes)
+        self.assertEqual(wire.unpack(roster)["type"], "presence")
+        text = await websocket_connect(self.url("txt"))
+        self.assertIsNone(text.selected_subprotocol)
+        self.assertEqual(json.loads(await text.read_message())["type"], "presence")
+
+        binary.write_message(wire.pack({"content": "来自二进制"}), binary=True)
+        received = {}
+        for name, conn in (("bin", binary), ("txt", text)):
+            while name not in received:
+                msg = await conn.read_message()
+                data = wire.unpack(msg) if isinstance(msg, bytes) else json.loads(msg)
+                if data["type"] == "message":
+                    received[name] = (type(msg), data)
+        self.assertEqual(received["bin"][0], bytes)
+        self.assertEqual(received["txt"][0], str)
+        self.assertEqual(received["bin"][1], received["txt"][1])
+        self.assertEqual(received["txt"][1]["sender"], "bin")
+        binary.close()
+        text.close()
+
+    @tornado.testing.gen_test
+    async def test_disabled_subprotocol_falls_back_to_json(self):
+        with mock.patch.object(app, "WS_MSGPACK", False):
+            conn = await websocket_connect(self.url("off"), subprotocols=[wire.SUBPROTOCOL])
+        self.assertIsNone(conn.selected_subprotocol)
+        self.assertIsInstance(await conn.read_message(), str)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
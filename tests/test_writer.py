@@ -0,0 +1,34 @@
+import sqlite3
+from unittest import mock
+
+import tornado.gen
+import tornado.testing
+
+import storage
+import writer
+
+
+class MessageWriterTest(tornado.testing.AsyncTestCase):
+    @tornado.testing.gen_test
+    async def test_failed_batch_stays_pending_until_written(self):
+        calls = []
+        real_save = storage.save_messages
+
+        async def flaky_save(rows):
+            calls.append(len(rows))
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return await real_save(rows)
+
+        w = writer.MessageWriter(batch_size=10, flush_interval=0.001)
+        with mock.patch.object(storage, "save_messages", flaky_save):
+            item = {"id": None}
+            w.put("writer-room", "a", "message", "x", 1, seq=1, item=item)
+            await w._flush()
+            self.assertEqual(w.stats["retries"], 1)
+            self.assertEqual(w.pending_rooms(), {"writer-room"})
+            while w.pending_rooms():
+                await tornado.gen.sleep(0.05)
+        self.assertEqual(calls, [1, 1])
+        self.assertEqual(w.stats["written"], 1)
+        self.assertIsNotNone(item["id"])